@@ -1,4 +1,4 @@
-#!/bin/bash 
+#!/bin/bash
 
 # Project
 
@@ -13,10 +13,34 @@
 #SBATCH --cpus-per-task 8
 #SBATCH --mem-per-cpu 16G
 
+# Get USR1 ten minutes before the time limit to save the build and requeue it
+#SBATCH --signal=B:USR1@600
+#SBATCH --requeue
+#SBATCH --open-mode=append
+
 echo "Running the cluster/remote build script"
 
 WORKING_DIR=<FINN_WORKDIR>
 
+# FINN checkout to build with. doit finncompare builds with checkouts of other commits
+FINN_DIR=${FINN_CHECKOUT:-$WORKING_DIR/finn}
+
+# Sweeps are submitted as job arrays and pass a file with one project directory per line
+if [ -n "$SLURM_ARRAY_TASK_ID" ] && [ -f "$1" ]; then
+  set -- "$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "$1")"
+  echo "Array task $SLURM_ARRAY_TASK_ID builds $1"
+fi
+
+# doit worker start runs a long-lived worker container on this host. Builds are handed to it if it is up
+WORKER_DIR=<WORKER_DIR>
+WORKER=$WORKING_DIR/build_scripts/finn_worker.py
+USE_WORKER=false
+if [ "$1" != "--worker" ] && python3 $WORKER status $WORKER_DIR > /dev/null 2>&1; then
+  echo "Handing the build to the worker of $(hostname)"
+  USE_WORKER=true
+fi
+
+# Path of the project relative to the working directory
 model_dir=$1
 model_dir=${model_dir##*"$WORKING_DIR"}
 
@@ -38,26 +62,169 @@ mkdir -p $WORKING_DIR/SINGULARITY_CACHE
 mkdir -p $WORKING_DIR/SINGULARITY_TMP
 mkdir -p $WORKING_DIR/FINN_TMP
 
-if [ -d "/dev/shm" ]; then
-  echo "Copying file to ramdisk"
-  cp -r $WORKING_DIR /dev/shm/temporary_finn_dir
-  WORKING_DIR=/dev/shm/temporary_finn_dir
+# Used by the build script to key its step cache
+export FINN_COMMIT=$(git -C $FINN_DIR rev-parse HEAD 2>/dev/null)
+
+# Stage only the FINN checkout, the project and the FINN_TMP entries its checkpoint needs into the ramdisk.
+# The ramdisk directory has the same path on every node, so that models built in its FINN_TMP stay usable for later
+# ramdisk builds once their entries are copied in again. Only one job per user and node can own it (flock), the others
+# build on the normal filesystem. It is removed when the job ends
+# -H keeps files that doit dedup hard linked to the same blob linked, instead of copying them once per link
+HOST_DIR=$WORKING_DIR
+RAMDISK_ENABLED=<RAMDISK_ENABLED>
+RAMDISK_DIR=<RAMDISK_DIR>
+RAMDISK_HEADROOM_GB=<RAMDISK_HEADROOM_GB>
+RAMDISK_SYNC_INTERVAL=<RAMDISK_SYNC_INTERVAL>
+STAGED=false
+
+remove_ramdisk() {
+  rm -rf "$RAMDISK_DIR"
+}
+
+stage_in() {
+  if [ "$RAMDISK_ENABLED" != "true" ] || [ ! -d "$(dirname $RAMDISK_DIR)" ] || ! command -v rsync &> /dev/null; then
+    return 1
+  fi
+  if [ "$HOST_DIR$model_dir" != "$1" ]; then
+    echo "Project $1 is not inside $HOST_DIR, not using the ramdisk"
+    return 1
+  fi
+
+  # Held until this script and everything it started ended
+  exec 9> "$RAMDISK_DIR.lock"
+  if ! flock -n 9; then
+    echo "Another job of $USER uses the ramdisk of this node. Building on the normal filesystem"
+    exec 9>&-
+    return 1
+  fi
+  # Left over by a job that was killed before it could clean up
+  remove_ramdisk
+  trap remove_ramdisk EXIT
+
+  refs_file="$HOST_DIR$model_dir/out_dir/checkpoint_refs.txt"
+  staged_paths=("$FINN_DIR/" "$HOST_DIR$model_dir")
+  if [ -f "$refs_file" ]; then
+    while read -r ref; do
+      [ -e "$HOST_DIR/FINN_TMP/$ref" ] && staged_paths+=("$HOST_DIR/FINN_TMP/$ref")
+    done < "$refs_file"
+  fi
+  needed=$(du -sbc "${staged_paths[@]}" 2> /dev/null | tail -n 1 | cut -f 1)
+  needed=$((needed + RAMDISK_HEADROOM_GB * 1024 * 1024 * 1024))
+  available=$(df --output=avail -B1 "$(dirname $RAMDISK_DIR)" | tail -n 1)
+  if [ "$needed" -gt "$available" ]; then
+    echo "Ramdisk too small ($((available / 1024 / 1024 / 1024)) GB free, $((needed / 1024 / 1024 / 1024)) GB needed). Building on the normal filesystem"
+    return 1
+  fi
+
+  echo "Staging FINN and $model_dir into $RAMDISK_DIR"
+  mkdir -p $RAMDISK_DIR/SINGULARITY_CACHE $RAMDISK_DIR/SINGULARITY_TMP $RAMDISK_DIR/FINN_TMP "$RAMDISK_DIR$model_dir"
+  # The trailing slash makes rsync follow finn if it is a symlink to a checkout
+  RAMDISK_FINN_DIR=$RAMDISK_DIR/$(basename "$(realpath $FINN_DIR)")
+  rsync -a $FINN_DIR/ $RAMDISK_FINN_DIR/ || return 1
+  rsync -aH "$HOST_DIR$model_dir/" "$RAMDISK_DIR$model_dir/" || return 1
+  if [ -f "$refs_file" ]; then
+    rsync -aH -r --files-from="$refs_file" $HOST_DIR/FINN_TMP/ $RAMDISK_DIR/FINN_TMP/ 2> /dev/null
+  fi
   echo "Done."
+  return 0
+}
+
+# Write back only new or changed files. The ramdisk belongs to this job, so everything in its FINN_TMP is from this build
+sync_back() {
+  if [ "$STAGED" = "true" ]; then
+    rsync -aH "$RAMDISK_DIR$model_dir/" "$HOST_DIR$model_dir/"
+    rsync -aH $RAMDISK_DIR/FINN_TMP/ $HOST_DIR/FINN_TMP/
+  fi
+}
+
+periodic_sync() {
+  while sleep $RAMDISK_SYNC_INTERVAL; do
+    sync_back
+  done
+}
+
+# The worker builds on the normal filesystem
+if [ "$USE_WORKER" != "true" ] && [ "$1" != "--worker" ] && stage_in "$1"; then
+  STAGED=true
+  WORKING_DIR=$RAMDISK_DIR
+  FINN_DIR=$RAMDISK_FINN_DIR
+  set -- "$RAMDISK_DIR$model_dir"
 fi
 
 
 <SET_ENVVARS>
 
+if [ "$STAGED" = "true" ]; then
+  # The step cache and the FIFO depth cache stay on the normal filesystem, where every job finds them. The FINN_TMP entries
+  # of a cache entry are copied into the ramdisk by the build when it uses the entry
+  export FINN_STEP_CACHE_DIR=${FINN_STEP_CACHE_DIR/#$RAMDISK_DIR/$HOST_DIR}
+  export FINN_STAGE_FROM_DIR=$HOST_DIR/FINN_TMP
+  export FINN_DOCKER_EXTRA="$FINN_DOCKER_EXTRA -v $HOST_DIR/FINN_TMP:$HOST_DIR/FINN_TMP "
+  if [ -n "$FINN_STEP_CACHE_DIR" ] && [ "${FINN_STEP_CACHE_DIR#$HOST_DIR/FINN_TMP/}" = "$FINN_STEP_CACHE_DIR" ]; then
+    mkdir -p $FINN_STEP_CACHE_DIR
+    export FINN_DOCKER_EXTRA="$FINN_DOCKER_EXTRA -v $FINN_STEP_CACHE_DIR:$FINN_STEP_CACHE_DIR "
+  fi
+fi
 
-cd $WORKING_DIR/finn
-./run-docker.sh build_custom $1
+# FINN runs NUM_DEFAULT_WORKERS parallel processes (HLS synthesis, Vivado and Vitis jobs). Match it to the allocation
+if [ -n "$SLURM_CPUS_PER_TASK" ]; then
+  export NUM_DEFAULT_WORKERS=$SLURM_CPUS_PER_TASK
+  export OMP_NUM_THREADS=$SLURM_CPUS_PER_TASK
+fi
 
-if [ -d "/dev/shm" ]; then
-    echo "Copying files back"
-    # Copy back FINN_TMP files
-    cp -r $WORKING_DIR/FINN_TMP <FINN_WORKDIR>/FINN_TMP
+if [ "$1" = "--worker" ]; then
+  cd $FINN_DIR
+  # Docker only mounts the FINN checkout and the project of build_custom
+  export FINN_DOCKER_EXTRA="$FINN_DOCKER_EXTRA -v $WORKING_DIR:$WORKING_DIR "
+  exec ./run-docker.sh python3 $WORKER serve $WORKER_DIR "$(realpath $FINN_DIR)" $2
+fi
+
+
+# A requeued job resumes from the checkpoint of its build, not from an explicitly given step
+MAX_REQUEUES=<MAX_REQUEUES>
+if [ "${SLURM_RESTART_COUNT:-0}" -gt 0 ]; then
+  echo "Restart $SLURM_RESTART_COUNT of this job. Resuming from the last checkpoint"
+  export BUILD_FLOW_RESUME_STEP=""
+fi
 
-    # Copy back model files
-    cp -r "$WORKING_DIR""$model_dir" <FINN_WORKDIR>"$model_dir"
+requeue_on_timeout() {
+  echo "Job is about to reach its time limit. Stopping the build"
+  kill -TERM -- -$BUILD_PID 2>/dev/null
+  wait $BUILD_PID
+  kill $SYNC_PID 2> /dev/null
+  sync_back
+  if [ "${SLURM_RESTART_COUNT:-0}" -lt "$MAX_REQUEUES" ]; then
+    echo "Requeueing job $SLURM_JOB_ID"
+    scontrol requeue $SLURM_JOB_ID
+  else
+    echo "Job was already requeued $MAX_REQUEUES times. Use doit resume to continue the build"
+  fi
+  exit 0
+}
+trap requeue_on_timeout USR1
+
+# Run in the background and in its own process group, so that the trap fires immediately and can stop the whole container
+cd $FINN_DIR
+if [ "$STAGED" = "true" ]; then
+  # Without the ramdisk lock, its sleep would keep holding it after the job ended
+  periodic_sync 9>&- &
+  SYNC_PID=$!
+fi
+if [ "$USE_WORKER" = "true" ]; then
+  setsid python3 $WORKER submit $WORKER_DIR "$(realpath $FINN_DIR)" $1 &
+  BUILD_PID=$!
+  wait $BUILD_PID
+  BUILD_STATUS=$?
+fi
+# Exit code 75: The worker was gone before it started the build
+if [ "$USE_WORKER" != "true" ] || [ $BUILD_STATUS -eq 75 ]; then
+  setsid ./run-docker.sh build_custom $1 &
+  BUILD_PID=$!
+  wait $BUILD_PID
+  BUILD_STATUS=$?
+fi
 
-fi
\ No newline at end of file
+kill $SYNC_PID 2> /dev/null
+echo "Writing results back"
+sync_back
+exit $BUILD_STATUS
@@ -4,11 +4,32 @@ echo "Running the local build script"
 
 WORKING_DIR=<FINN_WORKDIR>
 
+# FINN checkout to build with. doit finncompare builds with checkouts of other commits
+FINN_DIR=${FINN_CHECKOUT:-$WORKING_DIR/finn}
+
 mkdir -p $WORKING_DIR/SINGULARITY_CACHE
 mkdir -p $WORKING_DIR/SINGULARITY_TMP
 mkdir -p $WORKING_DIR/FINN_TMP
 
+# Used by the build script to key its step cache
+export FINN_COMMIT=$(git -C $FINN_DIR rev-parse HEAD 2>/dev/null)
+
 <SET_ENVVARS>
 
-cd $WORKING_DIR/finn
+# doit worker start runs a long-lived worker container on this host. Builds are handed to it if it is up
+WORKER_DIR=<WORKER_DIR>
+WORKER=$WORKING_DIR/build_scripts/finn_worker.py
+cd $FINN_DIR
+if [ "$1" = "--worker" ]; then
+  # Docker only mounts the FINN checkout and the project of build_custom
+  export FINN_DOCKER_EXTRA="$FINN_DOCKER_EXTRA -v $WORKING_DIR:$WORKING_DIR "
+  exec ./run-docker.sh python3 $WORKER serve $WORKER_DIR "$(realpath $FINN_DIR)" $2
+fi
+python3 $WORKER submit $WORKER_DIR "$(realpath $FINN_DIR)" $1
+BUILD_STATUS=$?
+# Exit code 75: No worker is up, or it was gone before it started the build
+if [ $BUILD_STATUS -ne 75 ]; then
+  exit $BUILD_STATUS
+fi
+
 ./run-docker.sh build_custom $1
\ No newline at end of file
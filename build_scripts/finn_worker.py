@@ -0,0 +1,235 @@
+# Long-lived build worker. Runs inside one FINN container per host and builds the projects that the build scripts hand
+# to it, so that the container start and the FINN imports are paid once instead of for every build
+#   serve <spool-dir> <finn-dir> <concurrency>   Run the worker (inside the container, started by doit worker start)
+#   submit <spool-dir> <finn-dir> <project-dir>  Build the project with the worker of this host and print its log.
+#                                                Exits with NO_WORKER if there is none, so that the caller builds itself
+#   status <spool-dir>                           Print the worker info of this host as JSON, if a worker is up
+#   stop <spool-dir>                             Let the worker finish its running builds and exit
+#
+# Spool layout, one per host: worker.json (heartbeat), queue/ and running/ (requests), done/ (exit codes), logs/,
+# cancel/ (requests to abort) and stop
+
+
+import sys
+import os
+import json
+import time
+import signal
+import socket
+import runpy
+import traceback
+
+
+POLL_INTERVAL = 1
+# A worker whose heartbeat is older is considered dead
+HEARTBEAT_TIMEOUT = 30
+NO_WORKER = 75
+# Environment of the submitting build script that is passed on to the build. Everything else is the worker's
+FORWARDED_ENV_PREFIXES = ("BUILD_FLOW_", "SLURM_JOB_ID", "SLURM_ARRAY_")
+
+
+def host_spool(spool_dir: str) -> str:
+    return os.path.join(spool_dir, socket.gethostname())
+
+
+def read_json(fname: str) -> dict | None:
+    try:
+        with open(fname, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_json(fname: str, data: dict):
+    # Readers never see half written files
+    with open(fname + ".tmp", 'w+') as f:
+        json.dump(data, f)
+    os.replace(fname + ".tmp", fname)
+
+
+def worker_info(spool: str) -> dict | None:
+    info = read_json(os.path.join(spool, "worker.json"))
+    if info is None or time.time() - info["heartbeat"] > HEARTBEAT_TIMEOUT:
+        return None
+    return info
+
+
+#### * WORKER * ####
+def run_request(request: dict, log_file: str) -> int:
+    """Run build.py of the requested project in this (forked) process and return its exit code"""
+    log = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+    os.environ.update(request["env"])
+    os.chdir(request["project"])
+    sys.path.insert(0, request["project"])
+    sys.argv = [os.path.join(request["project"], "build.py")]
+    try:
+        runpy.run_path(sys.argv[0], run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if type(e.code) == int else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return code
+
+
+def serve(spool: str, finn_dir: str, concurrency: int):
+    for d in ["queue", "running", "done", "logs", "cancel"]:
+        os.makedirs(os.path.join(spool, d), exist_ok=True)
+    if os.path.isfile(os.path.join(spool, "stop")):
+        os.remove(os.path.join(spool, "stop"))
+
+    # Forked builds would otherwise inherit and write out unflushed output of the worker
+    sys.stdout.reconfigure(line_buffering=True)
+
+    # Imported once here, every build is forked from this process and starts with them loaded
+    start = time.time()
+    try:
+        import finn.builder.build_dataflow
+        import finn.builder.build_dataflow_steps
+        print(f"Preloaded FINN in {time.time() - start:.1f}s")
+    except ImportError as e:
+        print(f"WARNING: Could not preload FINN ({e}), every build imports it itself")
+
+    running: dict[int, str] = {}
+    cancelled: set[int] = set()
+
+    def finish(pid: int, code: int):
+        request_id = running.pop(pid)
+        cancelled.discard(pid)
+        write_json(os.path.join(spool, "done", request_id + ".json"), {"returncode": code, "finished": time.time()})
+        for fname in [os.path.join(spool, "running", request_id + ".json"), os.path.join(spool, "cancel", request_id)]:
+            if os.path.exists(fname):
+                os.remove(fname)
+        print(f"{time.strftime('%H:%M:%S')} Finished {request_id} with exit code {code}")
+
+    def shutdown(signum, frame):
+        raise SystemExit(128 + signum)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    info = {"host": socket.gethostname(), "pid": os.getpid(), "finn_dir": finn_dir, "concurrency": concurrency, "started": time.time()}
+    stopping = False
+    try:
+        while True:
+            write_json(os.path.join(spool, "worker.json"), {**info, "heartbeat": time.time(), "running": sorted(running.values()), "stopping": stopping})
+
+            while len(running) > 0:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                finish(pid, os.waitstatus_to_exitcode(status))
+            for pid, request_id in running.items():
+                if pid not in cancelled and os.path.exists(os.path.join(spool, "cancel", request_id)):
+                    print(f"{time.strftime('%H:%M:%S')} Cancelling {request_id}")
+                    os.killpg(pid, signal.SIGTERM)
+                    cancelled.add(pid)
+
+            stopping = stopping or os.path.isfile(os.path.join(spool, "stop"))
+            if stopping and len(running) == 0:
+                break
+
+            queued = sorted(os.listdir(os.path.join(spool, "queue")))
+            while not stopping and len(running) < concurrency and len(queued) > 0:
+                fname = queued.pop(0)
+                if not fname.endswith(".json"):
+                    continue
+                request_file = os.path.join(spool, "running", fname)
+                try:
+                    os.rename(os.path.join(spool, "queue", fname), request_file)
+                except OSError:
+                    continue
+                request = read_json(request_file)
+                request_id = fname.removesuffix(".json")
+                print(f"{time.strftime('%H:%M:%S')} Building {request['project']} ({request_id})")
+                pid = os.fork()
+                if pid == 0:
+                    # Own process group, so that cancelling also stops the Vivado and Vitis processes of the build
+                    os.setsid()
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    os._exit(run_request(request, os.path.join(spool, "logs", request_id + ".log")))
+                running[pid] = request_id
+            time.sleep(POLL_INTERVAL)
+    finally:
+        for pid in list(running.keys()):
+            os.killpg(pid, signal.SIGTERM)
+            finish(pid, os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]))
+        os.remove(os.path.join(spool, "worker.json"))
+        print("Worker stopped")
+
+
+#### * CLIENT * ####
+def submit(spool: str, finn_dir: str, project: str) -> int:
+    info = worker_info(spool)
+    if info is None or info["stopping"]:
+        return NO_WORKER
+    # The worker's container has its own FINN checkout
+    if os.path.realpath(info["finn_dir"]) != os.path.realpath(finn_dir):
+        print(f"The worker of this host builds with {info['finn_dir']}, not {finn_dir}. Building without it")
+        return NO_WORKER
+
+    request_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    env = {k: v for k, v in os.environ.items() if k.startswith(FORWARDED_ENV_PREFIXES)}
+    write_json(os.path.join(spool, "queue", request_id + ".json"), {"project": os.path.abspath(project), "env": env, "submitted": time.time()})
+    print(f"Handed the build to the worker of {info['host']} as {request_id}")
+
+    # Killing this process (doit stop, scancel, a time limit) cancels the build
+    def cancel(signum, frame):
+        if os.path.isfile(os.path.join(spool, "queue", request_id + ".json")):
+            os.remove(os.path.join(spool, "queue", request_id + ".json"))
+        else:
+            with open(os.path.join(spool, "cancel", request_id), 'w+'):
+                pass
+        sys.exit(128 + signum)
+    signal.signal(signal.SIGTERM, cancel)
+    signal.signal(signal.SIGINT, cancel)
+
+    log_file = os.path.join(spool, "logs", request_id + ".log")
+    done_file = os.path.join(spool, "done", request_id + ".json")
+    offset = 0
+    while True:
+        # Read the exit code first, so that the log is complete when it is printed for the last time
+        done = read_json(done_file)
+        if os.path.isfile(log_file):
+            with open(log_file, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+            offset += len(chunk)
+            sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
+        if done is not None:
+            for fname in [log_file, done_file]:
+                os.remove(fname)
+            return done["returncode"]
+        if worker_info(spool) is None:
+            # Not picked up yet, so it can still be built without the worker
+            if os.path.isfile(os.path.join(spool, "queue", request_id + ".json")):
+                os.remove(os.path.join(spool, "queue", request_id + ".json"))
+                print("The worker stopped before starting the build. Building without it")
+                return NO_WORKER
+            print("ERROR: The worker stopped during the build")
+            return 1
+        time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == "serve":
+        serve(host_spool(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+    elif command == "submit":
+        sys.exit(submit(host_spool(sys.argv[2]), sys.argv[3], sys.argv[4]))
+    elif command == "status":
+        info = worker_info(host_spool(sys.argv[2]))
+        if info is None:
+            sys.exit(1)
+        print(json.dumps(info))
+    elif command == "stop":
+        if os.path.isdir(host_spool(sys.argv[2])):
+            with open(os.path.join(host_spool(sys.argv[2]), "stop"), 'w+'):
+                pass
+    else:
+        print(f"Unknown command {command}")
+        sys.exit(1)
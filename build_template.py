@@ -6,10 +6,21 @@
 import sys
 import finn.builder.build_dataflow as build
 import finn.builder.build_dataflow_config as build_cfg
+import finn.builder.build_dataflow_steps as build_steps
 import os
+import re
 import shutil
+import json
+import hashlib
+import dataclasses
+import functools
+import inspect
+import subprocess
+import time
+import threading
+import socket
 from argparse import ArgumentParser
-from typing import Final, Callable
+from typing import Final, Callable, Optional
 
 DEFAULT_OUT_DIR:    Final[str]                  = "out_dir"
 DEFAULT_STEPS:      Final[list[str | Callable]] = [
@@ -38,6 +49,7 @@ DEFAULT_PLATFORM:               Final[str] = "xilinx_u280_gen3x16_xdma_1_202211_
 DEFAULT_BOARD:                  Final[str] = "U280"
 DEFAULT_MVAU_MAX_WIDTH:         Final[int] = 80
 DEFAULT_TARGET_FPS:             Final[int] = 100_000
+DEFAULT_FOLDING_CONFIG:         Final[Optional[str]] = None # Set by doit search. Overrides the folding derived from DEFAULT_TARGET_FPS
 DEFAULT_SYNTH_CLK_NS:           Final[float] = 10.0
 DEFAULT_AUTO_FIFO_DEPTH:        Final[bool] = True
 DEFAULT_SHELL_FLOW:             Final[build_cfg.ShellFlowType] = build_cfg.ShellFlowType.VITIS_ALVEO
@@ -49,6 +61,425 @@ DEFAULT_OUTPUT_GENS:            Final[list[build_cfg.DataflowOutputType]] = [
     build_cfg.DataflowOutputType.PYNQ_DRIVER,
     build_cfg.DataflowOutputType.DEPLOYMENT_PACKAGE,
 ] 
+DEFAULT_STEP_CACHE:             Final[bool] = True
+DEFAULT_FIFO_DEPTH_CACHE:       Final[bool] = True # Reuse the FIFO depths of earlier builds of the same graph and folding
+
+
+#* Step cache
+# Every step output is stored under a key that chains the hash of the input model, the FINN commit and
+# the config fields the step reads. On the next run the flow restarts after the last step whose key is
+# still cached. Steps that are not listed here (custom steps and everything from the hardware generation
+# onwards) are keyed on the complete configuration.
+STEP_CONFIG_DEPENDENCIES: Final[dict[str, list[str]]] = {
+    "step_qonnx_to_finn": [],
+    "step_tidy_up": [],
+    "step_streamline": [],
+    "step_convert_to_hw": ["standalone_thresholds"],
+    "step_specialize_layers": ["specialize_layers_config_file", "board", "fpga_part", "vitis_platform"],
+    "step_create_dataflow_partition": [],
+    "step_target_fps_parallelization": ["target_fps", "mvau_wwidth_max", "synth_clk_period_ns", "folding_two_pass_relaxation", "board", "fpga_part"],
+    "step_apply_folding_config": ["folding_config_file"],
+    "step_minimize_bit_width": ["minimize_bit_width"],
+    "step_generate_estimate_reports": ["synth_clk_period_ns", "board", "fpga_part"],
+}
+CACHE_IGNORED_FIELDS: Final[list[str]] = ["output_dir", "steps", "start_step", "stop_step", "verbose", "save_intermediate_models"]
+# The files a step writes to the output directory (reports, auto_folding_config.json, stitched_ip, the bitfile, deploy, ...)
+# are stored with its cache entry in <key>.out, since a hit in another output directory has to restore them as well
+STEP_OUTPUTS_SUFFIX:  Final[str] = ".out"
+STEP_OUTPUTS_IGNORED: Final[list[str]] = ["intermediate_models", "checkpoint.json", "checkpoint_refs.txt", "build_dataflow.log"]
+
+#* FIFO depth cache
+# The FIFO sizing of step_set_fifo_depths simulates the whole design. Its result is stored under a key made from the
+# graph entering the step (nodes, folding attributes and shapes, but not the paths into FINN_TMP), the FINN commit and
+# the config fields below. A later build with the same key applies the stored depths as folding config instead, with
+# auto_fifo_depths disabled. This also works when the step cache misses, e.g. after changing the outputs to generate
+FIFO_CONFIG_DEPENDENCIES: Final[list[str]] = [
+    "auto_fifo_strategy", "large_fifo_mem_style", "fifosim_n_inferences", "force_python_rtlsim", "folding_config_file",
+    "synth_clk_period_ns", "hls_clk_period_ns", "board", "fpga_part",
+]
+FIFO_CACHE_SUBDIR: Final[str] = "fifo_depths"
+
+# The last completed step of this project, used to resume interrupted builds (e.g. after a SLURM timeout)
+INTERMEDIATE_MODEL_DIR:   Final[str] = os.path.join(DEFAULT_OUT_DIR, "intermediate_models")
+CHECKPOINT_FILE:          Final[str] = os.path.join(DEFAULT_OUT_DIR, "checkpoint.json")
+CHECKPOINT_REFS_FILE:     Final[str] = os.path.join(DEFAULT_OUT_DIR, "checkpoint_refs.txt")
+
+# Wall time, CPU time, peak memory and output size of every executed step, read by doit report
+STEP_METRICS_FILE:        Final[str] = "step_metrics.jsonl"
+RUN_ID:                   Final[str] = time.strftime("%Y%m%d-%H%M%S") + "-" + os.environ.get("SLURM_JOB_ID", str(os.getpid()))
+
+# Printed to the job log when a step starts, read by doit progress
+PROGRESS_MARKER:          Final[str] = "finn-on-n2: step"
+
+
+def step_name(step: str | Callable) -> str:
+    return step if type(step) == str else step.__name__
+
+
+def file_hash(fname: str) -> str:
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_finn_commit() -> str:
+    # Set by the build scripts on the host, since the checkout might not be a usable git repo inside the container
+    if os.environ.get("FINN_COMMIT", "") != "":
+        return os.environ["FINN_COMMIT"]
+    try:
+        return subprocess.run(["git", "-C", os.environ.get("FINN_ROOT", "."), "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return ""
+
+
+def reuse_disabled() -> bool:
+    return os.environ.get("BUILD_FLOW_NO_CACHE", "") not in ["", "0"]
+
+
+def get_step_cache_dir(enabled: bool = DEFAULT_STEP_CACHE) -> Optional[str]:
+    if not enabled or reuse_disabled():
+        return None
+    if os.environ.get("FINN_STEP_CACHE_DIR", "") != "":
+        return os.environ["FINN_STEP_CACHE_DIR"]
+    if os.environ.get("FINN_BUILD_DIR", "") != "":
+        return os.path.join(os.environ["FINN_BUILD_DIR"], "step_cache")
+    return None
+
+
+def config_fingerprint(cfg: build_cfg.DataflowBuildConfig, fields: Optional[list[str]]) -> str:
+    if fields is None:
+        fields = [f.name for f in dataclasses.fields(cfg) if f.name not in CACHE_IGNORED_FIELDS]
+    values = {}
+    for field in fields:
+        value = getattr(cfg, field, None)
+        # Config files are keyed by content, not by path
+        if field.endswith("_file") and type(value) == str and os.path.isfile(value):
+            value = file_hash(value)
+        values[field] = repr(value)
+    return json.dumps(values, sort_keys=True)
+
+
+def compute_step_keys(model_file: str, cfg: build_cfg.DataflowBuildConfig, steps: list[str | Callable], finn_commit: str) -> list[str]:
+    keys = []
+    previous = hashlib.sha256((file_hash(model_file) + finn_commit).encode()).hexdigest()
+    for step in steps:
+        h = hashlib.sha256(previous.encode())
+        h.update(step_name(step).encode())
+        if type(step) == str:
+            h.update(config_fingerprint(cfg, STEP_CONFIG_DEPENDENCIES.get(step)).encode())
+        else:
+            try:
+                h.update(inspect.getsource(step).encode())
+            except (OSError, TypeError):
+                pass
+            h.update(config_fingerprint(cfg, None).encode())
+        previous = h.hexdigest()
+        keys.append(previous)
+    return keys
+
+
+def model_structure_hash(model) -> str:
+    """Hash of the nodes, their attributes and the tensor shapes of a model, without the paths into FINN_TMP that differ between builds"""
+    import onnx.helper
+    h = hashlib.sha256()
+    for node in model.graph.node:
+        attributes = {}
+        for attribute in node.attribute:
+            value = onnx.helper.get_attribute_value(attribute)
+            if type(value) == bytes:
+                value = value.decode(errors="replace")
+                if value.startswith("/"):
+                    continue
+            attributes[attribute.name] = repr(value)
+        h.update(json.dumps([node.op_type, node.domain, node.name, list(node.input), list(node.output), attributes], sort_keys=True).encode())
+    for tensor in list(model.graph.input) + list(model.graph.output):
+        h.update(json.dumps([tensor.name, model.get_tensor_shape(tensor.name)]).encode())
+    for initializer in model.graph.initializer:
+        h.update(json.dumps([initializer.name, list(initializer.dims), initializer.data_type]).encode())
+    return h.hexdigest()
+
+
+def fifo_log(message: str):
+    # The job log as well as FINN's build_dataflow.log, which stdout is redirected to while a step runs
+    print(message)
+    if sys.stdout is not sys.__stdout__:
+        print(message, file=sys.__stdout__, flush=True)
+
+
+def set_fifo_depths_cached(step_fn: Callable, model, cfg: build_cfg.DataflowBuildConfig):
+    """step_set_fifo_depths, with the depths of an earlier build of the same graph instead of the FIFO sizing simulation"""
+    cache_dir = get_step_cache_dir(DEFAULT_FIFO_DEPTH_CACHE)
+    if cache_dir is None or not cfg.auto_fifo_depths:
+        return step_fn(model, cfg)
+    cache_dir = os.path.join(cache_dir, FIFO_CACHE_SUBDIR)
+    key = hashlib.sha256((model_structure_hash(model) + finn_commit + config_fingerprint(cfg, FIFO_CONFIG_DEPENDENCIES)).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, key + ".json")
+
+    if os.path.isfile(cache_path):
+        fifo_log(f"FIFO depth cache: Hit ({key[:12]}). Applying the FIFO depths of an earlier build instead of simulating")
+        os.utime(cache_path)
+        return step_fn(model, dataclasses.replace(cfg, auto_fifo_depths=False, folding_config_file=cache_path))
+
+    fifo_log(f"FIFO depth cache: Miss ({key[:12]}). Sizing the FIFOs by simulation")
+    model = step_fn(model, cfg)
+    # Written by FINN before the FIFOs are split and shallow ones removed, so that it can be reused as folding config
+    final_config = os.path.join(cfg.output_dir, "final_hw_config.json")
+    if os.path.isfile(final_config):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        shutil.copyfile(final_config, tmp_path)
+        os.replace(tmp_path, cache_path)
+        fifo_log(f"FIFO depth cache: Stored the FIFO depths as {key[:12]}")
+    else:
+        fifo_log("FIFO depth cache: This FINN version writes no final_hw_config.json, the FIFO depths cannot be stored")
+    return model
+
+
+def finn_tmp_references(model_file: str) -> list[str]:
+    """Return the names of all FINN_TMP entries (code_gen_*, vivado_stitch_proj_*, ...) a model points to"""
+    build_dir = os.environ.get("FINN_BUILD_DIR", "")
+    if build_dir == "" or not os.path.isfile(model_file):
+        return []
+    with open(model_file, 'rb') as f:
+        data = f.read()
+    pattern = re.escape(os.path.abspath(build_dir).encode()) + rb"/([A-Za-z0-9_.\-]+)"
+    return sorted(set(m.decode() for m in re.findall(pattern, data)))
+
+
+def model_metadata(model_file: str) -> dict:
+    return {"build_dir": os.environ.get("FINN_BUILD_DIR", ""), "refs": finn_tmp_references(model_file)}
+
+
+def stage_references(refs: list[str]) -> bool:
+    """Copy FINN_TMP entries from FINN_STAGE_FROM_DIR into FINN_BUILD_DIR. Builds on the ramdisk only get the entries of
+    their checkpoint staged in by the build script, those of step cache entries are copied once the entry is used"""
+    source_dir = os.environ.get("FINN_STAGE_FROM_DIR", "")
+    if source_dir == "" or len(refs) == 0 or not all(os.path.exists(os.path.join(source_dir, ref)) for ref in refs):
+        return False
+    for ref in refs:
+        source, target = os.path.join(source_dir, ref), os.path.join(os.environ["FINN_BUILD_DIR"], ref)
+        tmp_path = f"{target}.tmp{os.getpid()}"
+        if os.path.isdir(source):
+            shutil.copytree(source, tmp_path, symlinks=True)
+        else:
+            shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+    print(f"Staged {len(refs)} FINN_TMP entries from {source_dir}")
+    return True
+
+
+def model_usable(model_file: str, metadata: Optional[dict]) -> bool:
+    # Generated code and IP live in FINN_TMP. A stored model is useless if it was built against another
+    # FINN_TMP (e.g. on the ramdisk instead of the normal filesystem) or its entries were deleted since
+    if metadata is None or not os.path.isfile(model_file):
+        return False
+    build_dir = os.environ.get("FINN_BUILD_DIR", "")
+    if metadata.get("build_dir") != build_dir:
+        return False
+    missing = [ref for ref in metadata.get("refs", []) if not os.path.exists(os.path.join(build_dir, ref))]
+    return len(missing) == 0 or stage_references(missing)
+
+
+def snapshot_outputs(out_dir: str) -> dict[str, tuple[int, int]]:
+    """Modification time and size of every file in the output directory, except those the checkpoint and FINN keep there"""
+    files = {}
+    for root, dirs, fnames in os.walk(out_dir):
+        if root == out_dir:
+            dirs[:] = [d for d in dirs if d not in STEP_OUTPUTS_IGNORED]
+        # Links to directories are not descended into, but kept as links
+        for fname in fnames + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            rel_path = os.path.relpath(os.path.join(root, fname), out_dir)
+            if rel_path in STEP_OUTPUTS_IGNORED:
+                continue
+            stat = os.lstat(os.path.join(root, fname))
+            files[rel_path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def copy_outputs(source_dir: str, target_dir: str, rel_paths: list[str]):
+    for rel_path in rel_paths:
+        source, target = os.path.join(source_dir, rel_path), os.path.join(target_dir, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.tmp{os.getpid()}"
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), tmp_path)
+        else:
+            shutil.copy2(source, tmp_path)
+            # Outputs of finished builds may be read-only links into the doit dedup store
+            os.chmod(tmp_path, os.stat(tmp_path).st_mode | 0o200)
+        os.replace(tmp_path, target)
+
+
+def store_outputs(out_dir: str, before: dict[str, tuple[int, int]], outputs_dir: str) -> list[str]:
+    """Copy the files the step created or changed in the output directory into outputs_dir and return their paths"""
+    changed = sorted(rel_path for rel_path, stamp in snapshot_outputs(out_dir).items() if before.get(rel_path) != stamp)
+    tmp_dir = f"{outputs_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    copy_outputs(out_dir, tmp_dir, changed)
+    shutil.rmtree(outputs_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, outputs_dir)
+    except OSError:
+        # Another build stored the same entry in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return changed
+
+
+def outputs_cached(cache_dir: str, key: str, metadata: Optional[dict]) -> bool:
+    # Entries stored before the outputs were kept have no list of them and cannot be restored
+    if metadata is None or "outputs" not in metadata:
+        return False
+    outputs_dir = os.path.join(cache_dir, key + STEP_OUTPUTS_SUFFIX)
+    return all(os.path.lexists(os.path.join(outputs_dir, rel_path)) for rel_path in metadata["outputs"])
+
+
+def read_json_file(fname: str) -> Optional[dict]:
+    try:
+        with open(fname, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_json_file(fname: str, content: dict):
+    tmp_path = f"{fname}.tmp{os.getpid()}"
+    with open(tmp_path, 'w+') as f:
+        json.dump(content, f)
+    os.replace(tmp_path, fname)
+
+
+def write_checkpoint(name: str, key: str, finished: bool = False):
+    metadata = model_metadata(os.path.join(INTERMEDIATE_MODEL_DIR, name + ".onnx"))
+    # doit gc may evict the FINN_TMP entries of finished builds, but never of unfinished ones
+    write_json_file(CHECKPOINT_FILE, {"step": name, "key": key, "time": time.time(), "finished": finished, "finn_commit": finn_commit, **metadata})
+    # Plain list for the cluster build script, which stages these entries into the ramdisk
+    with open(CHECKPOINT_REFS_FILE, 'w+') as f:
+        f.write("".join(ref + "\n" for ref in metadata["refs"]))
+
+
+def unshare_store_links(paths: list[str]):
+    """doit dedup hard links the outputs of finished builds to read-only blobs. Replace them by private copies before writing"""
+    for path in paths:
+        fnames = [path] if os.path.isfile(path) else [os.path.join(root, f) for root, _, files in os.walk(path) for f in files]
+        for fname in fnames:
+            stat = os.lstat(fname)
+            if os.path.islink(fname) or stat.st_mode & 0o200:
+                continue
+            # Restored from doit archive, not linked anymore
+            if stat.st_nlink < 2:
+                os.chmod(fname, stat.st_mode | 0o200)
+                continue
+            # A new modification time makes rsync replace the file when writing a ramdisk build back, instead of changing the blob
+            tmp_path = f"{fname}.tmp{os.getpid()}"
+            shutil.copyfile(fname, tmp_path)
+            os.chmod(tmp_path, stat.st_mode | 0o200)
+            os.replace(tmp_path, fname)
+
+
+def process_tree_rss() -> int:
+    """Resident memory of this process and all its children (Vivado, Vitis, ...) in bytes"""
+    children: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                # The process name may contain spaces, the parent pid is the second field after it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    total = 0
+    pending = [os.getpid()]
+    while len(pending) > 0:
+        pid = pending.pop()
+        pending += children.get(pid, [])
+        try:
+            with open(f"/proc/{pid}/statm", 'r') as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class PeakMemorySampler(threading.Thread):
+    def __init__(self, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, process_tree_rss())
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def record_step_metrics(name: str, status: str, wall: float, cpu: float, peak_rss: int, output_bytes: Optional[int]):
+    record = {
+        "run": RUN_ID,
+        "time": time.time(),
+        "step": name,
+        "status": status,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        "output_bytes": output_bytes,
+        "input_model_bytes": os.path.getsize(input_model_file) if os.path.isfile(input_model_file) else None,
+        "finn_commit": finn_commit,
+        "host": socket.gethostname(),
+        "job": os.environ.get("SLURM_JOB_ID"),
+    }
+    with open(STEP_METRICS_FILE, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def wrap_step(step: str | Callable, cache_path: Optional[str], previous: Optional[tuple[str, str]]) -> Callable:
+    step_fn = build_steps.build_dataflow_step_lookup[step] if type(step) == str else step
+
+    # functools.wraps keeps the step name, which FINN uses to name the intermediate models
+    @functools.wraps(step_fn)
+    def wrapped_step(model, cfg):
+        # FINN saves the intermediate model of a step after it returns, so the previous step is complete now
+        if previous is not None:
+            write_checkpoint(*previous)
+        # For doit progress. FINN redirects stdout to its own log while a step runs
+        print(f"{PROGRESS_MARKER} {step_fn.__name__} started at {time.time():.0f}", file=sys.__stdout__, flush=True)
+        outputs_before = snapshot_outputs(cfg.output_dir) if cache_path is not None else {}
+        sampler = PeakMemorySampler()
+        sampler.start()
+        wall_start, cpu_start = time.time(), cpu_seconds()
+        try:
+            if step_fn.__name__ == "step_set_fifo_depths":
+                model = set_fifo_depths_cached(step_fn, model, cfg)
+            else:
+                model = step_fn(model, cfg)
+        except BaseException:
+            record_step_metrics(step_fn.__name__, "failed", time.time() - wall_start, cpu_seconds() - cpu_start, sampler.stop(), None)
+            raise
+        record_step_metrics(step_fn.__name__, "ok", time.time() - wall_start, cpu_seconds() - cpu_start, sampler.stop(), model.model.ByteSize())
+        if cache_path is not None:
+            tmp_path = f"{cache_path}.tmp{os.getpid()}"
+            model.save(tmp_path)
+            os.replace(tmp_path, cache_path)
+            outputs = store_outputs(cfg.output_dir, outputs_before, cache_path.replace(".onnx", STEP_OUTPUTS_SUFFIX))
+            write_json_file(cache_path.replace(".onnx", ".json"), {**model_metadata(cache_path), "outputs": outputs})
+        return model
+    return wrapped_step
 
 
 # Check to see whether we resume execution
@@ -58,35 +489,45 @@ DEFAULT_OUTPUT_GENS:            Final[list[build_cfg.DataflowOutputType]] = [
 #args = parser.parse_args()
 #resume = args.resume
 resume = os.environ["BUILD_FLOW_RESUME_STEP"] if "BUILD_FLOW_RESUME_STEP" in os.environ.keys() else ""
+# Stop after the given step instead of running the whole flow (used by doit estimate)
+stop = os.environ["BUILD_FLOW_STOP_STEP"] if "BUILD_FLOW_STOP_STEP" in os.environ.keys() else ""
+
+
+#! This string will be templated by doit
+input_model_file = "<ONNX_INPUT_NAME>"
 
 
 # Set model name and steps
+step_names = [step_name(step) for step in DEFAULT_STEPS]
 if resume == "": 
-    #! This string will be templated by doit
-    model_file = "<ONNX_INPUT_NAME>"
-    actual_steps = DEFAULT_STEPS
+    model_file = input_model_file
+    restart_index = -1
 else:
-    model_file = os.path.join(DEFAULT_OUT_DIR, "intermediate_models", resume + ".onnx")
+    model_file = os.path.join(INTERMEDIATE_MODEL_DIR, resume + ".onnx")
     if not os.path.isfile(model_file):
         print(f"ERROR: Cannot resume from step {resume} because corresponding model file could not be found at {model_file}")
-        sys.exit()
-    found = False
-    actual_steps = []
-    for step in DEFAULT_STEPS:
-        step_name = step if type(step) == str else step.__name__
-        if step_name == resume:
-            found = True
-        if found:
-            actual_steps.append(step)
+        sys.exit(1)
+    if resume not in step_names:
+        print(f"ERROR: Cannot resume from step {resume} because it is not part of DEFAULT_STEPS")
+        sys.exit(1)
+    restart_index = step_names.index(resume)
+if stop == "":
+    last_index = len(DEFAULT_STEPS) - 1
+elif stop in step_names:
+    last_index = step_names.index(stop)
+else:
+    print(f"ERROR: Cannot stop after step {stop} because it is not part of DEFAULT_STEPS")
+    sys.exit(1)
 
 
 cfg_stitched_ip = build.DataflowBuildConfig(
     output_dir=DEFAULT_OUT_DIR,
-    steps=actual_steps,
+    steps=DEFAULT_STEPS,
     vitis_platform=DEFAULT_PLATFORM,
     board=DEFAULT_BOARD,
     mvau_wwidth_max=DEFAULT_MVAU_MAX_WIDTH,
     target_fps=DEFAULT_TARGET_FPS,
+    folding_config_file=DEFAULT_FOLDING_CONFIG,
     synth_clk_period_ns=DEFAULT_SYNTH_CLK_NS,
     minimize_bit_width=True,
     auto_fifo_depths=DEFAULT_AUTO_FIFO_DEPTH,
@@ -98,5 +539,83 @@ cfg_stitched_ip = build.DataflowBuildConfig(
     vitis_opt_strategy=build_cfg.VitisOptStrategyCfg.PERFORMANCE_BEST
     )
 
-build.build_dataflow_cfg(model_file, cfg_stitched_ip)
 
+# Restart after the last checkpointed or cached step, unless a step to resume from was given explicitly
+cache_dir = get_step_cache_dir()
+finn_commit = get_finn_commit()
+if cache_dir is not None and finn_commit == "":
+    print("WARNING: Could not determine the FINN commit. The step cache is disabled for this run")
+    cache_dir = None
+step_keys = compute_step_keys(input_model_file, cfg_stitched_ip, DEFAULT_STEPS, finn_commit)
+
+# The model to resume from points into the FINN_TMP it was built in. A build stage that ran on the ramdisk and was not
+# written back, or was built in another FINN_TMP or with another FINN checkout, would otherwise fail deep inside FINN
+if resume != "":
+    build_dir = os.environ.get("FINN_BUILD_DIR", "")
+    checkpoint = read_json_file(CHECKPOINT_FILE)
+    if checkpoint is None or checkpoint.get("step") != resume:
+        checkpoint = model_metadata(model_file)
+    if checkpoint.get("finn_commit", finn_commit) != finn_commit:
+        print(f"ERROR: Cannot resume from step {resume} because it was built with FINN {checkpoint['finn_commit'][:12]}, but this build uses {finn_commit[:12]}")
+        sys.exit(1)
+    if checkpoint.get("build_dir") != build_dir:
+        print(f"ERROR: Cannot resume from step {resume} because it was built in {checkpoint.get('build_dir')}, but this build uses {build_dir} (ramdisk or not)")
+        sys.exit(1)
+    if not model_usable(model_file, checkpoint):
+        missing = [ref for ref in checkpoint.get("refs", []) if not os.path.exists(os.path.join(build_dir, ref))]
+        print(f"ERROR: Cannot resume from step {resume} because {len(missing)} FINN_TMP entries it needs are missing from {build_dir}, e.g. {missing[0]}. Was the previous build stage on the ramdisk not written back?")
+        sys.exit(1)
+
+if resume == "" and not reuse_disabled():
+    checkpoint = read_json_file(CHECKPOINT_FILE)
+    if checkpoint is not None and checkpoint.get("step") in step_names:
+        index = step_names.index(checkpoint["step"])
+        checkpoint_model = os.path.join(INTERMEDIATE_MODEL_DIR, checkpoint["step"] + ".onnx")
+        if checkpoint.get("key") == step_keys[index] and model_usable(checkpoint_model, checkpoint):
+            print(f"Checkpoint: Resuming after {checkpoint['step']}")
+            restart_index = index
+            model_file = checkpoint_model
+        else:
+            print(f"Checkpoint: Ignoring checkpoint at {checkpoint['step']}, the model, build configuration or FINN_TMP changed since")
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = [read_json_file(os.path.join(cache_dir, key + ".json")) for key in step_keys]
+        for index in reversed(range(restart_index + 1, last_index + 1)):
+            cache_path = os.path.join(cache_dir, step_keys[index] + ".onnx")
+            # The outputs of the skipped steps are restored as well, since the output directory may be a new one
+            skipped = range(restart_index + 1, index + 1)
+            if all(outputs_cached(cache_dir, step_keys[i], entries[i]) for i in skipped) and model_usable(cache_path, entries[index]):
+                print(f"Step cache: {index + 1} of {last_index + 1} steps cached. Restarting after {step_names[index]}")
+                os.makedirs(INTERMEDIATE_MODEL_DIR, exist_ok=True)
+                for i in skipped:
+                    outputs_dir = os.path.join(cache_dir, step_keys[i] + STEP_OUTPUTS_SUFFIX)
+                    copy_outputs(outputs_dir, DEFAULT_OUT_DIR, entries[i]["outputs"])
+                    # Marks the entry as recently used for doit gc, also where access times are not recorded
+                    os.utime(outputs_dir)
+                model_file = os.path.join(INTERMEDIATE_MODEL_DIR, step_names[index] + ".onnx")
+                shutil.copyfile(cache_path, model_file)
+                os.utime(cache_path)
+                restart_index = index
+                break
+
+if restart_index >= last_index:
+    print(f"All steps up to {step_names[last_index]} are already done, nothing to do. Set BUILD_FLOW_NO_CACHE=1 to force a rebuild")
+    sys.exit()
+
+# Every executed step is stored in the cache and recorded as checkpoint
+os.makedirs(DEFAULT_OUT_DIR, exist_ok=True)
+unshare_store_links([DEFAULT_OUT_DIR] + [os.path.join(os.environ.get("FINN_BUILD_DIR", ""), ref) for ref in finn_tmp_references(model_file)])
+actual_steps = []
+for index in range(restart_index + 1, last_index + 1):
+    cache_path = os.path.join(cache_dir, step_keys[index] + ".onnx") if cache_dir is not None else None
+    previous = (step_names[index - 1], step_keys[index - 1]) if index > 0 else None
+    actual_steps.append(wrap_step(DEFAULT_STEPS[index], cache_path, previous))
+cfg_stitched_ip.steps = actual_steps
+
+# A build that stopped early can be continued from its checkpoint by a normal build
+if build.build_dataflow_cfg(model_file, cfg_stitched_ip) == 0:
+    write_checkpoint(step_names[last_index], step_keys[last_index], finished=last_index == len(DEFAULT_STEPS) - 1)
+else:
+    # Lets the job scheduler see that the build failed
+    sys.exit(1)
@@ -4,18 +4,19 @@
 # TODO: Default config files for multiple environments, make them usable for example via something like
 # doit setenv cluster
 
+# Every doit call, also doit list and tab completion, loads this file and creates the tasks of all projects. The tasks
+# only describe themselves here, their actions live in finn_on_n2 and are imported once a task runs
+
 import subprocess
-import sys
 import os
-import shutil
-from typing import Any, Generator, Optional
+from typing import Optional
 from doit.exceptions import BaseFail
-import toml
-from doit.action import CmdAction
 from doit.reporter import ConsoleReporter
 from doit.task import Task
-import shlex
-import hashlib
+
+from finn_on_n2.common import BITFILE, ProjectName
+from finn_on_n2.index import indexed_projects
+
 
 class CustomReporter(ConsoleReporter):
     def __init__(self, outstream, options):
@@ -33,172 +34,32 @@ class CustomReporter(ConsoleReporter):
     
     def add_failure(self, task, fail: BaseFail):
         self.write(f"[ failure in task {task.name}: {fail.get_name()} ]\n")
-        
-
-#* Helper functions
-def execute_in_finn(command_list: list[str]):
-    subprocess.run(command_list, cwd="finn")
-
-
-def execute_here(command_list: list[str]):
-    subprocess.run(command_list)
-
-
-def read_from_file(fname: str, binary: bool = False) -> Optional[str]:
-    try:
-        with open(fname, 'r' if not binary else 'rb') as f:
-            return f.read()
-    except:
-        return None
-
-
-def get_config_hash() -> str:
-    if not os.path.isfile("config.toml"):
-        print("Cannot create hash of non existing configuration!")
-        sys.exit() 
-
-    h = hashlib.sha256()
-    h.update(read_from_file("config.toml", binary=True))
-    return h.hexdigest()
-
-
-def write_config_hash(hash: str):
-    with open(".info", 'w+') as f:
-        f.write(hash)
-
-
-def check_config_outdated() -> bool:
-    if not os.path.isfile(".info"):
-        return True
-    conf = read_from_file("config.toml")
-    if conf is None:
-        print("ERROR: No config file found!")
-        sys.exit()
-    
-    old_hash = read_from_file(".info")
-    new_hash = get_config_hash()
-    return old_hash != new_hash
-
-
-def check_params(params: list[str]):
-    if len(params) > 1:
-        print("Received more than argument, please only supply one!")
-        sys.exit()
-    if len(params) == 0:
-        print("Please supply the required argument for this function!")
-        sys.exit()
-
-
-
-
-#* Import configuration
-config = None
-with open("config.toml", "r") as f:
-    config = toml.loads(f.read())
-if config is None:
-    print("Failed to read config file! Check for syntax errors!")
-    sys.exit()
 
 
 #* DOIT Configuration
 DOIT_CONFIG = {
     "action_string_formatting": "new", 
-    "default_tasks": ["finn-doit-setup"],
+    "default_tasks": ["finn-doit-setup", "build"],
+    # The project tasks mostly wait for jobs, and the task actions are nested functions that cannot be pickled
+    "par_type": "thread",
     "reporter": CustomReporter
 }
 
 
-#* TASK Configuration
-environment = config["general"]["used_environment"]
-dev_mode = config["general"]["dev_mode"]
-driver_required_commands = config["environment"][environment]["driver_compiler_prefix_commands"]
-job_exec_prefix = config["environment"][environment]["job_execution"]
-
-finn_build_script = config["environment"][environment]["finn_build_script"]
-finn_build_script_template = config["environment"][environment]["finn_build_script_template"]
-cppdriver_run_script = config["environment"][environment]["cppdriver_run_script"]
-pythondriver_run_script = config["environment"][environment]["pythondriver_run_script"]
-
-finn_repos = config["finn"]["repositories"]
-finn_default_repo_name = config["finn"]["default_repository"]
-finn_default_repo = finn_repos[finn_default_repo_name]
-finn_default_branch = config["finn"]["default_branch"]
-if "default_commit_hash" in config["finn"].keys():
-    finn_default_commit = config["finn"]["default_commit_hash"]
-else:
-    finn_default_commit = ""
-finn_build_template = config["finn"]["build_template"]
-
-config_envvars = config["build"]["envvars"]
-
-# The folder which _contains_ finn, FINN_TMP, SINGULARITY_CACHE, etc.
-os.environ["FINN_WORKDIR"] = os.path.abspath(os.getcwd())
-
-# The path to the GHA or Path, which builds the singularity/apptainer image
-if environment == "cluster":
-    print("Cluster environment selected: Using Singularity instead of Docker!")
-    os.environ["FINN_SINGULARITY"] = config["general"]["singularity_image"]
-
+#* Actions and checks of several tasks
+def instantiate_buildscripts():
+    from finn_on_n2 import config
+    config.instantiate_buildscripts()
 
-def check_singularity():
-    """Return whether singularity is mentioned in the run_docker script"""
-    if not os.path.isfile(os.path.join("finn", "run-docker.sh")):
-        print("Setup not configured correctly. finn is either not installed or finn/run-docker.sh is specifically missing! Run doit once to clone FINN.")
-        #sys.exit()
-        return True # TODO: Fix more permanently
-    with open(os.path.join("finn", "run-docker.sh"), 'r') as f:
-        text = f.read()
-        return ("singularity" in text) or ("SINGULARITY" in text)
 
+def check_dev_mode():
+    from finn_on_n2 import config
+    config.check_dev_mode()
 
-if (environment == "cluster" or ("FINN_SINGULARITY" in os.environ.keys() and os.environ["FINN_SINGULARITY"] != "")) and not check_singularity():
-    print("WARNING: You have selected the cluster environment but your run-docker.sh file does not mention singularity. If the job failes with \"docker: Command not found\" remember to patch the singularity PR into FINN before executing!")
-
-#* Function for updating build scripts based on a configuration file
-def instantiate_buildscripts():
-    # Read template file
-    text = ""
-    if not os.path.isfile(finn_build_script_template):
-        print("The template file for the FINN build shell script could not be found!")
-        sys.exit()
-
-    with open(finn_build_script_template, 'r') as f:
-        text = f.read()
-    
-    # Insert variables
-    text = text.replace("<FINN_WORKDIR>", os.environ["FINN_WORKDIR"])
-    vars = ""
-    for envvar_name, envvar_value in config_envvars.items():
-        vars += f"export {envvar_name}=\"{envvar_value}\"\n"
-    text = text.replace("<SET_ENVVARS>", vars)
-
-    # Check for toolchain path
-    if "VIVADO_PATH" not in config_envvars.keys() or ("VIVADO_PATH" in config_envvars.keys() and config_envvars["VIVADO_PATH"] == ""):
-        print("WARNING: VIVADO_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
-    if "VITIS_PATH" not in config_envvars.keys() or ("VITIS_PATH" in config_envvars.keys() and config_envvars["VITIS_PATH"] == ""):
-        print("WARNING: VITIS_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
-    if "HLS_PATH" not in config_envvars.keys() or ("HLS_PATH" in config_envvars.keys() and config_envvars["HLS_PATH"] == ""):
-        print("WARNING: HLS_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
-    if "VIVADO_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["VIVADO_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
-        print("WARNING: The paths or versions of FINN_XILINX_PATH and VIVADO_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
-    if "VITIS_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["VITIS_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
-        print("WARNING: The paths or versions of FINN_XILINX_PATH and VITIS_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
-    if "HLS_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["HLS_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
-        print("WARNING: The paths or versions of FINN_XILINX_PATH and HLS_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
-    # TODO: Make checks for versions as well
-
-    # Write back out
-    with open(finn_build_script, 'w+') as f:
-        f.write(text)
-
-
-#* Update scripts if a change in the config was detected
-if check_config_outdated():
-    print("Detected outdated configuration. Re-instantiating build scripts now.")
-    instantiate_buildscripts()
-    new_hash = get_config_hash()
-    write_config_hash(new_hash)
 
+def config_uptodate() -> bool:
+    from finn_on_n2 import config
+    return config.config_uptodate()
 
 
 # ******** TASKS ******** #
@@ -218,20 +79,8 @@ def task_update():
 #* Switch to a template configuration
 def task_config():
     def use_config_template(names: list[str]):
-        if len(names) > 1:
-            print("More than one configuration name provided. Please only pass a single configuration name")
-            sys.exit()
-        if len(names) == 0:
-            print("Please pass a configuration name (names are the toml filenames in configurations/ without the suffix)")
-            sys.exit()
-        
-        fname = names[0]
-        available_configs = [fn.replace(".toml", "") for fn in os.listdir("configurations")]
-        if fname not in available_configs:
-            print("Could not find configuration under configurations/" + fname + ".toml")
-            sys.exit()
-        
-        subprocess.run(shlex.split(f"cp configurations/{fname}.toml ./config.toml"))
+        from finn_on_n2 import config
+        return config.use_config_template(names)
 
     return {
         "doc": " | Usage: doit config <configname>. Sets the current config to configurations/<configname>.toml",
@@ -245,11 +94,6 @@ def task_config():
 
 # * Setup
 def task_finn_doit_setup():
-    # Only download the driver and its dependencies as well, if the dev mode is active, to save time for normal users
-    if dev_mode:
-        print("Currently, building the C++ driver in dev mode is unsupported. Please set dev mode to false in the config.toml file!\nExiting.")
-        sys.exit()
-    
     yield {
         "basename": "finn-doit-setup",
         "doc": "| Setup. Clones FINN and instantitates script templates",
@@ -265,78 +109,48 @@ def task_setenvvars():
         "verbosity": 2,
         "actions": [
             instantiate_buildscripts
-        ]
+        ],
+        "uptodate": [config_uptodate]
     }
 
 
 # * Clone FINN
 def task_clonefinn():
-    def renameIfEki():
-        if os.path.isdir("finn-internal"):
-            os.rename("finn-internal", "finn")
-
-    def checkout_if_commit_given(): 
-        if finn_default_commit != "":
-            execute_in_finn(shlex.split(f"git checkout {finn_default_commit}")) 
+    def clone():
+        from finn_on_n2 import finn_versions
+        return finn_versions.clone()
 
     return {
-        "doc": "| Clone into the config-given repo, branch and optionally commit ",
+        "doc": "| Check out the config-given repo, branch and optionally commit from the FINN mirror",
         "actions": [
-            (execute_here, [shlex.split(f"git clone {finn_default_repo}")]),
-            renameIfEki,
-            (execute_in_finn, [shlex.split(f"git checkout {finn_default_branch}")]),
-            checkout_if_commit_given,
-            (execute_in_finn, [shlex.split(f"git submodule init")]),
-            (execute_in_finn, [shlex.split(f"git submodule update")]),
-            
+            check_dev_mode,
+            clone
         ],
     }
 
 
-#### * FOR FINN PROJECT CREATION * ####
-ONNXFilePath = str
-ProjectName = str
-
-
-def onnx_name_to_project_name(name: ONNXFilePath) -> ProjectName:
-    return os.path.basename(name).replace(".onnx", "")
-
+# * Switch between FINN versions
+def task_usefinn():
+    def use(params: list[str]):
+        from finn_on_n2 import finn_versions
+        return finn_versions.use(params)
 
-def create_project_dir(name: ProjectName):
-    if not os.path.isdir(name):
-        os.mkdir(name)
-
-
-def copy_onnx_file_to_project(name: ONNXFilePath):
-    if not os.path.isfile(name):
-        print(f"Cannot find ONNX file at {name}. Please specify a valid ONNX file path!")
-        sys.exit()
-    project_name = onnx_name_to_project_name(name)
-    target = os.path.join(".", project_name, project_name + ".onnx")
-    if not os.path.isfile(target):
-        subprocess.run(shlex.split(f"cp {name} {target}"))
-
-
-def create_finn_build_script(name: ProjectName):
-    build_path = os.path.join(".", name, "build.py")
-    if not os.path.isfile(build_path):
-        buildscript = read_from_file(finn_build_template)
-        if buildscript is None:
-            print(f"Couldn't find build script template at {finn_build_template}. Please correct your config.toml!")
-            sys.exit()
-        with open(build_path, 'w+') as f:
-            f.write(buildscript.replace("<ONNX_INPUT_NAME>", name + ".onnx"))
+    return {
+        "doc": "| Usage: doit usefinn [commit-or-branch]. Points finn to a checkout of the given FINN version, or lists the available checkouts",
+        "pos_arg": "params",
+        "actions": [
+            use
+        ],
+        "verbosity": 2,
+    }
 
 
+#### * FOR FINN PROJECT CREATION * ####
 # * Make a new FINN project
 def task_create():
     def create_project(params: list[str]):
-        check_params(params)
-        onnx_name = params[0]
-        project_name = onnx_name_to_project_name(onnx_name)
-        create_project_dir(project_name)
-        copy_onnx_file_to_project(onnx_name)
-        create_finn_build_script(project_name)
+        from finn_on_n2 import projects
+        return projects.create_project(params)
 
     return {
         "doc": "| Creates a project based on the given file, automatically using the filename as the project name",
@@ -361,19 +175,13 @@ def task_cleanup():
 
 #* List all projects
 def task_projects():
-    def ls_projects():
-        exclusion_list = [".mypy_cache", "build_scripts", "configurations", "pre-builds", "run_scripts"]
-        dirs = []
-        for name in os.listdir("."):
-            if (os.path.isdir(name)) and (name not in exclusion_list) and ("build.py" in os.listdir(name)):
-                dirs.append(name)
-        
-        plist = "\n".join([f"\t{n}" for n in dirs])
-        print(f"Found {len(dirs)} project folders:")
-        print(plist)
-    
+    def ls_projects(params: list[str]):
+        from finn_on_n2 import projects
+        return projects.ls_projects(params)
+
     return {
-        "doc": "| List all projects in this directory",
+        "doc": "| Usage: doit projects [refresh] [status:<status>] [step:<step>] [name:<glob>] [sort:[-]<column>] [limit:<n>]. Lists the projects from the project index",
+        "pos_arg": "params",
         "actions": [
             ls_projects
         ],
@@ -384,18 +192,8 @@ def task_projects():
 # * Run FINN on a project
 def task_execute():
     def run_synth_for_onnx_name(params: list[str]):
-        if "finn" not in os.listdir("."):
-            print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
-            sys.exit()
-        check_params(params)
-        name: ONNXFilePath = params[0]
-        if not os.path.isdir(name):
-            print("Error: Project directory " + name + " doesn't exist!")
-            sys.exit()
-
-        # TODO: This is a workaround. As soon as custom argument passes are possible, deprecate the use of env variables
-        os.environ["BUILD_FLOW_RESUME_STEP"] = ""
-        subprocess.run([job_exec_prefix, finn_build_script, os.path.abspath(name)])
+        from finn_on_n2 import builds
+        return builds.run_synth_for_onnx_name(params)
 
     return {
         "doc": "| Execute the given project",
@@ -407,26 +205,15 @@ def task_execute():
     }
 
 
-# * Resume FINN Flow from a previous step
-# TODO: Rework this
+# * Resume FINN Flow from the last checkpoint or after a given step
 def task_resume():
-    def run_synth_for_onnx_name_from_step(name):
-        if "finn" not in os.listdir("."):
-            print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
-            sys.exit()
-        pdir = os.path.join(".", name[0])
-        step = name[1]
-        if not os.path.isdir(pdir):
-            print("Error: Project directory " + pdir + " doesnt exist!")
-            sys.exit()
-        
-        # TODO: This is a workaround. As soon as custom argument passes are possible, deprecate the use of env variables
-        os.environ["BUILD_FLOW_RESUME_STEP"] = step
-        subprocess.run([job_exec_prefix, finn_build_script, os.path.abspath(pdir)])
+    def run_synth_for_onnx_name_from_step(params: list[str]):
+        from finn_on_n2 import builds
+        return builds.run_synth_for_onnx_name_from_step(params)
 
     return {
-        "doc": "| Resume a FINN flow. Usage: doit resume <project-name> <step-name>. Step has to have been reached before",
-        "pos_arg": "name",
+        "doc": "| Resume a FINN flow. Usage: doit resume <project-name> [step-name]. Without a step the last checkpoint is used, otherwise the flow continues after the given step",
+        "pos_arg": "params",
         "actions": [
             (run_synth_for_onnx_name_from_step,),
         ],
@@ -436,19 +223,9 @@ def task_resume():
 
 def task_edit():
     def edit(names):
-        if len(names) != 1:
-            print("Cannot edit multiple or none projects. Provide a single project name!")
-            sys.exit()
-
-        editors = ["vim", "vi", "nano", "gedit", "code"]
-        for editor in editors:
-            if shutil.which(editor) is not None: 
-                subprocess.run(shlex.split(f"vim {names[0]}/build.py"))
-                return True
-        
-        print(f"None of these editors is available for editing: {editors}!")
-        return False
-    
+        from finn_on_n2 import projects
+        return projects.edit(names)
+
     return {
         "doc": "| Open the build.py file of the given project in an available editor",
         "actions": [
@@ -462,20 +239,368 @@ def task_edit():
 # * Run python driver test
 def task_pythondriver():
     def run_python_driver(params: list[str]):
-        check_params(params)
-        name = params[0]
-        if not os.path.isdir(name):
-            print("No project directory found under the name " + name)
-        output_dirs = [x for x in os.listdir(name) if x.startswith("out_")]
-        if len(output_dirs) == 0:
-            print("Tried to find valid output directoy in project directory. Make sure all output directories are prefixed with \"out_\", and contain the file deploy/driver/<...>.xclbin!")
-            sys.exit()
-        driver_dir = os.path.join(os.path.abspath(name), output_dirs[0], "deploy", "driver")
-        subprocess.run([job_exec_prefix, pythondriver_run_script, driver_dir])
+        from finn_on_n2 import projects
+        return projects.run_python_driver(params)
 
     return {
-        "doc": "| Execute the python driver with testdata",
+        "doc": "| Usage: doit pythondriver <project> [<input.npy> [<output.npy>] [stream[:<batch size>]] [labels:<labels.npy>]]. Runs the throughput test on all allocated FPGAs, or the given dataset split over them. stream runs it batch by batch and reports the host and FPGA time and the accuracy",
         "pos_arg": "params",
         "actions": [(run_python_driver,)],
         "verbosity": 2,
     }
+
+
+#### * FOR BUILD RESULTS AND SWEEPS * ####
+# * Sweep a project over a parameter grid
+def task_sweep():
+    def sweep(params: list[str]):
+        from finn_on_n2 import sweeps
+        return sweeps.sweep(params)
+
+    return {
+        "doc": "| Usage: doit sweep <project> <matrix.toml>. Builds the project for every combination of the build.py constants in the matrix",
+        "pos_arg": "params",
+        "actions": [
+            sweep
+        ],
+        "verbosity": 2,
+    }
+
+
+# * Collect the results of a sweep
+def task_sweepresults():
+    def collect(params: list[str]):
+        from finn_on_n2 import sweeps
+        return sweeps.collect(params)
+
+    return {
+        "doc": "| Usage: doit sweepresults <project> [sweep-name]. Collects the reports of all sweep points into one table",
+        "pos_arg": "params",
+        "actions": [
+            collect
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR BUILD METRICS * ####
+# * Summarize where build time and memory go
+def task_report():
+    def report(params: list[str]):
+        from finn_on_n2 import metrics
+        return metrics.report(params)
+
+    return {
+        "doc": "| Usage: doit report [project...]. Shows the slowest steps, memory high-water marks and build times over time",
+        "pos_arg": "params",
+        "actions": [
+            report
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR DRIVER BENCHMARKS * ####
+# * Benchmark the drivers of a project
+def task_bench():
+    def run_bench(params: list[str]):
+        from finn_on_n2 import bench
+        return bench.run_bench(params)
+
+    return {
+        "doc": "| Usage: doit bench <project>. Benchmarks the Python and C++ driver over the batch sizes configured in config.toml",
+        "pos_arg": "params",
+        "actions": [
+            run_bench
+        ],
+        "verbosity": 2,
+    }
+
+
+# * Evaluate driver benchmarks
+def task_benchresults():
+    def show_results(params: list[str]):
+        from finn_on_n2 import bench
+        return bench.show_results(params)
+
+    return {
+        "doc": "| Usage: doit benchresults <project> [setbaseline]. Summarizes the latest benchmark and flags regressions against the stored baseline",
+        "pos_arg": "params",
+        "actions": [
+            show_results
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR JOB TRACKING * ####
+# * Show the state of submitted jobs
+def task_status():
+    def status(params: list[str]):
+        from finn_on_n2 import jobs
+        return jobs.status(params)
+
+    return {
+        "doc": "| Usage: doit status [project...]. Polls the scheduler and shows running and recent jobs of the projects",
+        "pos_arg": "params",
+        "actions": [
+            status
+        ],
+        "verbosity": 2,
+    }
+
+
+# * Wait until all submitted jobs finished
+def task_wait():
+    def wait(params: list[str]):
+        from finn_on_n2 import jobs
+        return jobs.wait(params)
+
+    return {
+        "doc": "| Usage: doit wait [project...]. Follows all pending and running jobs of the projects until they finished",
+        "pos_arg": "params",
+        "actions": [
+            wait
+        ],
+        "verbosity": 2,
+    }
+
+
+# * Build a project and run its driver once the build succeeded
+def task_chain():
+    def chain(params: list[str]):
+        from finn_on_n2 import builds
+        return builds.chain(params)
+
+    return {
+        "doc": "| Usage: doit chain <project> [bench|pythondriver]. Builds the project and runs the driver benchmark (default) or test once the build succeeded",
+        "pos_arg": "params",
+        "actions": [
+            chain
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR THE BUILD WORKER * ####
+# * Manage the build worker of this host
+def task_worker():
+    def worker(params: list[str]):
+        from finn_on_n2 import build_worker
+        return build_worker.worker(params)
+
+    return {
+        "doc": "| Usage: doit worker [start [<concurrency>] | stop | status]. Runs a long-lived build container on this host that the builds are handed to, instead of starting one container per build",
+        "pos_arg": "params",
+        "actions": [
+            worker
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR BUILD PROGRESS * ####
+# * Show the current step, ETA and stalls of running builds
+def task_progress():
+    def progress(params: list[str]):
+        from finn_on_n2 import build_progress
+        return build_progress.progress(params)
+
+    return {
+        "doc": "| Usage: doit progress [follow] [project...]. Shows the current step, time in step, ETA and stalled steps of running builds. follow keeps reporting until they finished",
+        "pos_arg": "params",
+        "actions": [
+            progress
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR QUICK ESTIMATES * ####
+def task_estimate():
+    def estimate(params: list[str]):
+        from finn_on_n2 import estimates
+        return estimates.estimate(params)
+
+    return {
+        "doc": "| Usage: doit estimate <project...>. Runs the flow of all projects up to the estimate reports in parallel and compares the results",
+        "pos_arg": "params",
+        "actions": [
+            estimate
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR TARGET FPS SEARCH * ####
+def task_search():
+    def search(params: list[str]):
+        from finn_on_n2 import fps_search
+        return fps_search.search(params)
+
+    return {
+        "doc": "| Usage: doit search <project>. Searches the highest target FPS whose estimated resources fit the board and sets it in build.py",
+        "pos_arg": "params",
+        "actions": [
+            search
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR FINN VERSION COMPARISONS * ####
+# * Build reference models with several FINN commits and compare the results
+def task_finncompare():
+    def compare(params: list[str]):
+        from finn_on_n2 import finn_compare
+        return finn_compare.compare(params)
+
+    return {
+        "doc": "| Usage: doit finncompare [<commit-or-branch>...]. Builds the reference models of config.toml with every given FINN version and compares throughput, resources and build time. Without arguments the last results are shown",
+        "pos_arg": "params",
+        "actions": [
+            compare
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR FINN_TMP GARBAGE COLLECTION * ####
+# * Trim FINN_TMP to the configured size
+def task_gc():
+    def gc(params: list[str]):
+        from finn_on_n2 import finn_tmp
+        return finn_tmp.gc(params)
+
+    return {
+        "doc": "| Usage: doit gc [dryrun]. Evicts the least recently used builds from FINN_TMP until it fits the size budget in config.toml",
+        "pos_arg": "params",
+        "actions": [
+            gc
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR THE ARTIFACT STORE * ####
+# * Deduplicate the outputs of finished builds
+def task_dedup():
+    def dedup(params: list[str]):
+        from finn_on_n2 import store
+        return store.dedup(params)
+
+    return {
+        "doc": "| Usage: doit dedup [project-or-build-dir...]. Moves the outputs of finished builds into the content-addressed store and hard links them back",
+        "pos_arg": "params",
+        "actions": [
+            dedup
+        ],
+        "verbosity": 2,
+    }
+
+
+# * Pack cold builds into tarballs and restore them
+def task_archive():
+    def archive(params: list[str]):
+        from finn_on_n2 import store
+        return store.archive(params)
+
+    return {
+        "doc": "| Usage: doit archive [<project-or-build-dir...> | list | restore <archive...>]. Packs finished builds (by default the ones not used for a while) into tarballs",
+        "pos_arg": "params",
+        "actions": [
+            archive
+        ],
+        "verbosity": 2,
+    }
+
+
+#### * FOR THE PROJECT TASK GRAPH * ####
+# Every project gets a buildscript, build and benchmark subtask, e.g. build:mynet. doit skips a build as long as the
+# ONNX model, build.py, the FINN commit and the instantiated build script are unchanged and the bitfile exists, and a
+# benchmark as long as the bitfile did not change. doit (or doit build) brings all projects up to date, -n N runs N at once
+_graph_projects: Optional[list[ProjectName]] = None
+
+
+def graph_projects() -> list[ProjectName]:
+    """Projects with a build script, and projects whose creation stopped before the build script was written.
+    Read once per doit call, every doit call (also doit list and tab completion) creates the tasks of all of them"""
+    global _graph_projects
+    if _graph_projects is None:
+        # A stat per project, in case one was deleted by hand since the index was last refreshed. Nothing is written,
+        # without an index the directories are scanned
+        _graph_projects = [n for n in indexed_projects() if os.path.isdir(n)]
+    return _graph_projects
+
+
+def build_inputs_unchanged(task: Task, values: dict) -> bool:
+    from finn_on_n2 import builds
+    return builds.build_inputs_unchanged(task, values)
+
+
+def task_buildscript():
+    def write_buildscript(name: ProjectName):
+        from finn_on_n2 import projects
+        projects.create_finn_build_script(name)
+
+    yield {"name": None, "doc": "| Usage: doit buildscript[:<project>]. Writes the build scripts of projects whose creation stopped before it"}
+    for name in graph_projects():
+        yield {
+            "name": name,
+            "doc": f"| Write the build script of {name} if it is missing",
+            "actions": [(write_buildscript, [name])],
+            "targets": [os.path.join(name, "build.py")],
+            "uptodate": [True],
+        }
+
+
+def task_build():
+    def build(name: ProjectName):
+        from finn_on_n2 import builds
+        return builds.build(name)
+
+    yield {"name": None, "doc": "| Usage: doit build[:<project>]. Builds all (or the given) projects whose bitfile is outdated. Part of the default tasks"}
+    for name in graph_projects():
+        # build.py may still have to be written by buildscript:<name>
+        file_dep = [os.path.join(name, "build.py")] + [f for f in [os.path.join(name, name + ".onnx"), os.path.join(name, "folding_config.json")] if os.path.isfile(f)]
+        yield {
+            "name": name,
+            "doc": f"| Build {name} unless its bitfile is up to date",
+            "actions": [(build, [name])],
+            "file_dep": file_dep,
+            "targets": [os.path.join(name, BITFILE)],
+            "task_dep": ["setenvvars"],
+            "uptodate": [build_inputs_unchanged],
+            "verbosity": 2,
+        }
+
+
+def task_benchmark():
+    def benchmark(name: ProjectName):
+        from finn_on_n2 import builds
+        return builds.benchmark(name)
+
+    yield {"name": None, "doc": "| Usage: doit benchmark[:<project>]. Benchmarks the drivers of all (or the given) projects whose bitfile changed since their last benchmark"}
+    for name in graph_projects():
+        yield {
+            "name": name,
+            "doc": f"| Benchmark the drivers of {name} unless its bitfile was already benchmarked",
+            "actions": [(benchmark, [name])],
+            "file_dep": [os.path.join(name, BITFILE)],
+            "verbosity": 2,
+        }
+
+
+#### * FOR STARTUP PERFORMANCE * ####
+def task_startupbench():
+    def measure_startup():
+        from finn_on_n2 import startup
+        return startup.measure_startup()
+
+    return {
+        "doc": "| Times doit list against doit alone, with and without cached bytecode. Fails if dodo.py adds more than its budget",
+        "actions": [
+            measure_startup
+        ],
+        "verbosity": 2,
+    }
@@ -0,0 +1,156 @@
+# Driver benchmarks. Their results are kept in <project>/bench/<time>, the baseline to compare with in bench/baseline.json
+
+import sys
+import os
+import json
+import re
+import statistics
+import time
+import ast
+from typing import Any, Optional
+
+from finn_on_n2.common import ProjectName, check_params, find_cpp_driver_dir, find_output_dir, print_table, read_from_file, read_json
+from finn_on_n2.config import settings
+from finn_on_n2.jobs import submit_job
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def parse_cpp_driver_output(text: str) -> dict[str, float]:
+    """Pick throughput and latency numbers out of the C++ driver's test mode output"""
+    results = {}
+    for line in text.splitlines():
+        for key in ["throughput", "latency"]:
+            if key in line.lower() and key not in results.keys():
+                match = re.search(r"([0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)", line.lower().split(key, 1)[1])
+                if match is not None:
+                    results[key] = float(match.group(1))
+    return results
+
+
+def read_bench_results(result_dir: str) -> list[dict[str, Any]]:
+    """Read the raw results of one benchmark run and group the repetitions by driver and batch size"""
+    samples: dict[tuple[str, Any], dict[str, list[float]]] = {}
+    for fname in sorted(os.listdir(result_dir)):
+        python_match = re.fullmatch(r"python_bs([0-9]+)_rep[0-9]+(?:_card[0-9]+)?\.txt", fname)
+        if python_match is not None:
+            try:
+                metrics = ast.literal_eval(read_from_file(os.path.join(result_dir, fname)) or "")
+                # The throughput test of the Python driver times the whole batch, not single samples
+                throughput, batch_runtime = metrics["throughput[images/s]"], metrics["runtime[ms]"]
+            except (ValueError, SyntaxError, TypeError, KeyError):
+                continue
+            sample = samples.setdefault(("python", int(python_match.group(1))), {"throughput": [], "batch": [], "latency": []})
+            sample["throughput"].append(throughput)
+            sample["batch"].append(batch_runtime)
+        elif re.fullmatch(r"cpp_rep[0-9]+(?:_card[0-9]+)?\.txt", fname):
+            metrics = parse_cpp_driver_output(read_from_file(os.path.join(result_dir, fname)) or "")
+            sample = samples.setdefault(("cpp", "-"), {"throughput": [], "batch": [], "latency": []})
+            for key in ["throughput", "latency"]:
+                if key in metrics.keys():
+                    sample[key].append(metrics[key])
+
+    rows = []
+    for (driver, batch_size), sample in samples.items():
+        row: dict[str, Any] = {"driver": driver, "batch_size": batch_size, "runs": max(len(values) for values in sample.values())}
+        if len(sample["throughput"]) > 0:
+            row["median_throughput"] = statistics.median(sample["throughput"])
+            row["p10_throughput"] = percentile(sample["throughput"], 10)
+        for key, name in [("batch", "batch_ms"), ("latency", "latency_ms")]:
+            if len(sample[key]) > 0:
+                row[f"median_{name}"] = statistics.median(sample[key])
+                row[f"p90_{name}"] = percentile(sample[key], 90)
+                row[f"p99_{name}"] = percentile(sample[key], 99)
+        rows.append(row)
+    return rows
+
+
+def flag_regressions(rows: list[dict[str, Any]], baseline: list[dict[str, Any]]):
+    baseline_rows = {(r["driver"], str(r["batch_size"])): r for r in baseline}
+    for row in rows:
+        reference = baseline_rows.get((row["driver"], str(row["batch_size"])))
+        if reference is None:
+            row["vs_baseline"] = "new"
+            continue
+        flags = []
+        # Higher throughput is better, a shorter batch runtime or latency as well. Baselines without a value are skipped
+        for key, label, sign in [("median_throughput", "tput", 1), ("median_batch_ms", "batch", -1), ("median_latency_ms", "lat", -1)]:
+            if row.get(key) is None or not reference.get(key):
+                continue
+            change = row[key] / reference[key] - 1
+            flags.append(f"{change:+.1%} {label}")
+            if sign * change < -settings.bench_regression_tolerance and "REGRESSION" not in flags:
+                flags.append("REGRESSION")
+        row["vs_baseline"] = " ".join(flags)
+
+
+def submit_bench(name: ProjectName) -> Optional[str]:
+    """Submit a benchmark job for the drivers of the project. Returns the job id"""
+    if settings.bench_run_script == "":
+        print(f"No driver benchmark script configured for the {settings.environment} environment")
+        sys.exit()
+    if not os.path.isdir(name):
+        print("No project directory found under the name " + name)
+        sys.exit()
+    out_dir = find_output_dir(name)
+    if out_dir is None or not os.path.isdir(os.path.join(out_dir, "deploy", "driver")):
+        print("Tried to find valid output directoy in project directory. Make sure all output directories are prefixed with \"out_\", and contain the file deploy/driver/<...>.xclbin!")
+        sys.exit()
+    driver_dir = os.path.join(out_dir, "deploy", "driver")
+    cpp_driver_dir = find_cpp_driver_dir(out_dir)
+    if cpp_driver_dir is None:
+        print("No C++ driver found in the output directory, only benchmarking the Python driver")
+
+    result_dir = os.path.join(os.path.abspath(name), "bench", time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(result_dir, exist_ok=True)
+    print(f"Results will be written to {result_dir}. Use doit benchresults {name} once the job finished")
+    return submit_job(name, "bench", [settings.bench_run_script, driver_dir, cpp_driver_dir or "-", result_dir, ",".join(str(b) for b in settings.bench_batch_sizes), str(settings.bench_repetitions)])
+
+
+def run_bench(params: list[str]):
+    check_params(params)
+    if submit_bench(params[0]) is None:
+        return False
+
+
+def show_results(params: list[str]):
+    if len(params) not in [1, 2] or (len(params) == 2 and params[1] != "setbaseline"):
+        print("Usage: doit benchresults <project> [setbaseline]")
+        sys.exit()
+    bench_dir = os.path.join(params[0], "bench")
+    runs = sorted([d for d in os.listdir(bench_dir) if os.path.isdir(os.path.join(bench_dir, d))]) if os.path.isdir(bench_dir) else []
+    if len(runs) == 0:
+        print(f"No benchmark results found for {params[0]}. Run doit bench {params[0]} first")
+        sys.exit()
+
+    rows = read_bench_results(os.path.join(bench_dir, runs[-1]))
+    if len(rows) == 0:
+        print(f"The latest benchmark run {runs[-1]} has no results (yet)")
+        sys.exit()
+    rows.sort(key=lambda r: (r["driver"], str(r["batch_size"]).zfill(12)))
+    with open(os.path.join(bench_dir, runs[-1], "summary.json"), 'w+') as f:
+        json.dump(rows, f, indent=2)
+    # The project index reads the benchmark results in turn
+    from finn_on_n2.projects import refresh_projects
+    refresh_projects([params[0]])
+
+    baseline_file = os.path.join(bench_dir, "baseline.json")
+    baseline = read_json(baseline_file)
+    if baseline is not None:
+        flag_regressions(rows, baseline["results"])
+    print(f"Benchmark {runs[-1]}" + (f" compared to baseline {baseline['run']}:" if baseline is not None else " (no baseline set):"))
+    print_table(rows, ["driver", "batch_size", "runs", "median_throughput", "p10_throughput", "median_batch_ms", "p90_batch_ms", "p99_batch_ms", "median_latency_ms", "p90_latency_ms", "p99_latency_ms"] + (["vs_baseline"] if baseline is not None else []))
+
+    if len(params) == 2:
+        with open(baseline_file, 'w+') as f:
+            json.dump({"run": runs[-1], "results": rows}, f, indent=2)
+        print(f"Stored {runs[-1]} as new baseline")
+    elif any("REGRESSION" in r.get("vs_baseline", "") for r in rows):
+        print(f"\nPerformance regressed by more than {settings.bench_regression_tolerance:.0%} compared to the baseline!")
+        return False
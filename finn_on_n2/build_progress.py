@@ -0,0 +1,143 @@
+# doit progress only reads what was appended to the build logs since its last call (the offsets are kept in .progress.json).
+# The time spent in the current step is compared with the same step in earlier builds of the project or of similar models
+
+import os
+import json
+import re
+import glob
+import statistics
+import time
+from typing import Any
+
+from finn_on_n2.common import ProjectName, format_duration, print_table, read_json
+from finn_on_n2.config import settings
+from finn_on_n2.jobs import job_is_active, job_projects, poll_jobs, read_jobs
+from finn_on_n2.sizing import similar_runs
+
+
+PROGRESS_FILE = ".progress.json"
+PROGRESS_MARKER_PATTERN = r"finn-on-n2: step (\S+) started at ([0-9]+)"
+FINN_STEP_PATTERN = r"Running step: (\S+) \[([0-9]+)/([0-9]+)\]"
+ARRAY_TASK_PATTERN = r"Array task [0-9]+ builds (\S+)"
+
+
+def read_new_log_lines(log: str, state: dict[str, Any]) -> list[str]:
+    """Complete lines appended to the log since the last call. The offset is kept in state"""
+    try:
+        size = os.path.getsize(log)
+    except OSError:
+        return []
+    if size < state.get("offset", 0):
+        state.clear()
+    with open(log, 'rb') as f:
+        f.seek(state.get("offset", 0))
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    state["offset"] = state.get("offset", 0) + end
+    return data[:end].decode(errors="replace").splitlines()
+
+
+def update_progress(state: dict[str, Any], lines: list[str]) -> list[str]:
+    """Track the current step of a build from its log lines. Returns the steps that started"""
+    started = []
+    for line in lines:
+        finn_match = re.search(FINN_STEP_PATTERN, line)
+        marker_match = re.search(PROGRESS_MARKER_PATTERN, line)
+        array_match = re.search(ARRAY_TASK_PATTERN, line)
+        if array_match is not None:
+            state["build"] = os.path.relpath(array_match.group(1))
+        if finn_match is not None:
+            state.update({"step": finn_match.group(1), "index": int(finn_match.group(2)), "total": int(finn_match.group(3)), "started": time.time(), "warned": False})
+            started.append(finn_match.group(1))
+        elif marker_match is not None:
+            # Printed by the build script right after FINN's own line, with the actual start time. Older FINN versions only print this one
+            if state.get("step") != marker_match.group(1):
+                state.update({"step": marker_match.group(1), "index": None, "total": None, "warned": False})
+                started.append(marker_match.group(1))
+            state["started"] = float(marker_match.group(2))
+    return started
+
+
+def step_history(project: ProjectName) -> tuple[dict[str, float], list[str]]:
+    """Median duration of every step in recent similar builds, and the order of the steps of the longest of them"""
+    runs = similar_runs(project)[0][-settings.progress_history:]
+    durations: dict[str, list[float]] = {}
+    for run in runs:
+        for record in run:
+            durations.setdefault(record["step"], []).append(record["wall_s"])
+    order = [record["step"] for record in max(runs, key=len)] if len(runs) > 0 else []
+    return {step: statistics.median(values) for step, values in durations.items()}, order
+
+
+def progress_row(build: str, job: dict[str, Any], state: dict[str, Any], history: tuple[dict[str, float], list[str]]) -> dict[str, Any]:
+    usual, order = history
+    step = state.get("step")
+    elapsed = time.time() - state["started"] if step is not None else None
+    typical = usual.get(step) if step is not None else None
+    eta = None
+    if step in order and elapsed is not None and typical is not None:
+        eta = max(0.0, typical - elapsed) + sum(usual[s] for s in order[order.index(step) + 1:])
+    stalled = elapsed is not None and typical is not None and elapsed > typical * settings.progress_stall_factor and elapsed - typical > settings.progress_stall_min_minutes * 60
+    return {
+        "build": build,
+        "job": job["id"],
+        "step": step or "-",
+        "n": f"{state['index']}/{state['total']}" if state.get("index") is not None else "-",
+        "in_step": format_duration(elapsed),
+        "usual": format_duration(typical),
+        "eta": format_duration(eta),
+        "state": "STALLED" if stalled else job["state"].lower(),
+    }
+
+
+def progress(params: list[str]):
+    import asyncio
+    follow = "follow" in params
+    projects = job_projects([p for p in params if p != "follow"])
+    states = read_json(PROGRESS_FILE) or {}
+    histories: dict[str, tuple[dict[str, float], list[str]]] = {}
+    first = True
+    while True:
+        asyncio.run(poll_jobs(projects))
+        rows = []
+        seen = set()
+        for project in projects:
+            for job in read_jobs(project):
+                if not job_is_active(job) or job["command"][0] != settings.finn_build_script:
+                    continue
+                # The tasks of a job array (sweeps) write one log each
+                for log in sorted(glob.glob(job["log"])) if "*" in job["log"] else [job["log"]]:
+                    seen.add(log)
+                    state = states.setdefault(log, {})
+                    state["project"] = project
+                    catching_up = "offset" not in state
+                    started = update_progress(state, read_new_log_lines(log, state))
+                    if project not in histories.keys():
+                        histories[project] = step_history(project)
+                    row = progress_row(state.get("build", project), job, state, histories[project])
+                    rows.append(row)
+                    if follow and not first and not catching_up and len(started) > 0:
+                        print(f"{time.strftime('%H:%M:%S')} {row['build']}: {row['step']} started" + (f" ({row['n']})" if row["n"] != "-" else "") + (f", ETA {row['eta']}" if row["eta"] != "-" else ""))
+                    if row["state"] == "STALLED" and not state.get("warned", False):
+                        if follow and not first:
+                            print(f"{time.strftime('%H:%M:%S')} {row['build']}: {row['step']} is STALLED, running for {row['in_step']} instead of the usual {row['usual']} (log: {log})")
+                        state["warned"] = True
+
+        # Logs of builds that finished are forgotten
+        states = {log: state for log, state in states.items() if log in seen or state.get("project") not in projects}
+        with open(PROGRESS_FILE + ".tmp", 'w+') as f:
+            json.dump(states, f)
+        os.replace(PROGRESS_FILE + ".tmp", PROGRESS_FILE)
+
+        if len(rows) == 0:
+            print("No running builds" if first else "All builds finished")
+            return
+        if first:
+            print_table(rows, ["build", "job", "step", "n", "in_step", "usual", "eta", "state"])
+            stalled = len([r for r in rows if r["state"] == "STALLED"])
+            if stalled > 0:
+                print(f"\n{stalled} builds take far longer than usual in their current step")
+        if not follow:
+            return
+        first = False
+        time.sleep(settings.progress_refresh_interval)
@@ -0,0 +1,81 @@
+# doit worker start runs one long-lived FINN container on this host, see build_scripts/finn_worker.py. The build scripts
+# hand their builds to it and only start a container of their own if no worker is up. Every host has a spool directory
+
+import subprocess
+import os
+import time
+from typing import Optional
+
+from finn_on_n2.common import format_duration, read_json
+from finn_on_n2.config import prepare_build_environment, settings
+
+
+WORKER_SCRIPT = os.path.join("build_scripts", "finn_worker.py")
+# As in finn_worker.py
+WORKER_HEARTBEAT_TIMEOUT = 30
+
+
+def worker_spool() -> str:
+    import socket
+    return os.path.join(settings.worker_dir, socket.gethostname())
+
+
+def read_worker_info() -> Optional[dict]:
+    """The state of the worker of this host, if it is up"""
+    info = read_json(os.path.join(worker_spool(), "worker.json"))
+    if info is None or time.time() - info["heartbeat"] > WORKER_HEARTBEAT_TIMEOUT:
+        return None
+    return info
+
+
+def worker_slots() -> int:
+    info = read_worker_info()
+    return info["concurrency"] if info is not None and not info["stopping"] else 1
+
+
+def print_worker_status(info: dict):
+    queued = [f for f in os.listdir(os.path.join(worker_spool(), "queue")) if f.endswith(".json")]
+    print(f"Worker on {info['host']} (pid {info['pid']}) is up for {format_duration(time.time() - info['started'])}, building with {info['finn_dir']}")
+    print(f"{len(info['running'])} of {info['concurrency']} builds running, {len(queued)} queued" + (". Stops after the running builds" if info["stopping"] else ""))
+    for request_id in info["running"]:
+        request = read_json(os.path.join(worker_spool(), "running", request_id + ".json"))
+        if request is not None:
+            print(f"  {request_id}: {os.path.relpath(request['project'])}")
+
+
+def worker(params: list[str]):
+    command = params[0] if len(params) > 0 else "status"
+    info = read_worker_info()
+    spool = worker_spool()
+    if command == "start":
+        if info is not None:
+            print(f"A worker already runs on {info['host']}. Stop it first to change its concurrency or FINN version")
+            return
+        concurrency = int(params[1]) if len(params) > 1 else settings.worker_concurrency
+        prepare_build_environment()
+        os.makedirs(spool, exist_ok=True)
+        # Always runs on this host, also where builds are submitted to SLURM. Start it inside an allocation there
+        with open(os.path.join(spool, "worker.log"), 'a') as log:
+            process = subprocess.Popen(["bash", settings.finn_build_script, "--worker", str(concurrency)], stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True)
+        print(f"Starting the worker container with {concurrency} concurrent builds. Its output is written to {os.path.join(spool, 'worker.log')}")
+        while read_worker_info() is None:
+            if process.poll() is not None:
+                print(f"Error: The worker exited with code {process.returncode}. See {os.path.join(spool, 'worker.log')}")
+                return False
+            time.sleep(1)
+        print("Worker is up. Builds on this host use it until doit worker stop")
+    elif command == "stop":
+        if info is None:
+            print("No worker runs on this host")
+            return
+        with open(os.path.join(spool, "stop"), 'w+'):
+            pass
+        print(f"The worker exits after its {len(info['running'])} running builds. Queued builds run without it")
+    elif command == "status":
+        if info is None:
+            print("No worker runs on this host. Builds start a container each")
+            return
+        print_worker_status(info)
+    else:
+        print("Usage: doit worker [start [<concurrency>] | stop | status]")
+        return False
@@ -0,0 +1,182 @@
+# Submitting builds of projects, and the actions of the build, resume and chain tasks and of the project task graph.
+# With [build.stages] enabled, a build is submitted as one job per stage. Every stage resumes from the checkpoint of the
+# previous one and stops after its last step, so each can ask SLURM for only the partition, CPUs, memory and time it needs
+
+import sys
+import os
+import time
+from typing import Any, Optional
+from doit.task import Task
+
+from finn_on_n2.common import BITFILE, ONNXFilePath, ProjectName, check_params, read_json, run_git
+from finn_on_n2.config import finn_tmp_dir, get_config_hash, prepare_build_environment, settings
+from finn_on_n2.jobs import follow_jobs, get_scheduler, job_is_active, read_jobs, submit_job
+from finn_on_n2.bench import submit_bench
+from finn_on_n2.sizing import build_resource_args
+
+
+def submit_build(project: ProjectName) -> Optional[str]:
+    """Submit the whole build of the project, as chained stage jobs if configured. Returns the id of the (last) job"""
+    # TODO: This is a workaround. As soon as custom argument passes are possible, deprecate the use of env variables
+    script_args = [settings.finn_build_script, os.path.abspath(project)]
+    if not settings.build_stages_enabled or len(settings.build_stages) == 0 or get_scheduler().name != "slurm":
+        return submit_job(project, "build", script_args, sbatch_args=build_resource_args(project), env={"BUILD_FLOW_RESUME_STEP": "", "BUILD_FLOW_STOP_STEP": ""})
+
+    job_id = None
+    after_step = ""
+    for stage, stage_config in settings.build_stages.items():
+        last_step = stage_config.get("last_step", "")
+        # Explicit arguments of the stage come last and win over those sized from earlier builds
+        sbatch_args = build_resource_args(project, (after_step, last_step)) + stage_config.get("sbatch_args", [])
+        # Later stages resume explicitly after the last step of the previous one. The implicit checkpoint is ignored with
+        # BUILD_FLOW_NO_CACHE=1, and when the stages build in different directories (ramdisk or not). The checkpoint
+        # only exists once the previous stage ran, so the build template checks that it can be resumed from
+        env = {"BUILD_FLOW_RESUME_STEP": after_step, "BUILD_FLOW_STOP_STEP": last_step}
+        job_id = submit_job(project, "build", script_args, sbatch_args=sbatch_args, after=[job_id] if job_id is not None else [], stage=stage, env=env)
+        if job_id is None:
+            break
+        after_step = last_step
+        if last_step == "":
+            break
+    return job_id
+
+
+def run_synth_for_onnx_name(params: list[str]):
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    check_params(params)
+    name: ONNXFilePath = params[0]
+    if not os.path.isdir(name):
+        print("Error: Project directory " + name + " doesn't exist!")
+        sys.exit()
+
+    prepare_build_environment()
+    if submit_build(name) is None:
+        return False
+
+
+def resume_error(pdir: str, step: str, checkpoint: Optional[dict]) -> Optional[str]:
+    """Why the build cannot continue after the given step, checked before submitting. The build checks it again once it runs"""
+    if not os.path.isfile(os.path.join(pdir, "out_dir", "intermediate_models", step + ".onnx")):
+        return f"The flow did not reach {step} yet"
+    if checkpoint is None or checkpoint.get("step") != step:
+        return None
+    # The job stages the entries from the normal FINN_TMP into the ramdisk if it builds there
+    missing = [ref for ref in checkpoint.get("refs", []) if not os.path.exists(os.path.join(finn_tmp_dir(), ref))]
+    if len(missing) > 0:
+        return f"{len(missing)} FINN_TMP entries of its model are missing from {finn_tmp_dir()}, e.g. {missing[0]}. It was built in {checkpoint.get('build_dir')}" + (", was it not written back from the ramdisk?" if checkpoint.get("build_dir") != finn_tmp_dir() else "")
+    return None
+
+
+def run_synth_for_onnx_name_from_step(params: list[str]):
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    if len(params) not in [1, 2]:
+        print("Usage: doit resume <project-name> [step-name]")
+        sys.exit()
+    pdir = os.path.join(".", params[0])
+    step = params[1] if len(params) == 2 else ""
+    if not os.path.isdir(pdir):
+        print("Error: Project directory " + pdir + " doesnt exist!")
+        sys.exit()
+
+    checkpoint = read_json(os.path.join(pdir, "out_dir", "checkpoint.json"))
+    if step == "":
+        if checkpoint is None:
+            print(f"No checkpoint found for {params[0]}. The flow will start from the beginning or the last cached step")
+        else:
+            print(f"Resuming {params[0]} after {checkpoint['step']}")
+    else:
+        error = resume_error(pdir, step, checkpoint)
+        if error is not None:
+            print(f"Error: Cannot resume {params[0]} after {step}. {error}")
+            return False
+
+    prepare_build_environment()
+    # TODO: This is a workaround. As soon as custom argument passes are possible, deprecate the use of env variables
+    os.environ["BUILD_FLOW_RESUME_STEP"] = step
+    if submit_job(params[0], "resume", [settings.finn_build_script, os.path.abspath(pdir)], sbatch_args=build_resource_args(params[0])) is None:
+        return False
+
+
+def chain(params: list[str]):
+    if len(params) not in [1, 2] or (len(params) == 2 and params[1] not in ["bench", "pythondriver"]):
+        print("Usage: doit chain <project> [bench|pythondriver]")
+        sys.exit()
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    name = params[0]
+    follow_up = params[1] if len(params) == 2 else "bench"
+    if not os.path.isdir(name):
+        print("Error: Project directory " + name + " doesn't exist!")
+        sys.exit()
+    run_script = settings.bench_run_script if follow_up == "bench" else settings.pythondriver_run_script
+    if run_script == "":
+        print(f"No {follow_up} script configured for the {settings.environment} environment")
+        sys.exit()
+
+    prepare_build_environment()
+    build_id = submit_build(name)
+    if build_id is None:
+        return False
+
+    # The build writes its outputs to out_dir in the project (DEFAULT_OUT_DIR of the build template)
+    driver_dir = os.path.join(os.path.abspath(name), "out_dir", "deploy", "driver")
+    if follow_up == "bench":
+        result_dir = os.path.join(os.path.abspath(name), "bench", time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(result_dir, exist_ok=True)
+        script_args = [run_script, driver_dir, "-", result_dir, ",".join(str(b) for b in settings.bench_batch_sizes), str(settings.bench_repetitions)]
+    else:
+        script_args = [run_script, driver_dir]
+    if submit_job(name, follow_up, script_args, after=[build_id]) is None:
+        return False
+    print(f"Use doit wait {name} to follow both jobs")
+
+
+def build_inputs() -> dict[str, Optional[str]]:
+    """Build inputs that are only known once config.toml was read, so doit cannot track them as file_dep"""
+    return {
+        "finn_commit": run_git(["-C", "finn", "rev-parse", "HEAD"]),
+        "build_script": get_config_hash([settings.finn_build_script]),
+    }
+
+
+def build_inputs_unchanged(task: Task, values: dict[str, Any]) -> bool:
+    return all(values.get(key) == value for key, value in build_inputs().items())
+
+
+def wait_for_job(project: ProjectName, job_id: str) -> bool:
+    import asyncio
+    return asyncio.run(follow_jobs([project], [job_id]))
+
+
+def build(name: ProjectName):
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    # A build started by doit execute or an earlier doit build is awaited instead of started again
+    active = [j for j in read_jobs(name) if j["kind"] in ["build", "resume"] and job_is_active(j)]
+    if len(active) > 0:
+        job_id = active[-1]["id"]
+        print(f"{name} is already being built by job {job_id}, waiting for it")
+    else:
+        prepare_build_environment()
+        job_id = submit_build(name)
+        if job_id is None:
+            return False
+    if not wait_for_job(name, job_id):
+        return False
+    if not os.path.isfile(os.path.join(name, BITFILE)):
+        print(f"The build of {name} finished without writing {BITFILE}")
+        return False
+    # Stored by doit and compared by build_inputs_unchanged on the next run
+    return build_inputs()
+
+
+def benchmark(name: ProjectName):
+    job_id = submit_bench(name)
+    if job_id is None or not wait_for_job(name, job_id):
+        return False
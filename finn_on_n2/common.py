@@ -0,0 +1,196 @@
+# Helpers shared by the tasks of dodo.py. They only depend on the standard library
+
+import subprocess
+import sys
+import os
+import shutil
+import hashlib
+import json
+import csv
+import re
+import ast
+from typing import Any, Optional
+
+
+ONNXFilePath = str
+ProjectName = str
+# The bitfile of a finished build, relative to the project (DEFAULT_OUT_DIR of the build template)
+BITFILE = os.path.join("out_dir", "deploy", "bitfile", "finn-accel.xclbin")
+
+
+def execute_in_finn(command_list: list[str]):
+    subprocess.run(command_list, cwd="finn")
+
+
+def execute_here(command_list: list[str]):
+    subprocess.run(command_list)
+
+
+def read_from_file(fname: str, binary: bool = False) -> Optional[str]:
+    try:
+        with open(fname, 'r' if not binary else 'rb') as f:
+            return f.read()
+    except:
+        return None
+
+
+def read_json(fname: str) -> Optional[dict]:
+    text = read_from_file(fname)
+    if text is None:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def expand_workdir(path: str) -> str:
+    """Resolve $WORKING_DIR and other environment variables of paths in config.toml"""
+    return os.path.abspath(os.path.expanduser(os.path.expandvars(path.replace("$WORKING_DIR", os.getcwd()))))
+
+
+def check_params(params: list[str]):
+    if len(params) > 1:
+        print("Received more than argument, please only supply one!")
+        sys.exit()
+    if len(params) == 0:
+        print("Please supply the required argument for this function!")
+        sys.exit()
+
+
+def run_git(args: list[str]) -> Optional[str]:
+    result = subprocess.run(["git"] + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def read_build_results(out_dir: str) -> dict[str, Any]:
+    """Collect the numbers FINN writes to the report directory of a build into one flat dictionary"""
+    results: dict[str, Any] = {}
+    report_dir = os.path.join(out_dir, "report")
+
+    performance = read_json(os.path.join(report_dir, "estimate_network_performance.json"))
+    if performance is not None:
+        results["est_fps"] = performance.get("estimated_throughput_fps")
+        results["est_latency_ns"] = performance.get("estimated_latency_ns")
+        results["critical_path_cycles"] = performance.get("critical_path_cycles")
+
+    resources = read_json(os.path.join(report_dir, "estimate_layer_resources.json"))
+    if resources is not None and "total" in resources.keys():
+        for resource in ["LUT", "BRAM_18K", "URAM", "DSP"]:
+            results[f"est_{resource}"] = resources["total"].get(resource)
+
+    synthesis = read_json(os.path.join(report_dir, "ooc_synth_and_timing.json"))
+    if synthesis is not None:
+        for key in ["LUT", "FF", "BRAM", "URAM", "DSP", "fmax_mhz"]:
+            results[f"synth_{key}"] = synthesis.get(key)
+
+    rtlsim = read_json(os.path.join(report_dir, "rtlsim_performance.json"))
+    if rtlsim is not None:
+        results["rtlsim_fps"] = rtlsim.get("throughput[images/s]")
+        results["rtlsim_latency_cycles"] = rtlsim.get("latency_cycles")
+
+    time_per_step = read_json(os.path.join(out_dir, "time_per_step.json"))
+    if time_per_step is not None:
+        results["build_time_s"] = sum(time_per_step.values())
+
+    results["bitfile"] = os.path.isfile(os.path.join(out_dir, "bitfile", "finn-accel.xclbin"))
+    return results
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return "-"
+    if type(value) == float:
+        return f"{value:.6g}"
+    return str(value)
+
+
+def print_table(rows: list[dict[str, Any]], columns: list[str]):
+    cells = [[format_value(row.get(c)) for c in columns] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def write_csv(fname: str, rows: list[dict[str, Any]], columns: list[str]):
+    with open(fname, 'w+', newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    minutes = int(seconds) // 60
+    return f"{minutes // 60}h{minutes % 60:02d}m" if minutes >= 60 else f"{minutes}m{int(seconds) % 60:02d}s"
+
+
+def set_build_constant(buildscript: str, name: str, value: Any) -> Optional[str]:
+    """Replace the value of a top level constant (for example DEFAULT_TARGET_FPS) in a build.py. Returns None if the constant does not exist"""
+    pattern = re.compile(rf"^({re.escape(name)}\s*:[^=\n]*=\s*).*$", re.MULTILINE)
+    if pattern.search(buildscript) is None:
+        return None
+    return pattern.sub(lambda m: m.group(1) + repr(value), buildscript, count=1)
+
+
+def copy_project_files(project: str, buildscript: str, dest_dir: str):
+    """Copy the files that constants of the build.py name relative to the project (like the folding_config.json written by
+    doit search), so that the build.py also finds them in dest_dir"""
+    for match in re.finditer(r"^[A-Z_]+\s*:[^=\n]*=\s*(['\"])([^'\"\n]+)\1", buildscript, re.MULTILINE):
+        fname = match.group(2)
+        if not os.path.isabs(fname) and os.path.isfile(os.path.join(project, fname)):
+            os.makedirs(os.path.dirname(os.path.join(dest_dir, fname)), exist_ok=True)
+            shutil.copyfile(os.path.join(project, fname), os.path.join(dest_dir, fname))
+
+
+def find_output_dir(project: ProjectName) -> Optional[str]:
+    output_dirs = sorted([x for x in os.listdir(project) if x.startswith("out_")])
+    if len(output_dirs) == 0:
+        return None
+    return os.path.join(os.path.abspath(project), output_dirs[0])
+
+
+def find_cpp_driver_dir(out_dir: str) -> Optional[str]:
+    for root, dirs, files in os.walk(out_dir):
+        dirs[:] = [d for d in dirs if d not in ["intermediate_models", "stitched_ip", "report"]]
+        if "finn" in files and "cppdconfig.json" in files:
+            return root
+    return None
+
+
+def get_build_constant(buildscript: str, name: str) -> Any:
+    match = re.search(rf"^{re.escape(name)}\s*:[^=\n]*=\s*(.*)$", buildscript, re.MULTILINE)
+    if match is None:
+        return None
+    try:
+        return ast.literal_eval(match.group(1).split("#")[0].strip())
+    except (ValueError, SyntaxError):
+        return None
+
+
+def disk_usage(path: str) -> int:
+    size = 0
+    stack = [path]
+    while len(stack) > 0:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_blocks * 512
+        except OSError:
+            continue
+    return size
+
+
+def file_digest(fname: str) -> str:
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
@@ -0,0 +1,331 @@
+# Settings from config.toml, the build scripts instantiated from them and the environment of the builds
+
+import subprocess
+import sys
+import os
+import shlex
+import hashlib
+import json
+import threading
+from typing import Any, Optional
+from types import SimpleNamespace
+import toml
+
+from finn_on_n2.common import expand_workdir, read_from_file, read_json
+
+
+# config.toml is only read once an action needs it. Every doit call (including doit list and tab completion) loads
+# dodo.py, which has to stay fast on network filesystems
+_settings: Optional[SimpleNamespace] = None
+
+
+def load_settings() -> SimpleNamespace:
+    global _settings
+    if _settings is not None:
+        return _settings
+
+    config = None
+    try:
+        with open("config.toml", "r") as f:
+            config = toml.loads(f.read())
+    except OSError:
+        print("ERROR: No config file found!")
+        sys.exit()
+    except toml.TomlDecodeError:
+        config = None
+    if config is None:
+        print("Failed to read config file! Check for syntax errors!")
+        sys.exit()
+
+    s = SimpleNamespace()
+    s.config = config
+    s.environment = config["general"]["used_environment"]
+    s.dev_mode = config["general"]["dev_mode"]
+    s.singularity_image = config["general"]["singularity_image"]
+    s.driver_required_commands = config["environment"][s.environment]["driver_compiler_prefix_commands"]
+    s.job_exec_prefix = config["environment"][s.environment]["job_execution"]
+
+    s.finn_build_script = config["environment"][s.environment]["finn_build_script"]
+    s.finn_build_script_template = config["environment"][s.environment]["finn_build_script_template"]
+    s.cppdriver_run_script = config["environment"][s.environment]["cppdriver_run_script"]
+    s.pythondriver_run_script = config["environment"][s.environment]["pythondriver_run_script"]
+    s.bench_run_script = config["environment"][s.environment].get("bench_run_script", "")
+
+    s.finn_repos = config["finn"]["repositories"]
+    s.finn_default_repo_name = config["finn"]["default_repository"]
+    s.finn_default_repo = s.finn_repos[s.finn_default_repo_name]
+    s.finn_default_branch = config["finn"]["default_branch"]
+    if "default_commit_hash" in config["finn"].keys():
+        s.finn_default_commit = config["finn"]["default_commit_hash"]
+    else:
+        s.finn_default_commit = ""
+    s.finn_build_template = config["finn"]["build_template"]
+    s.finn_mirror_dir = expand_workdir(config["finn"].get("mirror_dir", "$WORKING_DIR/FINN_MIRROR"))
+    s.finn_checkouts_dir = expand_workdir(config["finn"].get("checkouts_dir", "$WORKING_DIR/finn_versions"))
+
+    s.config_envvars = config["build"]["envvars"]
+    s.build_max_requeues = config["build"].get("max_requeues", 0)
+    s.ramdisk_config = config["build"].get("ramdisk", {})
+
+    #* Sweep configuration
+    if "sweep" in config.keys() and "max_concurrent_jobs" in config["sweep"].keys():
+        s.sweep_max_concurrent_jobs = config["sweep"]["max_concurrent_jobs"]
+    else:
+        s.sweep_max_concurrent_jobs = 4
+
+    #* Job tracking configuration
+    jobs_config = config.get("jobs", {})
+    s.job_scheduler = jobs_config.get("scheduler", "auto")
+    s.job_poll_interval = jobs_config.get("poll_interval", 60)
+
+    #* Build progress
+    progress_config = config.get("progress", {})
+    s.progress_refresh_interval = progress_config.get("refresh_interval", 30)
+    s.progress_history = progress_config.get("history", 10)
+    s.progress_stall_factor = progress_config.get("stall_factor", 3.0)
+    s.progress_stall_min_minutes = progress_config.get("stall_min_minutes", 20)
+
+    #* Build worker
+    worker_config = config.get("worker", {})
+    s.worker_dir = expand_workdir(worker_config.get("directory", "$WORKING_DIR/.workers"))
+    s.worker_concurrency = worker_config.get("concurrency", 2)
+
+    #* Sizing of build jobs
+    s.resource_config = config["build"].get("resources", {})
+
+    #* Builds split into stage jobs
+    stages_config = config["build"].get("stages", {})
+    s.build_stages_enabled = stages_config.get("enabled", False)
+    s.build_stages = {name: stage for name, stage in stages_config.items() if isinstance(stage, dict)}
+
+    #* Estimate-only builds
+    estimate_config = config.get("estimate", {})
+    s.estimate_local_workers = estimate_config.get("local_workers", 0)
+    s.estimate_sbatch_args = estimate_config.get("sbatch_args", [])
+
+    #* Target FPS search
+    search_config = config.get("search", {})
+    s.search_max_utilization = search_config.get("max_utilization", 0.7)
+    s.search_tolerance = search_config.get("tolerance", 0.1)
+    s.search_max_target_fps = search_config.get("max_target_fps", 100_000_000)
+    s.board_resources = config.get("boards", {})
+
+    #* FINN_TMP garbage collection
+    gc_config = config.get("gc", {})
+    s.gc_max_size_gb = gc_config.get("max_size_gb", 1000)
+    s.gc_min_age_hours = gc_config.get("min_age_hours", 24)
+
+    #* Comparison of FINN commits
+    compare_config = config.get("compare", {})
+    s.compare_models = compare_config.get("models", [])
+    s.compare_stop_step = compare_config.get("stop_step", "step_out_of_context_synthesis")
+    s.compare_sbatch_args = compare_config.get("sbatch_args", [])
+
+    #* Deduplicating artifact store and archives
+    store_config = config.get("store", {})
+    s.store_dir = expand_workdir(store_config.get("directory", "$WORKING_DIR/ARTIFACT_STORE"))
+    s.store_min_size_kb = store_config.get("min_size_kb", 64)
+    s.archive_dir = expand_workdir(store_config.get("archive_dir", "$WORKING_DIR/ARCHIVE"))
+    s.archive_after_days = store_config.get("archive_after_days", 30)
+
+    #* Streaming driver runs
+    s.driver_stream_batch_size = config.get("driver", {}).get("stream_batch_size", 1000)
+
+    #* Driver benchmark configuration
+    bench_config = config.get("bench", {})
+    s.bench_batch_sizes = bench_config.get("batch_sizes", [10000])
+    s.bench_repetitions = bench_config.get("repetitions", 5)
+    s.bench_regression_tolerance = bench_config.get("regression_tolerance", 0.05)
+
+    _settings = s
+    return s
+
+
+def reload_settings():
+    global _settings
+    _settings = None
+
+
+class LazySettings:
+    def __getattr__(self, name: str) -> Any:
+        return getattr(load_settings(), name)
+
+
+settings = LazySettings()
+
+
+#* Detect changes of the configuration
+# .info stores a hash of config.toml and the build script template together with their modification times.
+# As long as the modification times match, nothing needs to be read or hashed
+def get_config_hash(fnames: list[str]) -> str:
+    h = hashlib.sha256()
+    for fname in fnames:
+        content = read_from_file(fname, binary=True)
+        if content is None:
+            print(f"Cannot create hash of non existing file {fname}!")
+            sys.exit()
+        h.update(content)
+    return h.hexdigest()
+
+
+def file_stamps(fnames: list[str]) -> dict[str, list[int]]:
+    stamps = {}
+    for fname in fnames:
+        if os.path.isfile(fname):
+            stat = os.stat(fname)
+            stamps[fname] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def write_config_hash():
+    fnames = ["config.toml", settings.finn_build_script_template]
+    with open(".info", 'w+') as f:
+        json.dump({"hash": get_config_hash(fnames), "stamps": file_stamps(fnames)}, f)
+
+
+def check_config_outdated() -> bool:
+    if not os.path.isfile("config.toml"):
+        print("ERROR: No config file found!")
+        sys.exit()
+    info = read_json(".info")
+    if info is None or "stamps" not in info.keys() or not os.path.isfile(settings.finn_build_script):
+        return True
+    if file_stamps(list(info["stamps"].keys())) == info["stamps"] and "config.toml" in info["stamps"].keys():
+        return False
+
+    # Files were touched, check whether their content really changed
+    fnames = ["config.toml", settings.finn_build_script_template]
+    if get_config_hash(fnames) != info["hash"]:
+        return True
+    write_config_hash()
+    return False
+
+
+def check_singularity():
+    """Return whether singularity is mentioned in the run_docker script"""
+    if not os.path.isfile(os.path.join("finn", "run-docker.sh")):
+        print("Setup not configured correctly. finn is either not installed or finn/run-docker.sh is specifically missing! Run doit once to clone FINN.")
+        #sys.exit()
+        return True # TODO: Fix more permanently
+    with open(os.path.join("finn", "run-docker.sh"), 'r') as f:
+        text = f.read()
+        return ("singularity" in text) or ("SINGULARITY" in text)
+
+
+#* Function for updating build scripts based on a configuration file
+def instantiate_buildscripts():
+    finn_build_script_template = settings.finn_build_script_template
+    config_envvars = settings.config_envvars
+    ramdisk_config = settings.ramdisk_config
+
+    # Read template file
+    text = ""
+    if not os.path.isfile(finn_build_script_template):
+        print("The template file for the FINN build shell script could not be found!")
+        sys.exit()
+
+    with open(finn_build_script_template, 'r') as f:
+        text = f.read()
+    
+    # Insert variables
+    text = text.replace("<FINN_WORKDIR>", os.path.abspath(os.getcwd()))
+    vars = ""
+    for envvar_name, envvar_value in config_envvars.items():
+        vars += f"export {envvar_name}=\"{envvar_value}\"\n"
+    text = text.replace("<SET_ENVVARS>", vars)
+    text = text.replace("<MAX_REQUEUES>", str(settings.build_max_requeues))
+    text = text.replace("<RAMDISK_ENABLED>", "true" if ramdisk_config.get("enabled", False) else "false")
+    text = text.replace("<RAMDISK_DIR>", ramdisk_config.get("directory", "/dev/shm/finn_$USER"))
+    text = text.replace("<RAMDISK_HEADROOM_GB>", str(ramdisk_config.get("headroom_gb", 64)))
+    text = text.replace("<RAMDISK_SYNC_INTERVAL>", str(ramdisk_config.get("sync_interval", 900)))
+    text = text.replace("<WORKER_DIR>", settings.worker_dir)
+
+    # Check for toolchain path
+    if "VIVADO_PATH" not in config_envvars.keys() or ("VIVADO_PATH" in config_envvars.keys() and config_envvars["VIVADO_PATH"] == ""):
+        print("WARNING: VIVADO_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
+    if "VITIS_PATH" not in config_envvars.keys() or ("VITIS_PATH" in config_envvars.keys() and config_envvars["VITIS_PATH"] == ""):
+        print("WARNING: VITIS_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
+    if "HLS_PATH" not in config_envvars.keys() or ("HLS_PATH" in config_envvars.keys() and config_envvars["HLS_PATH"] == ""):
+        print("WARNING: HLS_PATH not set and not provided in config.toml. This needs to be set to ensure working toolchains. Either set the path in config.toml or supply it otherwise to the container!") 
+    if "VIVADO_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["VIVADO_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
+        print("WARNING: The paths or versions of FINN_XILINX_PATH and VIVADO_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
+    if "VITIS_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["VITIS_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
+        print("WARNING: The paths or versions of FINN_XILINX_PATH and VITIS_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
+    if "HLS_PATH" in config_envvars.keys() and "FINN_XILINX_PATH" in config_envvars.keys() and not config_envvars["HLS_PATH"].startswith(config_envvars["FINN_XILINX_PATH"]):
+        print("WARNING: The paths or versions of FINN_XILINX_PATH and HLS_PATH don't match. This will cause failure when using the toolchains. Fix this in config.toml!")
+    # TODO: Make checks for versions as well
+
+    # Write back out
+    with open(settings.finn_build_script, 'w+') as f:
+        f.write(text)
+    write_config_hash()
+
+
+#* Prepare everything a build needs, once per doit call
+# With doit -n the project tasks call this from several threads. The others wait until the build scripts are written
+_build_environment_ready = False
+_build_environment_lock = threading.Lock()
+
+
+def prepare_build_environment():
+    global _build_environment_ready
+    with _build_environment_lock:
+        if _build_environment_ready:
+            return
+
+        # The folder which _contains_ finn, FINN_TMP, SINGULARITY_CACHE, etc.
+        os.environ["FINN_WORKDIR"] = os.path.abspath(os.getcwd())
+
+        # The path to the GHA or Path, which builds the singularity/apptainer image
+        if settings.environment == "cluster":
+            print("Cluster environment selected: Using Singularity instead of Docker!")
+            os.environ["FINN_SINGULARITY"] = settings.singularity_image
+
+        if (settings.environment == "cluster" or ("FINN_SINGULARITY" in os.environ.keys() and os.environ["FINN_SINGULARITY"] != "")) and not check_singularity():
+            print("WARNING: You have selected the cluster environment but your run-docker.sh file does not mention singularity. If the job failes with \"docker: Command not found\" remember to patch the singularity PR into FINN before executing!")
+
+        #* Update scripts if a change in the config was detected
+        if check_config_outdated():
+            print("Detected outdated configuration. Re-instantiating build scripts now.")
+            instantiate_buildscripts()
+        _build_environment_ready = True
+
+
+#* Switch to a template configuration
+def use_config_template(names: list[str]):
+    if len(names) > 1:
+        print("More than one configuration name provided. Please only pass a single configuration name")
+        sys.exit()
+    if len(names) == 0:
+        print("Please pass a configuration name (names are the toml filenames in configurations/ without the suffix)")
+        sys.exit()
+
+    fname = names[0]
+    available_configs = [fn.replace(".toml", "") for fn in os.listdir("configurations")]
+    if fname not in available_configs:
+        print("Could not find configuration under configurations/" + fname + ".toml")
+        sys.exit()
+
+    subprocess.run(shlex.split(f"cp configurations/{fname}.toml ./config.toml"))
+    reload_settings()
+
+
+# * Setup
+def check_dev_mode():
+    # Only download the driver and its dependencies as well, if the dev mode is active, to save time for normal users
+    if settings.dev_mode:
+        print("Currently, building the C++ driver in dev mode is unsupported. Please set dev mode to false in the config.toml file!\nExiting.")
+        sys.exit()
+
+
+def config_uptodate() -> bool:
+    return not check_config_outdated()
+
+
+# Where the builds and the step cache keep their files
+def finn_tmp_dir() -> str:
+    return expand_workdir(settings.config_envvars.get("FINN_HOST_BUILD_DIR", "$WORKING_DIR/FINN_TMP"))
+
+
+def step_cache_dir() -> str:
+    return expand_workdir(settings.config_envvars.get("FINN_STEP_CACHE_DIR", "$WORKING_DIR/FINN_TMP/step_cache"))
@@ -0,0 +1,83 @@
+# doit estimate builds projects only up to the estimate reports. Their checkpoints let a later doit execute continue from there
+
+import subprocess
+import sys
+import os
+import time
+from typing import Any, Optional
+
+from finn_on_n2.common import print_table, read_build_results, read_json
+from finn_on_n2.config import prepare_build_environment, settings
+from finn_on_n2.jobs import follow_jobs, get_scheduler, read_jobs, submit_job
+from finn_on_n2.projects import refresh_projects
+
+
+ESTIMATE_STEP = "step_generate_estimate_reports"
+
+
+def bottleneck_layer(out_dir: str) -> tuple[Optional[str], Optional[int]]:
+    cycles = read_json(os.path.join(out_dir, "report", "estimate_layer_cycles.json"))
+    if cycles is None or len(cycles) == 0:
+        return None, None
+    layer = max(cycles.keys(), key=lambda name: cycles[name])
+    return layer, cycles[layer]
+
+
+def run_estimates(builds: dict[str, str]) -> dict[str, bool]:
+    """Build up to the estimate reports, in parallel, and return which succeeded. builds maps the build directories to
+    their projects, which the jobs are recorded for. A build directory is the project itself or e.g. a doit search probe"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    prepare_build_environment()
+    # Only for these builds. Builds submitted later from the same process (doit search) must run to the end
+    env = {"BUILD_FLOW_RESUME_STEP": "", "BUILD_FLOW_STOP_STEP": ESTIMATE_STEP}
+    projects = sorted(set(builds.values()))
+    if get_scheduler().name == "slurm":
+        job_ids = {}
+        for build_dir, project in builds.items():
+            kind = "estimate" if os.path.normpath(build_dir) == os.path.normpath(project) else f"estimate {os.path.relpath(build_dir, project)}"
+            job_ids[build_dir] = submit_job(project, kind, [settings.finn_build_script, os.path.abspath(build_dir)], sbatch_args=settings.estimate_sbatch_args, env=env)
+        print(f"Waiting for {len(builds)} estimate jobs")
+        asyncio.run(follow_jobs(projects, [job_id for job_id in job_ids.values() if job_id is not None]))
+        return {build_dir: any(j["id"] == job_id and j["state"] == "COMPLETED" for j in read_jobs(builds[build_dir])) for build_dir, job_id in job_ids.items()}
+
+    workers = settings.estimate_local_workers if settings.estimate_local_workers > 0 else max(1, (os.cpu_count() or 1) // 4)
+    print(f"Running {len(builds)} estimates, {workers} at a time. The output of each is written to estimate.log in its build directory")
+
+    def run(build_dir: str) -> bool:
+        with open(os.path.join(build_dir, "estimate.log"), 'w+') as log:
+            result = subprocess.run([settings.job_exec_prefix, settings.finn_build_script, os.path.abspath(build_dir)], stdout=log, stderr=subprocess.STDOUT, env={**os.environ, **env})
+        print(f"{time.strftime('%H:%M:%S')} {build_dir}: estimate " + ("done" if result.returncode == 0 else "FAILED"))
+        return result.returncode == 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(builds.keys(), pool.map(run, builds.keys())))
+    refresh_projects(projects)
+    return results
+
+
+def estimate(params: list[str]):
+    if len(params) == 0:
+        print("Usage: doit estimate <project...>")
+        sys.exit()
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    for project in params:
+        if not os.path.isdir(project):
+            print("Error: Project directory " + project + " doesn't exist!")
+            sys.exit()
+
+    succeeded = run_estimates({project: project for project in params})
+    rows = []
+    for project in params:
+        out_dir = os.path.join(project, "out_dir")
+        row: dict[str, Any] = {"project": project}
+        row.update(read_build_results(out_dir))
+        row["bottleneck"], row["bottleneck_cycles"] = bottleneck_layer(out_dir)
+        row["status"] = "ok" if succeeded[project] and row.get("est_fps") is not None else "FAILED"
+        rows.append(row)
+    rows.sort(key=lambda r: -(r.get("est_fps") or 0))
+    print_table(rows, ["project", "status", "est_fps", "est_latency_ns", "critical_path_cycles", "est_LUT", "est_BRAM_18K", "est_URAM", "est_DSP", "bottleneck", "bottleneck_cycles"])
+    if not all(succeeded.values()):
+        return False
@@ -0,0 +1,101 @@
+# doit finncompare builds the reference models of config.toml with every given FINN commit, each with its own checkout
+# from finn_versions. The builds of a model live in <model>/finncompare/<commit>, the order of the commits in compare.json
+
+import sys
+import os
+import shutil
+import json
+from typing import Any
+
+from finn_on_n2.common import ProjectName, copy_project_files, print_table, read_build_results, read_json, run_git, write_csv
+from finn_on_n2.config import prepare_build_environment, settings
+from finn_on_n2.jobs import follow_jobs, submit_job
+from finn_on_n2.metrics import read_step_metrics
+from finn_on_n2.sizing import build_resource_args, group_runs
+from finn_on_n2.finn_versions import checkout_finn
+
+
+COMPARE_COLUMNS = ["est_fps", "rtlsim_fps", "rtlsim_latency_cycles", "synth_LUT", "synth_FF", "synth_BRAM", "synth_URAM", "synth_DSP", "synth_fmax_mhz", "build_time_h"]
+# Higher is better for these, lower for all others
+COMPARE_HIGHER_IS_BETTER = ["est_fps", "rtlsim_fps", "synth_fmax_mhz"]
+
+
+def compare_results(model: ProjectName, commit: str) -> dict[str, Any]:
+    build_dir = os.path.join(model, "finncompare", commit)
+    results = read_build_results(os.path.join(build_dir, "out_dir"))
+    # Only the steps the last run executed itself are in time_per_step.json, the step records cover the whole build
+    runs = group_runs([r for r in read_step_metrics(build_dir) if r.get("finn_commit", "").startswith(commit)])
+    build_time = sum(r["wall_s"] for r in runs[-1]) if len(runs) > 0 else results.get("build_time_s")
+    return {"model": model, "commit": commit, **{c: results.get(c) for c in COMPARE_COLUMNS}, "build_time_h": build_time / 3600 if build_time is not None else None}
+
+
+def print_comparison(models: list[ProjectName]):
+    rows = []
+    for model in models:
+        manifest = read_json(os.path.join(model, "finncompare", "compare.json"))
+        if manifest is None:
+            print(f"No FINN comparison builds found for {model}")
+            continue
+        model_rows = [compare_results(model, commit) for commit in manifest["commits"]]
+        # Relative to the first commit, which is usually the one in use
+        base = model_rows[0]
+        for row in model_rows[1:]:
+            changes = []
+            for column in ["rtlsim_fps", "est_fps", "synth_LUT", "synth_BRAM", "synth_DSP", "build_time_h"]:
+                if row[column] is not None and base[column]:
+                    change = row[column] / base[column] - 1
+                    better = change > 0 if column in COMPARE_HIGHER_IS_BETTER else change < 0
+                    changes.append(f"{column} {change:+.0%}" + ("" if abs(change) < 0.01 else (" better" if better else " worse")))
+            row["vs_" + base["commit"][:7]] = ", ".join(changes) if len(changes) > 0 else "-"
+        write_csv(os.path.join(model, "finncompare", "results.csv"), model_rows, ["model", "commit"] + COMPARE_COLUMNS)
+        rows += model_rows
+    if len(rows) > 0:
+        extra = sorted(set(k for r in rows for k in r.keys() if k.startswith("vs_")))
+        print_table(rows, ["model", "commit"] + COMPARE_COLUMNS + extra)
+
+
+def compare(params: list[str]):
+    import asyncio
+    models = settings.compare_models
+    if len(models) == 0 or any(not os.path.isfile(os.path.join(m, "build.py")) or not os.path.isfile(os.path.join(m, m + ".onnx")) for m in models):
+        print("Error: Set the reference projects in the [compare] section of config.toml. Every one needs a build.py and its ONNX model")
+        sys.exit()
+    if len(params) == 0:
+        print_comparison(models)
+        return
+
+    checkouts = {}
+    for ref in params:
+        checkout = checkout_finn(ref)
+        if checkout is None:
+            return False
+        checkouts[(run_git(["-C", checkout, "rev-parse", "HEAD"]) or "")[:12]] = checkout
+
+    prepare_build_environment()
+    job_ids = []
+    for model in models:
+        compare_dir = os.path.join(model, "finncompare")
+        with open(os.path.join(model, "build.py"), 'r') as f:
+            buildscript = f.read()
+        for commit, checkout in checkouts.items():
+            build_dir = os.path.join(compare_dir, commit)
+            os.makedirs(build_dir, exist_ok=True)
+            with open(os.path.join(build_dir, "build.py"), 'w+') as f:
+                f.write(buildscript)
+            shutil.copyfile(os.path.join(model, model + ".onnx"), os.path.join(build_dir, model + ".onnx"))
+            copy_project_files(model, buildscript, build_dir)
+            # FINN_CHECKOUT is read by the build script. Set for this job only, the doit process keeps its environment
+            env = {"BUILD_FLOW_RESUME_STEP": "", "BUILD_FLOW_STOP_STEP": settings.compare_stop_step, "FINN_CHECKOUT": os.path.abspath(checkout)}
+            job_id = submit_job(model, f"finncompare {commit}", [settings.finn_build_script, os.path.abspath(build_dir)], sbatch_args=settings.compare_sbatch_args + build_resource_args(model), env=env)
+            if job_id is None:
+                return False
+            job_ids.append(job_id)
+        with open(os.path.join(compare_dir, "compare.json"), 'w+') as f:
+            json.dump({"commits": list(checkouts.keys()), "refs": params, "stop_step": settings.compare_stop_step}, f, indent=2)
+
+    print(f"Waiting for {len(job_ids)} builds. Use doit progress to see how far they are")
+    succeeded = asyncio.run(follow_jobs(models, job_ids))
+    print_comparison(models)
+    if not succeeded:
+        print("Some builds failed, their results are missing. Check their logs with doit status")
+        return False
@@ -0,0 +1,193 @@
+# FINN_TMP is indexed by its top level entries (code_gen_*, vivado_stitch_proj_*, ...). Sizes are kept in an index and
+# only recomputed for entries that changed, since walking millions of small Vivado files takes long on Lustre.
+# Last use is taken from modification times: access times are often not recorded, and scanning would update them
+
+import sys
+import os
+import shutil
+import json
+import re
+import glob
+import time
+from typing import Any
+
+from finn_on_n2.common import disk_usage, print_table, read_from_file, read_json
+from finn_on_n2.config import finn_tmp_dir, settings, step_cache_dir
+from finn_on_n2.index import indexed_projects
+from finn_on_n2.jobs import job_is_active, job_projects, poll_jobs, read_jobs
+
+
+GC_INDEX_FILE = ".gc_index.json"
+
+
+def index_finn_tmp(tmp_dir: str, index: dict[str, Any], min_age: float) -> dict[str, dict[str, Any]]:
+    """Size and modification time of every FINN_TMP entry"""
+    entries = {}
+    cache_dir = step_cache_dir()
+    now = time.time()
+    with os.scandir(tmp_dir) as it:
+        for entry in it:
+            if entry.name.startswith(".") or entry.path == cache_dir:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            cached = index.get(entry.name)
+            # Files deep inside a directory can change without touching its modification time, so recent entries are always measured
+            if cached is not None and cached["mtime_ns"] == stat.st_mtime_ns and now - stat.st_mtime > min_age:
+                size = cached["size"]
+            elif entry.is_dir(follow_symlinks=False):
+                size = disk_usage(entry.path)
+            else:
+                size = stat.st_blocks * 512
+            entries[entry.name] = {"mtime_ns": stat.st_mtime_ns, "size": size, "modified": stat.st_mtime}
+    return entries
+
+
+def model_references(model_file: str, tmp_name: str, models: dict[str, Any], new_models: dict[str, Any]) -> list[str]:
+    """FINN_TMP entries an ONNX model points to. Models are only read again when they changed"""
+    stat = os.stat(model_file)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    cached = models.get(model_file)
+    if cached is not None and cached["stamp"] == stamp:
+        refs = cached["refs"]
+    else:
+        data = read_from_file(model_file, binary=True) or b""
+        # Matches the path on the normal filesystem as well as on the ramdisk
+        refs = sorted(set(m.decode() for m in re.findall(rb"/" + re.escape(tmp_name.encode()) + rb"/([A-Za-z0-9_.\-]+)", data)))
+    new_models[model_file] = {"stamp": stamp, "refs": refs}
+    return refs
+
+
+def list_build_dirs() -> list[str]:
+    """All project directories, including the points of their sweeps, the probes of their target FPS search and their FINN comparison builds"""
+    dirs = []
+    for project in indexed_projects():
+        dirs.append(project)
+        dirs += sorted(glob.glob(os.path.join(project, "sweeps", "*", "point_*")))
+        dirs += sorted(glob.glob(os.path.join(project, "search", "fps_*")))
+        dirs += sorted(d for d in glob.glob(os.path.join(project, "finncompare", "*")) if os.path.isdir(d))
+    return dirs
+
+
+def collect_gc_units(tmp_dir: str, index: dict[str, Any], new_models: dict[str, Any], busy_projects: list[str]) -> list[dict[str, Any]]:
+    """Everything that can be evicted as a whole: builds of projects, step cache entries, FIFO depth cache entries and FINN_TMP entries no build knows about"""
+    units = []
+    tmp_name = os.path.basename(tmp_dir)
+    for build_dir in list_build_dirs():
+        for out in sorted(x for x in os.listdir(build_dir) if x.startswith("out_") and os.path.isdir(os.path.join(build_dir, x))):
+            out_dir = os.path.join(build_dir, out)
+            unit = {"name": out_dir, "kind": "build", "refs": set(), "files": [], "used": 0.0, "protected": None}
+            for model_file in glob.glob(os.path.join(out_dir, "intermediate_models", "*.onnx")):
+                unit["refs"].update(model_references(model_file, tmp_name, index.get("models", {}), new_models))
+                unit["used"] = max(unit["used"], os.path.getmtime(model_file))
+            checkpoint = read_json(os.path.join(out_dir, "checkpoint.json"))
+            if checkpoint is not None:
+                unit["refs"].update(checkpoint.get("refs", []))
+                # Failed and estimate-only builds also stay unfinished. They are only kept for a while to be resumed
+                if not checkpoint.get("finished", False) and time.time() - checkpoint.get("time", 0) < settings.gc_min_age_hours * 3600:
+                    unit["protected"] = "resumable"
+            # The project itself, or one of its sweep points or comparison builds. Not other projects that share its prefix
+            if any(os.path.normpath(build_dir) == os.path.normpath(p) or os.path.normpath(build_dir).startswith(os.path.normpath(p) + os.sep) for p in busy_projects):
+                unit["protected"] = "running"
+            units.append(unit)
+
+    cache_dir = step_cache_dir()
+    for metadata_file in glob.glob(os.path.join(cache_dir, "*.json")):
+        model_file = metadata_file[:-len(".json")] + ".onnx"
+        # The files the step wrote to its output directory
+        outputs_dir = metadata_file[:-len(".json")] + ".out"
+        metadata = read_json(metadata_file) or {}
+        files = [f for f in [model_file, metadata_file, outputs_dir] if os.path.exists(f)]
+        stats = [os.stat(f) for f in files]
+        units.append({
+            "name": os.path.relpath(model_file), "kind": "cache", "refs": set(metadata.get("refs", [])), "files": files,
+            "used": max(s.st_mtime for s in stats), "size": sum(disk_usage(f) if os.path.isdir(f) else s.st_blocks * 512 for f, s in zip(files, stats)), "protected": None
+        })
+    # The FIFO depths of step_set_fifo_depths, a small file per entry. Hits update their modification time
+    for fname in glob.glob(os.path.join(cache_dir, "fifo_depths", "*.json")):
+        stat = os.stat(fname)
+        units.append({"name": os.path.relpath(fname), "kind": "fifo cache", "refs": set(), "files": [fname], "used": stat.st_mtime, "size": stat.st_blocks * 512, "protected": None})
+    return units
+
+
+def gc(params: list[str]):
+    import asyncio
+    if len(params) > 1 or (len(params) == 1 and params[0] != "dryrun"):
+        print("Usage: doit gc [dryrun]")
+        sys.exit()
+    dry_run = len(params) == 1
+    tmp_dir = finn_tmp_dir()
+    if not os.path.isdir(tmp_dir):
+        print(f"{tmp_dir} does not exist, nothing to do")
+        return
+    budget = settings.gc_max_size_gb * 1024 ** 3
+    min_age = settings.gc_min_age_hours * 3600
+
+    # Builds that are still running must keep everything, including entries they did not record yet
+    projects = job_projects([])
+    asyncio.run(poll_jobs(projects))
+    busy_projects = [p for p in projects if any(job_is_active(j) for j in read_jobs(p))]
+
+    index_file = os.path.join(tmp_dir, GC_INDEX_FILE)
+    index = read_json(index_file) or {}
+    entries = index_finn_tmp(tmp_dir, index.get("entries", {}), min_age)
+    new_models: dict[str, Any] = {}
+    units = collect_gc_units(tmp_dir, index, new_models, busy_projects)
+
+    referenced = set(ref for unit in units for ref in unit["refs"])
+    for name, entry in entries.items():
+        if name not in referenced:
+            units.append({"name": name, "kind": "orphan", "refs": {name}, "files": [], "used": entry["modified"], "protected": None})
+    for unit in units:
+        unit["used"] = max([unit["used"]] + [entries[r]["modified"] for r in unit["refs"] if r in entries])
+
+    now = time.time()
+    protected = set(name for name, entry in entries.items() if now - entry["modified"] < min_age)
+    for unit in units:
+        if unit["protected"] is not None:
+            protected.update(unit["refs"])
+    users: dict[str, int] = {}
+    for unit in units:
+        for ref in unit["refs"]:
+            users[ref] = users.get(ref, 0) + 1
+
+    total = sum(e["size"] for e in entries.values()) + sum(u.get("size", 0) for u in units)
+    print(f"{tmp_dir} uses {total / 1024 ** 3:.1f} GB of {settings.gc_max_size_gb} GB in {len(entries)} entries, referenced by {len([u for u in units if u['kind'] != 'orphan'])} builds and step cache entries")
+
+    # Evict the least recently used builds first. Entries shared with a build that is kept stay
+    evicted = []
+    for unit in sorted(units, key=lambda u: u["used"]):
+        if total <= budget:
+            break
+        if unit["protected"] is not None:
+            continue
+        freed = 0
+        present = any(ref in entries for ref in unit["refs"]) or len(unit["files"]) > 0
+        for ref in unit["refs"]:
+            users[ref] -= 1
+            if users[ref] == 0 and ref in entries and ref not in protected:
+                if not dry_run:
+                    shutil.rmtree(os.path.join(tmp_dir, ref), ignore_errors=True)
+                freed += entries.pop(ref)["size"]
+        for fname in unit["files"]:
+            if dry_run:
+                continue
+            if os.path.isdir(fname):
+                shutil.rmtree(fname, ignore_errors=True)
+            else:
+                os.remove(fname)
+        freed += unit.get("size", 0)
+        total -= freed
+        if present:
+            evicted.append({"evicted": unit["name"], "kind": unit["kind"], "last_used": time.strftime("%Y-%m-%d %H:%M", time.localtime(unit["used"])), "freed_gb": freed / 1024 ** 3})
+
+    if len(evicted) > 0:
+        print_table(evicted, ["evicted", "kind", "last_used", "freed_gb"])
+    if total > budget:
+        print(f"WARNING: Still {total / 1024 ** 3:.1f} GB after evicting everything that is not needed by running builds, or changed or stopped within the last {settings.gc_min_age_hours} hours")
+    else:
+        print(("Would free" if dry_run else "Freed") + f" {sum(e['freed_gb'] for e in evicted):.1f} GB. FINN_TMP now uses {total / 1024 ** 3:.1f} GB")
+
+    if not dry_run:
+        with open(index_file + ".tmp", 'w+') as f:
+            json.dump({"entries": entries, "models": new_models}, f)
+        os.replace(index_file + ".tmp", index_file)
@@ -0,0 +1,138 @@
+# Every FINN commit gets a checkout of its own in finn_versions, and finn is a symlink to the one in use. The checkouts
+# are cloned from bare mirrors of FINN and its submodules, which can be shared by all users of a cluster. They keep
+# copies of their objects, since updating a mirror prunes deleted branches and git gc then drops their commits
+
+import subprocess
+import sys
+import os
+import shutil
+from typing import Optional
+
+from finn_on_n2.common import run_git
+from finn_on_n2.config import settings
+
+
+def mirror_path(url: str) -> str:
+    return os.path.join(settings.finn_mirror_dir, os.path.basename(url.rstrip("/")).replace(".git", "") + ".git")
+
+
+def update_mirror(url: str, fetch: bool = True) -> Optional[str]:
+    mirror = mirror_path(url)
+    if not os.path.isdir(mirror):
+        os.makedirs(settings.finn_mirror_dir, exist_ok=True)
+        print(f"Creating a mirror of {url} in {mirror}")
+        if subprocess.run(["git", "clone", "--mirror", url, mirror]).returncode != 0:
+            print(f"Error: Could not mirror {url}")
+            return None
+    elif fetch:
+        # Compute nodes often have no internet access. An outdated mirror is still good for the commits it has
+        if subprocess.run(["git", "-C", mirror, "remote", "update", "--prune"]).returncode != 0:
+            print(f"WARNING: Could not update the mirror {mirror}, using it as it is")
+    return mirror
+
+
+def update_submodules(checkout: str) -> bool:
+    urls = run_git(["-C", checkout, "config", "-f", ".gitmodules", "--get-regexp", r"^submodule\..*\.url$"])
+    if urls is None or urls == "":
+        return True
+    submodule_urls = {}
+    for line in urls.splitlines():
+        key, url = line.split(" ", 1)
+        submodule_urls[key[len("submodule."):-len(".url")]] = url
+
+    for fetch in [False, True]:
+        for name, url in submodule_urls.items():
+            mirror = update_mirror(url, fetch)
+            if mirror is not None:
+                run_git(["-C", checkout, "config", f"submodule.{name}.url", mirror])
+        # Newer git versions only clone submodules from local paths when explicitly allowed
+        if subprocess.run(["git", "-c", "protocol.file.allow=always", "-C", checkout, "submodule", "update", "--init"]).returncode == 0:
+            return True
+        if not fetch:
+            print("Submodule commits missing in the mirrors, updating them")
+    return False
+
+
+def dissociate_checkout(checkout: str) -> bool:
+    """Copy the objects into a checkout that it still borrows from the mirror. Checkouts were cloned with --shared before"""
+    alternates = os.path.join(checkout, ".git", "objects", "info", "alternates")
+    if not os.path.isfile(alternates):
+        return True
+    print(f"Copying the objects of {checkout} from the mirror")
+    if subprocess.run(["git", "-C", checkout, "repack", "-a", "-d", "-q"]).returncode != 0:
+        return False
+    os.remove(alternates)
+    return True
+
+
+def checkout_finn(ref: str) -> Optional[str]:
+    """Return the checkout of the given commit or branch of the configured FINN repository, creating it if needed"""
+    url = settings.finn_default_repo
+    mirror = mirror_path(url)
+    commit = run_git(["-C", mirror, "rev-parse", "--verify", "--quiet", ref + "^{commit}"]) if os.path.isdir(mirror) else None
+    # Commits never change, so only branches or unknown commits require a fetch
+    if commit is None or not commit.startswith(ref):
+        if update_mirror(url) is None:
+            return None
+        commit = run_git(["-C", mirror, "rev-parse", "--verify", "--quiet", ref + "^{commit}"])
+        if commit is None:
+            print(f"Error: {ref} is neither a branch nor a commit of {url}")
+            return None
+
+    checkout = os.path.join(settings.finn_checkouts_dir, f"{os.path.basename(mirror).replace('.git', '')}-{commit[:12]}")
+    if not os.path.isdir(checkout):
+        print(f"Checking out {ref} ({commit[:12]}) to {checkout}")
+        os.makedirs(settings.finn_checkouts_dir, exist_ok=True)
+        if subprocess.run(["git", "clone", "--quiet", "--reference", mirror, "--dissociate", "--no-checkout", mirror, checkout]).returncode != 0 or \
+                subprocess.run(["git", "-C", checkout, "checkout", "--quiet", "--detach", commit]).returncode != 0:
+            shutil.rmtree(checkout, ignore_errors=True)
+            print(f"Error: Could not check out {commit}")
+            return None
+        run_git(["-C", checkout, "remote", "set-url", "origin", url])
+        if not update_submodules(checkout):
+            shutil.rmtree(checkout, ignore_errors=True)
+            print("Error: Could not check out the submodules of FINN")
+            return None
+    elif not dissociate_checkout(checkout):
+        print(f"Error: Could not copy the objects {checkout} borrows from {mirror}")
+        return None
+    return checkout
+
+
+def use_finn_checkout(checkout: str) -> bool:
+    if os.path.islink("finn"):
+        os.remove("finn")
+    elif os.path.exists("finn"):
+        print("finn is a regular clone and was left as it is. Move it away to use the checkouts from the FINN mirror instead")
+        return False
+    os.symlink(os.path.relpath(checkout), "finn")
+    print(f"finn now points to {os.path.relpath(checkout)}")
+    return True
+
+
+def clone():
+    if os.path.exists("finn") and not os.path.islink("finn"):
+        print("Using the existing FINN clone in finn")
+        return
+    checkout = checkout_finn(settings.finn_default_commit if settings.finn_default_commit != "" else settings.finn_default_branch)
+    if checkout is None:
+        return False
+    if os.path.realpath("finn") != os.path.realpath(checkout):
+        use_finn_checkout(checkout)
+
+
+def use(params: list[str]):
+    if len(params) > 1:
+        print("Usage: doit usefinn [commit-or-branch]")
+        sys.exit()
+    if len(params) == 0:
+        current = os.path.realpath("finn")
+        checkouts = sorted(os.listdir(settings.finn_checkouts_dir)) if os.path.isdir(settings.finn_checkouts_dir) else []
+        print(f"Found {len(checkouts)} FINN checkouts in {settings.finn_checkouts_dir}:")
+        for name in checkouts:
+            path = os.path.join(settings.finn_checkouts_dir, name)
+            print(("  * " if os.path.realpath(path) == current else "    ") + name)
+        return
+    checkout = checkout_finn(params[0])
+    if checkout is None or not use_finn_checkout(checkout):
+        return False
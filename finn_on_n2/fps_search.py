@@ -0,0 +1,110 @@
+# Every probe is a copy of the project in <project>/search with another DEFAULT_TARGET_FPS. The probes only differ from
+# step_target_fps_parallelization onwards, so the earlier steps come from the step cache after the first probe
+
+import sys
+import os
+import shutil
+import json
+from typing import Any, Optional
+
+from finn_on_n2.common import check_params, get_build_constant, print_table, read_build_results, read_from_file, set_build_constant
+from finn_on_n2.config import settings
+from finn_on_n2.estimates import run_estimates
+
+
+def search(params: list[str]):
+    check_params(params)
+    project = params[0]
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    buildscript = read_from_file(os.path.join(project, "build.py"))
+    onnx_file = os.path.join(project, project + ".onnx")
+    if buildscript is None or not os.path.isfile(onnx_file):
+        print(f"Error: {project} needs a build.py and {project}.onnx to be searched")
+        sys.exit()
+    board = get_build_constant(buildscript, "DEFAULT_BOARD")
+    start_fps = get_build_constant(buildscript, "DEFAULT_TARGET_FPS")
+    if board not in settings.board_resources.keys():
+        print(f"Error: No resources for board {board} in the [boards] section of config.toml")
+        sys.exit()
+    limits = {resource: amount * settings.search_max_utilization for resource, amount in settings.board_resources[board].items()}
+
+    search_dir = os.path.join(project, "search")
+    probes: dict[int, dict[str, Any]] = {}
+
+    def probe(fps: int) -> Optional[bool]:
+        probe_dir = os.path.join(search_dir, f"fps_{fps}")
+        os.makedirs(probe_dir, exist_ok=True)
+        probe_script = set_build_constant(buildscript, "DEFAULT_TARGET_FPS", fps)
+        probe_script = set_build_constant(probe_script, "DEFAULT_FOLDING_CONFIG", None) or probe_script
+        with open(os.path.join(probe_dir, "build.py"), 'w+') as f:
+            f.write(probe_script)
+        if not os.path.isfile(os.path.join(probe_dir, project + ".onnx")):
+            shutil.copyfile(onnx_file, os.path.join(probe_dir, project + ".onnx"))
+
+        # Recorded as jobs of the project, the probes are no projects of their own
+        succeeded = run_estimates({probe_dir: project})[probe_dir]
+        results = read_build_results(os.path.join(probe_dir, "out_dir"))
+        if not succeeded or results.get("est_fps") is None:
+            print(f"Error: The estimate for target_fps {fps} failed. See {probe_dir}")
+            return None
+        usage = {resource: (results.get(f"est_{resource}") or 0) / limit if limit > 0 else 0 for resource, limit in limits.items()}
+        fits = all(u <= 1 for u in usage.values())
+        probes[fps] = {"target_fps": fps, "fits": fits, "est_fps": results["est_fps"], **{f"est_{r}": results.get(f"est_{r}") for r in limits.keys()}}
+        print(f"target_fps {fps}: estimated {results['est_fps']:.0f} FPS, " + ", ".join(f"{r} {u:.0%}" for r, u in usage.items()) + " of the budget. " + ("Fits" if fits else "Does not fit"))
+        return fits
+
+    # Bracket the highest fitting target by stepping by a factor of 4, then narrow it down in between
+    best: Optional[int] = None
+    lowest_failing: Optional[int] = None
+    fps = int(start_fps)
+    while best is None or lowest_failing is None:
+        fits = probe(fps)
+        if fits is None:
+            return False
+        if fits:
+            # Once everything is fully unfolded, higher targets do not change the design anymore
+            saturated = best is not None and probes[fps]["est_fps"] <= probes[best]["est_fps"]
+            if saturated or fps >= settings.search_max_target_fps:
+                best = best if saturated else fps
+                break
+            best = fps
+            fps = min(fps * 4, settings.search_max_target_fps)
+        else:
+            lowest_failing = fps
+            if fps <= 1:
+                break
+            fps = max(1, fps // 4)
+    while best is not None and lowest_failing is not None and lowest_failing > best * (1 + settings.search_tolerance):
+        fps = int((best * lowest_failing) ** 0.5)
+        if fps in [best, lowest_failing]:
+            break
+        fits = probe(fps)
+        if fits is None:
+            return False
+        if fits:
+            best = fps
+        else:
+            lowest_failing = fps
+
+    print_table([probes[f] for f in sorted(probes.keys())], ["target_fps", "fits", "est_fps"] + [f"est_{r}" for r in limits.keys()])
+    with open(os.path.join(search_dir, "search.json"), 'w+') as f:
+        json.dump({"board": board, "limits": limits, "best": best, "probes": [probes[f] for f in sorted(probes.keys())]}, f, indent=2)
+    if best is None:
+        print(f"Error: Not even target_fps 1 fits {settings.search_max_utilization:.0%} of the {board}")
+        return False
+
+    # The folding FINN derived for the best target is used as is by the full build
+    folding_config = os.path.join(search_dir, f"fps_{best}", "out_dir", "auto_folding_config.json")
+    if not os.path.isfile(folding_config):
+        print(f"Error: The estimate for target_fps {best} wrote no {folding_config}. Rerun it with BUILD_FLOW_NO_CACHE=1")
+        return False
+    shutil.copyfile(folding_config, os.path.join(project, "folding_config.json"))
+    buildscript = set_build_constant(buildscript, "DEFAULT_TARGET_FPS", best)
+    with_folding = set_build_constant(buildscript, "DEFAULT_FOLDING_CONFIG", "folding_config.json")
+    if with_folding is None:
+        print(f"WARNING: {project}/build.py has no DEFAULT_FOLDING_CONFIG constant (see {settings.finn_build_template}). Only DEFAULT_TARGET_FPS was set")
+    with open(os.path.join(project, "build.py"), 'w+') as f:
+        f.write(with_folding or buildscript)
+    print(f"Set DEFAULT_TARGET_FPS of {project} to {best}, estimated at {probes[best]['est_fps']:.0f} FPS. Its folding is stored in {project}/folding_config.json")
@@ -0,0 +1,57 @@
+# .projects.db keeps one row per project. The tasks that create, build or benchmark a project update its row, so
+# doit projects does not have to look into every project directory, which is slow on network filesystems.
+# Only reading the index lives here, dodo.py reads it on every doit call. Its rows are written by projects.py
+
+import os
+
+from finn_on_n2.common import ProjectName
+
+
+PROJECT_INDEX_FILE = ".projects.db"
+PROJECT_INDEX_COLUMNS = ["name", "status", "last_step", "last_build", "throughput", "bitfile", "onnx_hash", "onnx_stamp", "updated"]
+
+
+# Scans every directory, which is slow on network filesystems. Only used to (re)build the project index, everything else
+# reads the project names from the index with indexed_projects()
+def list_projects() -> list[ProjectName]:
+    exclusion_list = [".mypy_cache", "build_scripts", "configurations", "finn_on_n2", "pre-builds", "run_scripts"]
+    dirs = []
+    for name in os.listdir("."):
+        if (os.path.isdir(name)) and (name not in exclusion_list):
+            # Also projects whose creation stopped before the build script was written
+            files = os.listdir(name)
+            if "build.py" in files or name + ".onnx" in files:
+                dirs.append(name)
+    return dirs
+
+
+def open_project_index(read_only: bool = False):
+    import sqlite3
+    if read_only:
+        conn = sqlite3.connect(f"file:{PROJECT_INDEX_FILE}?mode=ro", uri=True, timeout=30)
+    else:
+        conn = sqlite3.connect(PROJECT_INDEX_FILE, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS projects (name TEXT PRIMARY KEY, status TEXT, last_step TEXT, last_build TEXT, throughput REAL, bitfile TEXT, onnx_hash TEXT, onnx_stamp TEXT, updated TEXT)")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def is_project_name(name: str) -> bool:
+    # Projects are top level directories. Sweep points, search probes and comparison builds below them are not
+    name = os.path.normpath(name)
+    return os.sep not in name and not name.startswith(".")
+
+
+def indexed_projects() -> list[ProjectName]:
+    """All projects, read from the project index. Without an index the directories are scanned, but nothing is written:
+    this also runs when doit loads dodo.py. The first task that updates a project builds the whole index"""
+    import sqlite3
+    if not os.path.isfile(PROJECT_INDEX_FILE):
+        return sorted(list_projects())
+    conn = open_project_index(read_only=True)
+    try:
+        return [r["name"] for r in conn.execute("SELECT name FROM projects ORDER BY name") if is_project_name(r["name"])]
+    except sqlite3.OperationalError:
+        return sorted(list_projects())
+    finally:
+        conn.close()
@@ -0,0 +1,294 @@
+# Every submitted job is recorded in <project>/jobs.json. The scheduler is SLURM on the cluster, and a small
+# local fake otherwise, which runs one job after another in the background and supports the same dependencies
+
+import subprocess
+import os
+import shlex
+import json
+import re
+import time
+import threading
+from typing import Any, Optional
+
+from finn_on_n2.common import print_table, read_from_file, read_json
+from finn_on_n2.config import settings
+from finn_on_n2.index import indexed_projects
+from finn_on_n2.build_worker import worker_slots
+
+
+JOBS_FILE = "jobs.json"
+LOCAL_JOBS_DIR = ".local_jobs"
+ACTIVE_STATES = ["PENDING", "RUNNING", "REQUEUED", "CONFIGURING", "COMPLETING", "SUSPENDED", "RESIZING"]
+STATUS_HISTORY = 5
+
+
+def read_jobs(project: str) -> list[dict[str, Any]]:
+    jobs = read_json(os.path.join(project, JOBS_FILE))
+    return jobs if type(jobs) == list else []
+
+
+def write_jobs(project: str, jobs: list[dict[str, Any]]):
+    fname = os.path.join(project, JOBS_FILE)
+    with open(fname + ".tmp", 'w+') as f:
+        json.dump(jobs, f, indent=2)
+    os.replace(fname + ".tmp", fname)
+
+
+def job_is_active(job: dict[str, Any]) -> bool:
+    return job["state"] in ACTIVE_STATES
+
+
+async def run_command(command: list[str]) -> str:
+    import asyncio
+    try:
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    except FileNotFoundError:
+        return ""
+    output, _ = await process.communicate()
+    return output.decode()
+
+
+def merge_array_states(states: list[str]) -> str:
+    """Condense the states of all tasks of a job array into one"""
+    if "RUNNING" in states:
+        return "RUNNING"
+    active = [s for s in states if s in ACTIVE_STATES]
+    if len(active) > 0:
+        return active[0]
+    failed = [s for s in states if s != "COMPLETED"]
+    return failed[0] if len(failed) > 0 else "COMPLETED"
+
+
+class SlurmScheduler:
+    name = "slurm"
+
+    def submit(self, script_args: list[str], sbatch_args: list[str], after: list[str], env: dict[str, str] = {}) -> Optional[str]:
+        command = ["sbatch", "--parsable"] + sbatch_args
+        if any(a.startswith("--array") for a in sbatch_args):
+            command += ["-o", self.output_pattern(script_args[0], True)]
+        if len(after) > 0:
+            command += [f"--dependency=afterok:{':'.join(after)}", "--kill-on-invalid-dep=yes"]
+        # sbatch passes its environment on to the job
+        result = subprocess.run(command + script_args, stdout=subprocess.PIPE, text=True, env={**os.environ, **env})
+        if result.returncode != 0 or result.stdout.strip() == "":
+            return None
+        # --parsable prints "<jobid>[;<cluster>]"
+        return result.stdout.strip().split(";")[0]
+
+    def output_pattern(self, script: str, array: bool) -> str:
+        text = read_from_file(script) or ""
+        match = re.search(r"^#SBATCH\s+(?:-o|--output)[\s=]+(\S+)", text, re.MULTILINE)
+        pattern = match.group(1) if match is not None else "slurm-%j.out"
+        # Every task of an array gets a job id of its own, which cannot be told apart from the ids of other jobs.
+        # Their logs are named after the id of the array and the task index instead
+        if array and "%A" not in pattern:
+            if "%j" in pattern:
+                pattern = pattern.replace("%j", "%A_%a")
+            else:
+                root, extension = os.path.splitext(pattern)
+                pattern = f"{root}_%A_%a{extension}"
+        return pattern
+
+    def log_file(self, script: str, job_id: str, array: bool = False) -> str:
+        return self.output_pattern(script, array).replace("%j", job_id).replace("%A", job_id).replace("%a", "*")
+
+    async def poll(self, job_ids: list[str]) -> dict[str, str]:
+        import asyncio
+        if len(job_ids) == 0:
+            return {}
+        ids = ",".join(job_ids)
+        # sacct knows finished jobs, squeue is more current for running ones. Array tasks show up as <jobid>_<task>
+        accounting, queue = await asyncio.gather(
+            run_command(["sacct", "-n", "-X", "-P", "-o", "JobID,State", "-j", ids]),
+            run_command(["squeue", "-h", "-o", "%i|%T", "-j", ids])
+        )
+        task_states: dict[str, dict[str, str]] = {}
+        for text in [accounting, queue]:
+            for line in text.splitlines():
+                if "|" not in line:
+                    continue
+                task, state = line.split("|", 1)
+                state = state.split(" ")[0].strip()
+                task_states.setdefault(task.split("_")[0], {})[task] = state
+        return {job_id: merge_array_states(list(states.values())) for job_id, states in task_states.items()}
+
+
+class LocalScheduler:
+    name = "local"
+
+    def __init__(self, exec_prefix: str):
+        self.exec_prefix = exec_prefix
+
+    def submit(self, script_args: list[str], sbatch_args: list[str], after: list[str], env: dict[str, str] = {}) -> Optional[str]:
+        os.makedirs(LOCAL_JOBS_DIR, exist_ok=True)
+        previous = read_from_file(os.path.join(LOCAL_JOBS_DIR, "last_id"))
+        job_id = f"local-{int(previous.split('-')[1]) + 1 if previous is not None else 1}"
+        with open(os.path.join(LOCAL_JOBS_DIR, "last_id"), 'w+') as f:
+            f.write(job_id)
+
+        jobs_dir = os.path.abspath(LOCAL_JOBS_DIR)
+        script = [
+            f"D={shlex.quote(jobs_dir)}",
+            "wait_for() { while [ ! -f $D/$1.exit ] && kill -0 $(cat $D/$1.pid 2> /dev/null) 2> /dev/null; do sleep 2; done; }"
+        ]
+        # Only one local job runs at a time, or as many as the build worker of this host runs
+        slots = worker_slots()
+        number = int(job_id.split('-')[1])
+        if number > slots:
+            script.append(f"wait_for local-{number - slots}")
+        for dependency in after:
+            script.append(f"wait_for {dependency}")
+            script.append(f"if [ \"$(cat $D/{dependency}.exit 2> /dev/null)\" != 0 ]; then echo \"Dependency {dependency} failed\"; echo cancelled > $D/{job_id}.exit; exit 1; fi")
+        script.append(f"touch $D/{job_id}.started")
+        script.append(" ".join(shlex.quote(a) for a in [self.exec_prefix] + script_args))
+        script.append(f"echo $? > $D/{job_id}.exit")
+
+        log = open(self.log_file(script_args[0], job_id), 'a')
+        process = subprocess.Popen(["bash", "-c", "\n".join(script)], stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True, env={**os.environ, **env})
+        log.close()
+        with open(os.path.join(LOCAL_JOBS_DIR, f"{job_id}.pid"), 'w+') as f:
+            f.write(str(process.pid))
+        return job_id
+
+    def log_file(self, script: str, job_id: str, array: bool = False) -> str:
+        return f"{os.path.basename(script).replace('.sh', '')}_{job_id}.out"
+
+    def state(self, job_id: str) -> str:
+        exit_code = read_from_file(os.path.join(LOCAL_JOBS_DIR, f"{job_id}.exit"))
+        if exit_code is not None:
+            exit_code = exit_code.strip()
+            return "COMPLETED" if exit_code == "0" else ("CANCELLED" if exit_code == "cancelled" else "FAILED")
+        pid = read_from_file(os.path.join(LOCAL_JOBS_DIR, f"{job_id}.pid"))
+        try:
+            os.kill(int(pid), 0)
+        except (TypeError, ValueError, OSError):
+            return "FAILED"
+        return "RUNNING" if os.path.isfile(os.path.join(LOCAL_JOBS_DIR, f"{job_id}.started")) else "PENDING"
+
+    async def poll(self, job_ids: list[str]) -> dict[str, str]:
+        return {job_id: self.state(job_id) for job_id in job_ids}
+
+
+def get_scheduler(name: Optional[str] = None):
+    name = name or settings.job_scheduler
+    if name == "auto":
+        name = "slurm" if settings.job_exec_prefix == "sbatch" else "local"
+    if name == "slurm":
+        return SlurmScheduler()
+    return LocalScheduler(settings.job_exec_prefix)
+
+
+_submit_lock = threading.Lock()
+
+
+def submit_job(project: str, kind: str, script_args: list[str], sbatch_args: list[str] = [], after: list[str] = [], stage: Optional[str] = None, env: dict[str, str] = {}) -> Optional[str]:
+    """Submit a job script with the configured scheduler and record it for the project. Returns the job id.
+    env is added to the environment of this job only, doit -n submits the jobs of several projects from threads"""
+    scheduler = get_scheduler()
+    # doit -n runs the project tasks in threads, and the local scheduler numbers its jobs from a file
+    with _submit_lock:
+        job_id = scheduler.submit(script_args, sbatch_args, after, env)
+    if job_id is None:
+        print(f"Failed to submit the {kind} job for {project}")
+        return None
+    jobs = read_jobs(project)
+    jobs.append({
+        "id": job_id,
+        "kind": kind,
+        "scheduler": scheduler.name,
+        "command": script_args,
+        "after": after,
+        "stage": stage,
+        "log": scheduler.log_file(script_args[0], job_id, any(a.startswith("--array") for a in sbatch_args)),
+        "state": "PENDING",
+        "submitted": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "finished": None,
+    })
+    write_jobs(project, jobs)
+    # The project index reads the job files in turn
+    from finn_on_n2.projects import refresh_projects
+    refresh_projects([project])
+    print(f"Submitted {kind} job {job_id} for {project}" + (f" (stage {stage})" if stage is not None else "") + (f", starting after {', '.join(after)} succeeded" if len(after) > 0 else ""))
+    return job_id
+
+
+def job_projects(params: list[str]) -> list[str]:
+    projects = params if len(params) > 0 else indexed_projects()
+    return [p for p in projects if os.path.isfile(os.path.join(p, JOBS_FILE))]
+
+
+async def poll_jobs(projects: list[str]) -> list[tuple[str, dict[str, Any], str]]:
+    """Ask every scheduler once about all active jobs, update the job files and return the state changes"""
+    import asyncio
+    from finn_on_n2.projects import refresh_projects
+    jobs = {project: read_jobs(project) for project in projects}
+    active: dict[str, list[str]] = {}
+    for project_jobs in jobs.values():
+        for job in project_jobs:
+            if job_is_active(job):
+                active.setdefault(job["scheduler"], []).append(job["id"])
+    names = list(active.keys())
+    results = await asyncio.gather(*[get_scheduler(name).poll(active[name]) for name in names])
+    states = {(name, job_id): state for name, result in zip(names, results) for job_id, state in result.items()}
+
+    changes = []
+    for project, project_jobs in jobs.items():
+        changed = False
+        for job in project_jobs:
+            state = states.get((job["scheduler"], job["id"]))
+            if not job_is_active(job) or state is None or state == job["state"]:
+                continue
+            job["state"] = state
+            if not job_is_active(job):
+                job["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            changes.append((project, job, state))
+            changed = True
+        if changed:
+            write_jobs(project, project_jobs)
+    refresh_projects(sorted(set(project for project, _, _ in changes)))
+    return changes
+
+
+async def follow_jobs(projects: list[str], job_ids: Optional[list[str]] = None) -> bool:
+    """Poll until all (or the given) jobs of the projects finished and print their state changes. Returns whether all completed"""
+    import asyncio
+    failed = False
+    while True:
+        for project, job, state in await poll_jobs(projects):
+            print(f"{time.strftime('%H:%M:%S')} {project}: {job['kind']} job {job['id']} is {state}" + (f" (log: {job['log']})" if state not in ACTIVE_STATES else ""))
+            failed = failed or (state not in ACTIVE_STATES and state != "COMPLETED")
+        remaining = sum(1 for p in projects for j in read_jobs(p) if job_is_active(j) and (job_ids is None or j["id"] in job_ids))
+        if remaining == 0:
+            return not failed
+        await asyncio.sleep(settings.job_poll_interval)
+
+
+def print_jobs(projects: list[str]):
+    rows = []
+    for project in projects:
+        jobs = read_jobs(project)
+        finished = [j for j in jobs if not job_is_active(j)][-STATUS_HISTORY:]
+        for job in jobs:
+            if job_is_active(job) or job in finished:
+                rows.append({"project": project, "job": job["id"], "kind": job["kind"] + (f" ({job['stage']})" if job.get("stage") is not None else ""), "state": job["state"], "submitted": job["submitted"], "finished": job["finished"], "log": job["log"]})
+    if len(rows) == 0:
+        print("No jobs recorded")
+        return
+    print_table(rows, ["project", "job", "kind", "state", "submitted", "finished", "log"])
+    active = len([r for r in rows if r["state"] in ACTIVE_STATES])
+    print(f"\n{active} of the listed jobs are still pending or running")
+
+
+def status(params: list[str]):
+    import asyncio
+    projects = job_projects(params)
+    asyncio.run(poll_jobs(projects))
+    print_jobs(projects)
+
+
+def wait(params: list[str]):
+    import asyncio
+    if not asyncio.run(follow_jobs(job_projects(params))):
+        print("Some jobs did not complete successfully")
+        return False
+    print("All jobs finished")
@@ -0,0 +1,89 @@
+# build.py appends a record per step to <project>/step_metrics.jsonl: wall and CPU time, peak memory and the FINN commit
+
+import os
+import json
+import glob
+import statistics
+import time
+from typing import Any
+
+from finn_on_n2.common import ProjectName, print_table, read_from_file
+from finn_on_n2.index import indexed_projects
+
+
+def read_step_metrics(project: ProjectName) -> list[dict[str, Any]]:
+    """Read the per step records written by build.py, including those of the project's sweep points"""
+    records = []
+    for fname in [os.path.join(project, "step_metrics.jsonl")] + sorted(glob.glob(os.path.join(project, "sweeps", "*", "*", "step_metrics.jsonl"))):
+        text = read_from_file(fname)
+        if text is None:
+            continue
+        name = os.path.dirname(fname)
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            record["project"] = name
+            records.append(record)
+    return records
+
+
+def report(params: list[str]):
+    projects = params if len(params) > 0 else indexed_projects()
+    records = []
+    for project in projects:
+        if not os.path.isdir(project):
+            print(f"Skipping {project}: no such project directory")
+            continue
+        records += read_step_metrics(project)
+    if len(records) == 0:
+        print("No step metrics found. They are recorded by builds of projects created from the current build template")
+        return
+
+    steps: dict[str, list[dict]] = {}
+    for record in records:
+        if record.get("status") == "ok":
+            steps.setdefault(record["step"], []).append(record)
+    step_rows = []
+    for name, step_records in steps.items():
+        walls = [r["wall_s"] for r in step_records]
+        cores = [r["cpu_s"] / r["wall_s"] for r in step_records if r["wall_s"] > 0]
+        step_rows.append({
+            "step": name,
+            "runs": len(step_records),
+            "median_wall_s": statistics.median(walls),
+            "max_wall_s": max(walls),
+            "median_cores": statistics.median(cores) if len(cores) > 0 else None,
+            "max_rss_mb": max(r["peak_rss_mb"] for r in step_records),
+        })
+    step_rows.sort(key=lambda r: r["median_wall_s"], reverse=True)
+    print("Slowest steps:")
+    print_table(step_rows, ["step", "runs", "median_wall_s", "max_wall_s", "median_cores", "max_rss_mb"])
+
+    peaks: dict[str, dict] = {}
+    for record in records:
+        if record["project"] not in peaks.keys() or record["peak_rss_mb"] > peaks[record["project"]]["peak_rss_mb"]:
+            peaks[record["project"]] = record
+    print("\nMemory high-water marks:")
+    print_table(sorted(peaks.values(), key=lambda r: r["peak_rss_mb"], reverse=True), ["project", "peak_rss_mb", "step", "run"])
+
+    runs: dict[tuple[str, str], list[dict]] = {}
+    for record in records:
+        runs.setdefault((record["project"], record["run"]), []).append(record)
+    run_rows = []
+    for (project, run), run_records in runs.items():
+        run_rows.append({
+            "project": project,
+            "run": run,
+            "finished": time.strftime("%Y-%m-%d %H:%M", time.localtime(max(r["time"] for r in run_records))),
+            "steps": len(run_records),
+            "last_step": max(run_records, key=lambda r: r["time"])["step"],
+            "status": "failed" if any(r["status"] != "ok" for r in run_records) else "ok",
+            "wall_s": sum(r["wall_s"] for r in run_records),
+            "cpu_s": sum(r["cpu_s"] for r in run_records),
+            "max_rss_mb": max(r["peak_rss_mb"] for r in run_records),
+        })
+    run_rows.sort(key=lambda r: r["finished"])
+    print("\nRuns over time (most recent 20):")
+    print_table(run_rows[-20:], ["finished", "project", "run", "steps", "last_step", "status", "wall_s", "cpu_s", "max_rss_mb"])
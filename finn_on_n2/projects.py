@@ -0,0 +1,233 @@
+# Creating projects and keeping their rows in the project index (see index.py) up to date
+
+import subprocess
+import sys
+import os
+import shutil
+import shlex
+import glob
+import time
+import ast
+from typing import Any, Optional
+
+from finn_on_n2.common import ONNXFilePath, ProjectName, check_params, file_digest, find_output_dir, print_table, read_from_file, read_json
+from finn_on_n2.config import settings
+from finn_on_n2.index import PROJECT_INDEX_COLUMNS, PROJECT_INDEX_FILE, is_project_name, list_projects, open_project_index
+from finn_on_n2.jobs import job_is_active, read_jobs, submit_job
+from finn_on_n2.bench import read_bench_results
+
+
+def onnx_name_to_project_name(name: ONNXFilePath) -> ProjectName:
+    return os.path.basename(name).replace(".onnx", "")
+
+
+def create_project_dir(name: ProjectName):
+    if not os.path.isdir(name):
+        os.mkdir(name)
+
+
+def copy_onnx_file_to_project(name: ONNXFilePath):
+    if not os.path.isfile(name):
+        print(f"Cannot find ONNX file at {name}. Please specify a valid ONNX file path!")
+        sys.exit()
+    project_name = onnx_name_to_project_name(name)
+    target = os.path.join(".", project_name, project_name + ".onnx")
+    if not os.path.isfile(target):
+        subprocess.run(shlex.split(f"cp {name} {target}"))
+
+
+def create_finn_build_script(name: ProjectName):
+    build_path = os.path.join(".", name, "build.py")
+    if not os.path.isfile(build_path):
+        buildscript = read_from_file(settings.finn_build_template)
+        if buildscript is None:
+            print(f"Couldn't find build script template at {settings.finn_build_template}. Please correct your config.toml!")
+            sys.exit()
+        with open(build_path, 'w+') as f:
+            f.write(buildscript.replace("<ONNX_INPUT_NAME>", name + ".onnx"))
+
+
+def create_project(params: list[str]):
+    check_params(params)
+    onnx_name = params[0]
+    project_name = onnx_name_to_project_name(onnx_name)
+    create_project_dir(project_name)
+    copy_onnx_file_to_project(onnx_name)
+    # Indexed before the build script is written, so that doit buildscript can finish an interrupted creation
+    refresh_projects([project_name])
+    create_finn_build_script(project_name)
+    refresh_projects([project_name])
+
+
+def build_status(name: ProjectName, checkpoint: Optional[dict]) -> str:
+    if not os.path.isfile(os.path.join(name, "build.py")):
+        return "incomplete"
+    builds = [j for j in read_jobs(name) if j["kind"] in ["build", "resume"]]
+    if len(builds) > 0 and job_is_active(builds[-1]):
+        return builds[-1]["state"].lower()
+    if len(builds) > 0 and builds[-1]["state"] != "COMPLETED":
+        return "failed"
+    if checkpoint is None:
+        return "created"
+    return "finished" if checkpoint.get("finished", False) else "stopped"
+
+
+def measured_throughput(name: ProjectName) -> Optional[float]:
+    """Best median throughput of the latest driver benchmark, or the aggregate throughput of the latest driver run, whichever is newer"""
+    measurements = []
+    bench_runs = sorted(glob.glob(os.path.join(name, "bench", "*", "")))
+    if len(bench_runs) > 0:
+        values = [r["median_throughput"] for r in read_bench_results(bench_runs[-1]) if "median_throughput" in r.keys()]
+        if len(values) > 0:
+            measurements.append((os.path.getmtime(bench_runs[-1]), max(values)))
+    out_dir = find_output_dir(name)
+    driver_runs = glob.glob(os.path.join(out_dir, "deploy", "driver", "runs", "*", "")) if out_dir is not None else []
+    if len(driver_runs) > 0:
+        latest = max(driver_runs, key=os.path.getmtime)
+        values = []
+        for metrics_file in glob.glob(os.path.join(latest, "card_*", "nw_metrics.txt")):
+            try:
+                values.append(ast.literal_eval(read_from_file(metrics_file) or "")["throughput[images/s]"])
+            except (ValueError, SyntaxError, TypeError, KeyError):
+                continue
+        # Streamed dataset runs
+        values += [m["throughput[images/s]"] for m in [read_json(f) for f in glob.glob(os.path.join(latest, "card_*", "stream_metrics.json"))] if m is not None]
+        if len(values) > 0:
+            measurements.append((os.path.getmtime(latest), sum(values)))
+    return max(measurements)[1] if len(measurements) > 0 else None
+
+
+def refresh_projects(names: list[ProjectName]):
+    """Update the index rows of the projects from their directories. Projects that are gone are removed"""
+    # Reading the index never writes it, so the first update indexes all projects
+    if not os.path.isfile(PROJECT_INDEX_FILE):
+        projects = list_projects()
+        names = projects + [name for name in names if name not in projects]
+    conn = open_project_index()
+    try:
+        for name in names:
+            if not is_project_name(name):
+                conn.execute("DELETE FROM projects WHERE name = ?", (name,))
+                continue
+            name = os.path.normpath(name)
+            if not os.path.isfile(os.path.join(name, "build.py")) and not os.path.isfile(os.path.join(name, name + ".onnx")):
+                conn.execute("DELETE FROM projects WHERE name = ?", (name,))
+                continue
+            # The ONNX model is only hashed again if it changed
+            row = conn.execute("SELECT onnx_hash, onnx_stamp FROM projects WHERE name = ?", (name,)).fetchone()
+            onnx_file = os.path.join(name, name + ".onnx")
+            onnx_hash, onnx_stamp = None, None
+            if os.path.isfile(onnx_file):
+                stat = os.stat(onnx_file)
+                onnx_stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+                onnx_hash = row["onnx_hash"] if row is not None and row["onnx_stamp"] == onnx_stamp else file_digest(onnx_file)
+
+            out_dir = find_output_dir(name)
+            checkpoint = read_json(os.path.join(out_dir, "checkpoint.json")) if out_dir is not None else None
+            bitfiles = sorted(glob.glob(os.path.join(out_dir, "deploy", "bitfile", "*.xclbin"))) if out_dir is not None else []
+            conn.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                name,
+                build_status(name, checkpoint),
+                checkpoint["step"] if checkpoint is not None else None,
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(checkpoint["time"])) if checkpoint is not None and "time" in checkpoint.keys() else None,
+                measured_throughput(name),
+                os.path.relpath(bitfiles[0]) if len(bitfiles) > 0 else None,
+                onnx_hash,
+                onnx_stamp,
+                time.strftime("%Y-%m-%d %H:%M:%S"),
+            ))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def ls_projects(params: list[str]):
+    filters = dict(p.split(":", 1) for p in params if ":" in p)
+    unknown = [p for p in params if p != "refresh" and (":" not in p or p.split(":", 1)[0] not in ["status", "step", "name", "sort", "limit"])]
+    sort = filters.get("sort", "name")
+    if len(unknown) > 0 or sort.lstrip("-") not in PROJECT_INDEX_COLUMNS or not filters.get("limit", "0").isdigit():
+        print("Usage: doit projects [refresh] [status:<status>] [step:<step>] [name:<glob>] [sort:[-]<column>] [limit:<n>]")
+        print("Columns: " + ", ".join(PROJECT_INDEX_COLUMNS))
+        sys.exit()
+
+    # The index is built by scanning all directories only once, or when asked to
+    if "refresh" in params or not os.path.isfile(PROJECT_INDEX_FILE):
+        projects = list_projects()
+        conn = open_project_index()
+        gone = [r["name"] for r in conn.execute("SELECT name FROM projects") if r["name"] not in projects]
+        conn.close()
+        refresh_projects(projects + gone)
+
+    query = "SELECT * FROM projects WHERE 1 = 1"
+    args: list[Any] = []
+    for key, column in [("status", "status"), ("step", "last_step")]:
+        if key in filters.keys():
+            query += f" AND {column} = ?"
+            args.append(filters[key])
+    if "name" in filters.keys():
+        query += " AND name GLOB ?"
+        args.append(filters["name"])
+    query += f" ORDER BY {sort.lstrip('-')}" + (" DESC" if sort.startswith("-") else "")
+    if "limit" in filters.keys():
+        query += " LIMIT ?"
+        args.append(int(filters["limit"]))
+    conn = open_project_index()
+    rows = [dict(r) for r in conn.execute(query, args)]
+    conn.close()
+
+    print(f"Found {len(rows)} projects:")
+    if len(rows) > 0:
+        for row in rows:
+            row["onnx_hash"] = (row["onnx_hash"] or "")[:12]
+        print_table(rows, ["name", "status", "last_step", "last_build", "throughput", "bitfile", "onnx_hash"])
+
+
+def edit(names):
+    if len(names) != 1:
+        print("Cannot edit multiple or none projects. Provide a single project name!")
+        sys.exit()
+
+    editors = ["vim", "vi", "nano", "gedit", "code"]
+    for editor in editors:
+        if shutil.which(editor) is not None: 
+            subprocess.run(shlex.split(f"vim {names[0]}/build.py"))
+            return True
+
+    print(f"None of these editors is available for editing: {editors}!")
+    return False
+
+
+def run_python_driver(params: list[str]):
+    options = [p for p in params if p.startswith(("stream", "labels:"))]
+    params = [p for p in params if p not in options]
+    if len(params) not in [1, 2, 3] or (len(options) > 0 and len(params) == 1):
+        print("Usage: doit pythondriver <project> [<input.npy> [<output.npy>] [stream[:<batch size>]] [labels:<labels.npy>]]")
+        sys.exit()
+    name = params[0]
+    if not os.path.isdir(name):
+        print("No project directory found under the name " + name)
+    output_dirs = [x for x in os.listdir(name) if x.startswith("out_")]
+    if len(output_dirs) == 0:
+        print("Tried to find valid output directoy in project directory. Make sure all output directories are prefixed with \"out_\", and contain the file deploy/driver/<...>.xclbin!")
+        sys.exit()
+    driver_dir = os.path.join(os.path.abspath(name), output_dirs[0], "deploy", "driver")
+    # A dataset is split over all allocated FPGAs, and the outputs are joined again
+    dataset = []
+    if len(params) > 1:
+        if not os.path.isfile(params[1]):
+            print("Input file " + params[1] + " does not exist")
+            sys.exit()
+        output = params[2] if len(params) == 3 else os.path.join(name, "driver_output.npy")
+        dataset = [os.path.abspath(params[1]), os.path.abspath(output)]
+    # Streaming reads the dataset in batches, overlaps packing and unpacking with the FPGA and reports where the time goes
+    labels = [o.split(":", 1)[1] for o in options if o.startswith("labels:")]
+    if any(o.startswith("stream") for o in options) or len(labels) > 0:
+        batch_size = [o.split(":", 1)[1] for o in options if o.startswith("stream:")]
+        dataset.append(batch_size[0] if len(batch_size) > 0 else str(settings.driver_stream_batch_size))
+        if len(labels) > 0:
+            if not os.path.isfile(labels[0]):
+                print("Label file " + labels[0] + " does not exist")
+                sys.exit()
+            dataset.append(os.path.abspath(labels[0]))
+    if submit_job(name, "pythondriver", [settings.pythondriver_run_script, driver_dir] + dataset) is None:
+        return False
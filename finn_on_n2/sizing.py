@@ -0,0 +1,81 @@
+# Build jobs request CPUs, memory and time according to the step metrics of earlier builds. These override the #SBATCH
+# defaults of the build script. Without history of the project itself, builds of models of similar size are used
+
+import os
+from typing import Any, Optional
+
+from finn_on_n2.common import ProjectName, read_json
+from finn_on_n2.config import settings
+from finn_on_n2.index import indexed_projects
+from finn_on_n2.jobs import get_scheduler
+from finn_on_n2.metrics import read_step_metrics
+
+
+def group_runs(records: list[dict[str, Any]]) -> list[list[dict[str, Any]]]:
+    runs: dict[tuple[str, str], list[dict[str, Any]]] = {}
+    for record in records:
+        runs.setdefault((record["project"], record["run"]), []).append(record)
+    return sorted(runs.values(), key=lambda run: run[-1]["time"])
+
+
+def similar_runs(project: ProjectName) -> tuple[list[list[dict[str, Any]]], str]:
+    runs = [run for run in group_runs(read_step_metrics(project)) if all(r["status"] == "ok" for r in run)]
+    if len(runs) > 0:
+        return runs, f"{len(runs)} earlier builds of {project}"
+    onnx_file = os.path.join(project, project + ".onnx")
+    if not os.path.isfile(onnx_file):
+        return [], ""
+    size = os.path.getsize(onnx_file)
+    similar = []
+    for other in indexed_projects():
+        if other == project:
+            continue
+        for run in group_runs(read_step_metrics(other)):
+            other_size = run[0].get("input_model_bytes")
+            if other_size is not None and size / 2 <= other_size <= size * 2 and all(r["status"] == "ok" for r in run):
+                similar.append(run)
+    similar.sort(key=lambda run: run[-1]["time"])
+    return similar, f"{len(similar)} builds of models of similar size"
+
+
+def build_resource_args(project: ProjectName, step_range: Optional[tuple[str, str]] = None) -> list[str]:
+    """sbatch arguments for building the project, or only the steps after the first and up to the second of step_range,
+    or nothing if there is no history to size them from"""
+    limits = settings.resource_config
+    if not limits.get("enabled", False) or get_scheduler().name != "slurm":
+        return []
+    runs, source = similar_runs(project)
+    runs = runs[-limits.get("history", 5):]
+    if len(runs) == 0:
+        return []
+
+    # Only the steps after the checkpoint have to run
+    steps: dict[str, dict[str, float]] = {}
+    for run in runs:
+        for record in run:
+            step = steps.setdefault(record["step"], {"wall_s": 0.0, "peak_rss_mb": 0.0, "parallelism": 1.0})
+            step["wall_s"] = max(step["wall_s"], record["wall_s"])
+            step["peak_rss_mb"] = max(step["peak_rss_mb"], record["peak_rss_mb"])
+            if record["wall_s"] > 0:
+                step["parallelism"] = max(step["parallelism"], record["cpu_s"] / record["wall_s"])
+    checkpoint = read_json(os.path.join(project, "out_dir", "checkpoint.json"))
+    names = list(steps.keys())
+    if step_range is not None:
+        after_step, last_step = step_range
+        if last_step in names:
+            names = names[:names.index(last_step) + 1]
+        if after_step in names:
+            names = names[names.index(after_step) + 1:]
+    if checkpoint is not None and not checkpoint.get("finished", False) and checkpoint.get("step") in names[:-1]:
+        names = names[names.index(checkpoint["step"]) + 1:]
+    remaining = [steps[name] for name in names]
+    if len(remaining) == 0:
+        return []
+
+    cpus = min(max(int(-(-max(s["parallelism"] for s in remaining) // 1)), limits.get("min_cpus", 2)), limits.get("max_cpus", 32))
+    memory_gb = max(s["peak_rss_mb"] for s in remaining) / 1024 * limits.get("memory_headroom", 1.3)
+    memory_gb = min(max(memory_gb, limits.get("min_memory_gb", 8)), limits.get("max_memory_gb", 512))
+    minutes = sum(s["wall_s"] for s in remaining) / 60 * limits.get("time_headroom", 1.5)
+    minutes = int(min(max(minutes, limits.get("min_time_hours", 0.5) * 60), limits.get("max_time_hours", 24) * 60))
+    print(f"Requesting {cpus} CPUs, {memory_gb:.0f} GB and {minutes // 60}:{minutes % 60:02d} h for {project}" + (f" up to {step_range[1] or 'the end'}" if step_range is not None else "") + f", based on {source}")
+    return ["--cpus-per-task", str(cpus), "--mem-per-cpu", f"{int(-(-memory_gb // cpus))}G", "-t", f"{minutes // 60}:{minutes % 60:02d}:00"]
@@ -0,0 +1,52 @@
+# Every doit call loads dodo.py and creates the tasks of all projects, including doit list and tab completion. doit
+# startupbench times doit list here against doit list with an empty dodo.py, which is what Python and doit take alone.
+# Both are timed with the bytecode Python caches in __pycache__, and without it, as right after a checkout or update or
+# where __pycache__ cannot be written
+
+import subprocess
+import sys
+import os
+import statistics
+import time
+import tempfile
+
+
+# What dodo.py and the task creation may add to a doit call, in ms
+STARTUP_BUDGET_MS = 50
+STARTUP_UNCACHED_BUDGET_MS = 100
+STARTUP_RUNS = 10
+
+
+def time_doit_list(cwd: str, env: dict[str, str]) -> float:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "doit", "list"], cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        print(f"doit list failed in {cwd}:\n{result.stderr}")
+        sys.exit()
+    return elapsed
+
+
+def measure_startup():
+    with tempfile.TemporaryDirectory() as bare_dir, tempfile.TemporaryDirectory() as empty_cache:
+        open(os.path.join(bare_dir, "dodo.py"), 'w').close()
+        env = {k: v for k, v in os.environ.items() if k not in ["PYTHONDONTWRITEBYTECODE", "PYTHONPYCACHEPREFIX"]}
+        # Nothing is read from or written to the empty cache directory, so every module is compiled again
+        uncached_env = {**env, "PYTHONDONTWRITEBYTECODE": "1", "PYTHONPYCACHEPREFIX": empty_cache}
+
+        failed = False
+        for name, run_env, budget in [("cached bytecode", env, STARTUP_BUDGET_MS), ("no cached bytecode", uncached_env, STARTUP_UNCACHED_BUDGET_MS)]:
+            # The first runs write the cache, and warm up the filesystem
+            time_doit_list(".", run_env)
+            time_doit_list(bare_dir, run_env)
+            times, bare_times = [], []
+            for _ in range(STARTUP_RUNS):
+                times.append(time_doit_list(".", run_env))
+                bare_times.append(time_doit_list(bare_dir, run_env))
+            total, bare = statistics.median(times), statistics.median(bare_times)
+            print(f"doit list with {name}: {total:.1f} ms, of which Python and doit alone take {bare:.1f} ms. dodo.py adds {total - bare:.1f} ms (median of {STARTUP_RUNS}, budget {budget} ms)")
+            failed = failed or total - bare > budget
+
+    if failed:
+        print("Loading dodo.py got slower. Keep imports out of it, the task actions import what they need when they run")
+        return False
@@ -0,0 +1,194 @@
+# doit dedup moves the files of finished builds into blobs named after their content and hard links them back into place,
+# so files that are identical across sweep points and rebuilds take up space only once. Blobs are read-only, since a
+# write would change all their links. The build template gives a new build in the same out_dir writable copies again.
+# doit archive packs builds that were not used for a while into tarballs
+
+import sys
+import os
+import shutil
+import json
+import glob
+import time
+from typing import Any, Generator
+
+from finn_on_n2.common import disk_usage, file_digest, print_table, read_json
+from finn_on_n2.config import finn_tmp_dir, settings
+from finn_on_n2.index import indexed_projects
+from finn_on_n2.jobs import job_is_active, job_projects, poll_jobs, read_jobs
+from finn_on_n2.projects import refresh_projects
+from finn_on_n2.finn_tmp import GC_INDEX_FILE, collect_gc_units
+
+
+STORE_INDEX_FILE = ".index.json"
+
+
+def walk_files(path: str) -> Generator[str, None, None]:
+    if os.path.isfile(path):
+        yield path
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            yield os.path.join(root, fname)
+
+
+def dedup_tree(path: str, index: dict[str, str], stats: dict[str, int]):
+    """Replace the files below path by hard links to their blobs. index maps inodes to the blobs they belong to"""
+    min_size = settings.store_min_size_kb * 1024
+    for fname in walk_files(path):
+        if os.path.islink(fname):
+            continue
+        stat = os.lstat(fname)
+        if stat.st_size < min_size:
+            continue
+        blob = index.get(str(stat.st_ino))
+        if blob is not None and os.path.exists(blob) and os.stat(blob).st_ino == stat.st_ino:
+            stats["linked"] += 1
+            continue
+
+        # Links share their permissions, so files that only differ in them get different blobs
+        mode = stat.st_mode & 0o7555
+        digest = file_digest(fname)
+        blob = os.path.join(settings.store_dir, digest[:2], f"{digest}_{mode:o}")
+        try:
+            if os.path.exists(blob):
+                os.link(blob, fname + ".dedup")
+                os.replace(fname + ".dedup", fname)
+                stats["linked"] += 1
+                if stat.st_nlink == 1:
+                    stats["saved"] += stat.st_blocks * 512
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.chmod(fname, mode)
+                os.link(fname, blob)
+                stats["stored"] += 1
+        except OSError as e:
+            stats["failed"] += 1
+            if stats["failed"] == 1:
+                print(f"WARNING: Cannot link {fname} to the store ({e.strerror}). The store has to be on the same filesystem")
+            continue
+        index[str(os.stat(blob).st_ino)] = blob
+
+
+def prune_store(index: dict[str, str]) -> int:
+    """Delete blobs that are not linked anywhere else anymore. Returns the freed bytes"""
+    freed = 0
+    for fname in walk_files(settings.store_dir):
+        if os.path.basename(fname) == STORE_INDEX_FILE:
+            continue
+        stat = os.lstat(fname)
+        if stat.st_nlink == 1:
+            os.remove(fname)
+            index.pop(str(stat.st_ino), None)
+            freed += stat.st_blocks * 512
+    return freed
+
+
+def idle_build_units(busy_projects: list[str]) -> tuple[list[dict[str, Any]], set[str]]:
+    """Builds that are neither running nor recently stopped, and the FINN_TMP entries that these builds or the step cache still use"""
+    tmp_dir = finn_tmp_dir()
+    units = collect_gc_units(tmp_dir, read_json(os.path.join(tmp_dir, GC_INDEX_FILE)) or {}, {}, busy_projects)
+    in_use = set(ref for unit in units if unit["protected"] is not None or unit["kind"] == "cache" for ref in unit["refs"])
+    return [u for u in units if u["kind"] == "build" and u["protected"] is None], in_use
+
+
+def busy_projects() -> list[str]:
+    import asyncio
+    projects = job_projects([])
+    asyncio.run(poll_jobs(projects))
+    return [p for p in projects if any(job_is_active(j) for j in read_jobs(p))]
+
+
+def in_build_dirs(path: str, build_dirs: list[str]) -> bool:
+    return any(os.path.abspath(path).startswith(os.path.abspath(d) + os.sep) for d in build_dirs)
+
+
+def dedup(params: list[str]):
+    build_dirs = params if len(params) > 0 else indexed_projects()
+    units, in_use = idle_build_units(busy_projects())
+    tmp_dir = finn_tmp_dir()
+    index_file = os.path.join(settings.store_dir, STORE_INDEX_FILE)
+    index = read_json(index_file) or {}
+
+    rows = []
+    for unit in units:
+        if not in_build_dirs(unit["name"], build_dirs):
+            continue
+        paths = [unit["name"]] + [os.path.join(tmp_dir, ref) for ref in sorted(unit["refs"]) if ref not in in_use]
+        stats = {"stored": 0, "linked": 0, "saved": 0, "failed": 0}
+        for path in paths:
+            if os.path.exists(path):
+                dedup_tree(path, index, stats)
+        rows.append({"build": unit["name"], "finn_tmp_entries": len(paths) - 1, "new_blobs": stats["stored"], "linked": stats["linked"], "failed": stats["failed"], "saved_gb": stats["saved"] / 1024 ** 3})
+    if len(rows) == 0:
+        print("No finished builds found")
+        return
+    freed = prune_store(index)
+
+    os.makedirs(settings.store_dir, exist_ok=True)
+    with open(index_file + ".tmp", 'w+') as f:
+        json.dump(index, f)
+    os.replace(index_file + ".tmp", index_file)
+    print_table(rows, ["build", "finn_tmp_entries", "new_blobs", "linked", "failed", "saved_gb"])
+    print(f"Saved {sum(r['saved_gb'] for r in rows):.1f} GB. Removed unused blobs with {freed / 1024 ** 3:.1f} GB. The store now uses {disk_usage(settings.store_dir) / 1024 ** 3:.1f} GB")
+
+
+def archive_file(out_dir: str) -> str:
+    return os.path.join(settings.archive_dir, os.path.relpath(out_dir).replace(os.sep, "__") + ".tar.gz")
+
+
+def archive(params: list[str]):
+    import tarfile
+    if len(params) > 0 and params[0] == "list":
+        archives = sorted(glob.glob(os.path.join(settings.archive_dir, "*.tar.gz")))
+        rows = [{"archive": os.path.basename(a), "size_gb": os.path.getsize(a) / 1024 ** 3, "archived": time.strftime("%Y-%m-%d %H:%M", time.localtime(os.path.getmtime(a)))} for a in archives]
+        if len(rows) == 0:
+            print(f"No archives in {settings.archive_dir}")
+        else:
+            print_table(rows, ["archive", "size_gb", "archived"])
+        return
+
+    if len(params) > 0 and params[0] == "restore":
+        if len(params) == 1:
+            print("Usage: doit archive restore <archive...>")
+            sys.exit()
+        for name in params[1:]:
+            fname = name if os.path.isfile(name) else os.path.join(settings.archive_dir, name if name.endswith(".tar.gz") else name + ".tar.gz")
+            if not os.path.isfile(fname):
+                print(f"Archive {name} not found. Use doit archive list")
+                return False
+            with tarfile.open(fname, "r:gz") as tar:
+                top = tar.getmembers()[0].name.split("/")
+                out_dir = os.path.join(*top)
+                if os.path.exists(out_dir):
+                    print(f"{out_dir} already exists, not restoring {os.path.basename(fname)}")
+                    continue
+                tar.extractall(".", **({"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}))
+            os.remove(fname)
+            refresh_projects([top[0]])
+            print(f"Restored {out_dir}")
+        return
+
+    # Explicitly given builds are archived regardless of their age
+    units, _ = idle_build_units(busy_projects())
+    if len(params) > 0:
+        units = [u for u in units if in_build_dirs(u["name"], params)]
+    else:
+        units = [u for u in units if time.time() - u["used"] > settings.archive_after_days * 86400]
+    if len(units) == 0:
+        print("No finished builds to archive" + (f" that were not used for {settings.archive_after_days} days" if len(params) == 0 else ""))
+        return
+
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    rows = []
+    for unit in units:
+        out_dir = os.path.relpath(unit["name"])
+        fname = archive_file(out_dir)
+        size = disk_usage(out_dir)
+        # Files hard linked to each other are stored once in the tarball
+        with tarfile.open(fname + ".tmp", "w:gz") as tar:
+            tar.add(out_dir)
+        os.replace(fname + ".tmp", fname)
+        shutil.rmtree(out_dir)
+        rows.append({"build": out_dir, "archive": os.path.basename(fname), "size_gb": size / 1024 ** 3, "archive_gb": os.path.getsize(fname) / 1024 ** 3})
+    refresh_projects(sorted(set(r["build"].split(os.sep)[0] for r in rows)))
+    print_table(rows, ["build", "archive", "size_gb", "archive_gb"])
+    print("Use doit archive restore <archive> to unpack a build again. doit dedup and doit gc remove the blobs and FINN_TMP entries only the archived builds used")
@@ -0,0 +1,123 @@
+# doit sweep builds a project for every point of a parameter grid. Every point becomes a project of its own in
+# <project>/sweeps/<sweep>/point_<n>, so that the build script can treat it like any other
+
+import sys
+import os
+import shutil
+import itertools
+import json
+from typing import Any
+import toml
+
+from finn_on_n2.common import copy_project_files, print_table, read_build_results, read_from_file, read_json, set_build_constant, write_csv
+from finn_on_n2.config import prepare_build_environment, settings
+from finn_on_n2.jobs import get_scheduler, submit_job
+from finn_on_n2.sizing import build_resource_args
+
+
+def expand_sweep_matrix(parameters: dict[str, list]) -> list[dict[str, Any]]:
+    names = list(parameters.keys())
+    values = [v if type(v) == list else [v] for v in parameters.values()]
+    return [dict(zip(names, point)) for point in itertools.product(*values)]
+
+
+def sweep(params: list[str]):
+    if len(params) != 2:
+        print("Usage: doit sweep <project> <matrix.toml>")
+        sys.exit()
+    if "finn" not in os.listdir("."):
+        print("Error: Missing finn directory. Run \"doit\" first to set everything up!")
+        sys.exit()
+    project, matrix_file = params
+    if not os.path.isdir(project):
+        print("Error: Project directory " + project + " doesn't exist!")
+        sys.exit()
+    if not os.path.isfile(matrix_file):
+        print(f"Error: Cannot find sweep matrix at {matrix_file}")
+        sys.exit()
+
+    matrix = toml.load(matrix_file)
+    if "parameters" not in matrix.keys() or len(matrix["parameters"]) == 0:
+        print("Error: The sweep matrix needs a [parameters] table mapping build.py constants to lists of values")
+        sys.exit()
+    sweep_settings = matrix.get("sweep", {})
+    sweep_name = sweep_settings.get("name", os.path.basename(matrix_file).replace(".toml", ""))
+    max_concurrent = sweep_settings.get("max_concurrent_jobs", settings.sweep_max_concurrent_jobs)
+
+    buildscript = read_from_file(os.path.join(project, "build.py"))
+    onnx_file = os.path.join(project, project + ".onnx")
+    if buildscript is None or not os.path.isfile(onnx_file):
+        print(f"Error: {project} needs a build.py and {project}.onnx to be swept")
+        sys.exit()
+
+    # Every point becomes a project of its own, so that the build script can treat it like any other
+    sweep_dir = os.path.join(project, "sweeps", sweep_name)
+    points = expand_sweep_matrix(matrix["parameters"])
+    manifest = {"project": project, "parameters": list(matrix["parameters"].keys()), "points": []}
+    point_dirs = []
+    for index, values in enumerate(points):
+        point_dir = os.path.join(sweep_dir, f"point_{index:03d}")
+        os.makedirs(point_dir, exist_ok=True)
+        point_script = buildscript
+        for name, value in values.items():
+            point_script = set_build_constant(point_script, name, value)
+            if point_script is None:
+                print(f"Error: {project}/build.py has no constant named {name}")
+                sys.exit()
+        with open(os.path.join(point_dir, "build.py"), 'w+') as f:
+            f.write(point_script)
+        copy_project_files(project, point_script, point_dir)
+        if not os.path.isfile(os.path.join(point_dir, project + ".onnx")):
+            shutil.copyfile(onnx_file, os.path.join(point_dir, project + ".onnx"))
+        point_dirs.append(os.path.abspath(point_dir))
+        manifest["points"].append({"dir": f"point_{index:03d}", "values": values})
+
+    with open(os.path.join(sweep_dir, "sweep.json"), 'w+') as f:
+        json.dump(manifest, f, indent=2)
+    points_file = os.path.join(sweep_dir, "points.txt")
+    with open(points_file, 'w+') as f:
+        f.write("\n".join(point_dirs) + "\n")
+    print(f"Expanded {len(points)} sweep points into {sweep_dir}")
+
+    prepare_build_environment()
+    os.environ["BUILD_FLOW_RESUME_STEP"] = ""
+    if get_scheduler().name == "slurm":
+        if submit_job(project, f"sweep {sweep_name}", [settings.finn_build_script, os.path.abspath(points_file)], sbatch_args=[f"--array=0-{len(points) - 1}%{max_concurrent}"] + build_resource_args(project)) is None:
+            return False
+    else:
+        for point_dir in point_dirs:
+            if submit_job(project, f"sweep {sweep_name} {os.path.basename(point_dir)}", [settings.finn_build_script, point_dir]) is None:
+                return False
+
+
+def collect(params: list[str]):
+    if len(params) not in [1, 2]:
+        print("Usage: doit sweepresults <project> [sweep-name]")
+        sys.exit()
+    project = params[0]
+    sweeps_root = os.path.join(project, "sweeps")
+    if not os.path.isdir(sweeps_root):
+        print(f"No sweeps found for project {project}")
+        sys.exit()
+    sweep_names = [params[1]] if len(params) == 2 else sorted(os.listdir(sweeps_root))
+
+    for sweep_name in sweep_names:
+        sweep_dir = os.path.join(sweeps_root, sweep_name)
+        manifest = read_json(os.path.join(sweep_dir, "sweep.json"))
+        if manifest is None:
+            print(f"Skipping {sweep_dir}: no sweep.json found")
+            continue
+        rows = []
+        for point in manifest["points"]:
+            row = {"point": point["dir"]}
+            row.update(point["values"])
+            row.update(read_build_results(os.path.join(sweep_dir, point["dir"], "out_dir")))
+            rows.append(row)
+        columns = ["point"] + manifest["parameters"]
+        for row in rows:
+            columns += [c for c in row.keys() if c not in columns]
+
+        print(f"\nSweep {sweep_name} ({len(rows)} points):")
+        print_table(rows, columns)
+        write_csv(os.path.join(sweep_dir, "results.csv"), rows, columns)
+        print(f"Written to {os.path.join(sweep_dir, 'results.csv')}")
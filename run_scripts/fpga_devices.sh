@@ -0,0 +1,58 @@
+# Sourced by the driver run scripts. Finds the FPGAs of the job and resets them in parallel
+
+# Indices like 0-2,4 as one index per line
+expand_indices() {
+  for range in ${1//,/ }; do
+    seq ${range%-*} ${range#*-}
+  done
+}
+
+# PCIe addresses of the FPGAs allocated to this job, in the order of their XRT device index. The drivers select their FPGA
+# by this address. xbutil examine lists every FPGA of the node, also those of other jobs, so the list is restricted to
+# FPGA_DEVICES (comma separated addresses, to choose by hand), SLURM_JOB_GPUS or the GRES indices SLURM reports for the job
+discover_devices() {
+  local all=($(xbutil examine 2> /dev/null | grep -oE '^\s*\[[0-9a-fA-F]{4}:[0-9a-fA-F]{2}:[0-9a-fA-F]{2}\.[0-9]\]' | tr -d '[] '))
+  if [ ${#all[@]} -eq 0 ]; then
+    echo "xbutil examine found no FPGAs"
+    exit 1
+  fi
+
+  local indices=""
+  if [ -z "$FPGA_DEVICES" ] && [ -n "$SLURM_JOB_GPUS" ]; then
+    indices=$SLURM_JOB_GPUS
+  elif [ -z "$FPGA_DEVICES" ] && [ -n "$SLURM_JOB_ID" ]; then
+    # e.g. GRES=fpga:u280:2(IDX:0,2)
+    indices=$(scontrol show job -d $SLURM_JOB_ID 2> /dev/null | grep -oE 'fpga[^ ]*\(IDX:[0-9,-]+\)' | head -n 1 | sed -E 's/.*IDX:([0-9,-]+)\)/\1/')
+  fi
+
+  DEVICES=()
+  if [ -n "$FPGA_DEVICES" ]; then
+    for bdf in ${FPGA_DEVICES//,/ }; do
+      if [[ " ${all[*]} " != *" $bdf "* ]]; then
+        echo "FPGA $bdf of FPGA_DEVICES is not on this node (found ${all[*]})"
+        exit 1
+      fi
+      DEVICES+=($bdf)
+    done
+  elif [ -n "$indices" ]; then
+    for index in $(expand_indices $indices); do
+      if [ $index -ge ${#all[@]} ]; then
+        echo "SLURM allocated FPGA $index, but xbutil examine found only ${#all[@]}"
+        exit 1
+      fi
+      DEVICES+=(${all[$index]})
+    done
+  else
+    echo "WARNING: Could not find out which FPGAs were allocated to this job. Using all FPGAs of the node, set FPGA_DEVICES to choose"
+    DEVICES=("${all[@]}")
+  fi
+  echo "Using ${#DEVICES[@]} of ${#all[@]} FPGAs: ${DEVICES[*]}"
+}
+
+reset_devices() {
+  for bdf in "${DEVICES[@]}"; do
+    xbutil reset -d $bdf --force &
+  done
+  wait
+  sleep 2s
+}
@@ -0,0 +1,283 @@
+# Helper for running one FINN driver per FPGA. Used by the driver run scripts
+#   run <device-bdf> <driver-dir> <work-dir> [driver.py arguments]     Run the Python driver on the FPGA with this PCIe address
+#   stream <device-bdf> <driver-dir> <work-dir> <input.npy> <batch-size> <shard>/<shards> [<labels.npy>]
+#                                                                      Stream a shard of a dataset through the given FPGA
+#   split <input.npy> <shards> <out-dir>                               Split a dataset into one shard per FPGA
+#   merge <output.npy> <shard outputs...>                              Join the outputs of the shards again
+#   cppconfig <cppdconfig.json> <out.json> <device-bdf>                C++ driver configuration for the given FPGA
+#   summary <work-dirs or C++ driver logs...>                          Per FPGA and aggregate throughput
+
+
+import sys
+import os
+import re
+import ast
+import json
+import time
+import runpy
+import subprocess
+
+
+BDF_PATTERN = r"^\s*\[([0-9a-fA-F]{4}:[0-9a-fA-F]{2}:[0-9a-fA-F]{2}\.[0-9])\]"
+
+
+def xrt_devices() -> list[str]:
+    """PCIe addresses of all FPGAs of the node. xbutil examine lists them in the order of their XRT device index"""
+    output = subprocess.run(["xbutil", "examine"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    return re.findall(BDF_PATTERN, output, re.MULTILINE)
+
+
+def xrt_index(bdf: str, devices: list[str]) -> int:
+    if bdf not in devices:
+        print(f"ERROR: xbutil examine does not list an FPGA at {bdf} (found {', '.join(devices)})")
+        sys.exit(1)
+    return devices.index(bdf)
+
+
+def select_device(bdf: str):
+    """Make the FPGA with the given PCIe address the active pynq device, which the Overlay in driver.py uses"""
+    import pynq
+    devices = xrt_devices()
+    index = xrt_index(bdf, devices)
+    # pynq numbers the devices the way XRT does. If it sees a different set of FPGAs, the index cannot be trusted
+    if len(pynq.Device.devices) != len(devices):
+        print(f"ERROR: pynq sees {len(pynq.Device.devices)} FPGAs, but xbutil examine lists {len(devices)}. Cannot find the FPGA at {bdf}")
+        sys.exit(1)
+    pynq.Device.active_device = pynq.Device.devices[index]
+    print(f"Using the FPGA at {bdf} (XRT device {index})")
+
+
+def run(bdf: str, driver_dir: str, work_dir: str, args: list[str]):
+    import numpy as np
+    select_device(bdf)
+    if "--inputfile" in args and "--batchsize" not in args:
+        samples = np.load(args[args.index("--inputfile") + 1], mmap_mode="r").shape[0]
+        args = args + ["--batchsize", str(samples)]
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    sys.path.insert(0, driver_dir)
+    sys.argv = [os.path.join(driver_dir, "driver.py")] + args
+    start = time.time()
+    runpy.run_path(sys.argv[0], run_name="__main__")
+    if "--inputfile" in args:
+        with open("run_metrics.txt", 'w+') as f:
+            f.write(str({"samples": int(args[args.index("--batchsize") + 1]), "runtime[s]": time.time() - start}))
+
+
+def stream(bdf: str, driver_dir: str, work_dir: str, input_file: str, batch_size: int, shard: int, shards: int, labels_file: str | None):
+    """Run the rows of a shard of the dataset through the accelerator in batches. The next batch is packed and the previous
+    one unpacked and written out on the host while the FPGA runs the current one"""
+    import threading
+    import queue
+    import numpy as np
+    select_device(bdf)
+    sys.path.insert(0, driver_dir)
+    # Only the definitions of driver.py, its command line interface is not run
+    driver = runpy.run_path(os.path.join(driver_dir, "driver.py"))
+    accel = driver["FINNExampleOverlay"](
+        bitfile_name=os.path.join(driver_dir, "..", "bitfile", "finn-accel.xclbin"), platform="alveo", io_shape_dict=driver["io_shape_dict"],
+        batch_size=batch_size, runtime_weight_dir=os.path.join(driver_dir, "runtime_weights", "")
+    )
+
+    data = np.load(input_file, mmap_mode="r")
+    labels = np.load(labels_file, mmap_mode="r") if labels_file is not None else None
+    start, end = data.shape[0] * shard // shards, data.shape[0] * (shard + 1) // shards
+    os.makedirs(work_dir, exist_ok=True)
+    output_shape = (end - start,) + tuple(driver["io_shape_dict"]["oshape_normal"][0][1:])
+    output = None
+
+    # Two batches in flight on either side of the FPGA
+    packed: queue.Queue = queue.Queue(maxsize=2)
+    executed: queue.Queue = queue.Queue(maxsize=2)
+    times = {"pack": 0.0, "device": 0.0, "unpack": 0.0}
+    correct = 0
+    errors = []
+    stop = threading.Event()
+
+    def pack():
+        try:
+            for begin in range(start, end, batch_size):
+                if stop.is_set():
+                    break
+                t = time.time()
+                batch = np.asarray(data[begin:min(begin + batch_size, end)])
+                count = batch.shape[0]
+                # The buffers on the FPGA have a fixed batch size
+                if count < batch_size:
+                    batch = np.concatenate([batch, np.zeros((batch_size - count,) + batch.shape[1:], dtype=batch.dtype)])
+                ibuf = accel.pack_input(accel.fold_input(batch))
+                times["pack"] += time.time() - t
+                packed.put((begin, count, ibuf))
+        except BaseException as e:
+            errors.append(e)
+        packed.put(None)
+
+    def unpack():
+        nonlocal output, correct
+        try:
+            while (item := executed.get()) is not None:
+                begin, count, obuf = item
+                t = time.time()
+                result = accel.unfold_output(accel.unpack_output(obuf))[:count]
+                # Written batch by batch, so the outputs of an interrupted run are kept up to there
+                if output is None:
+                    output = np.lib.format.open_memmap(os.path.join(work_dir, "output.npy"), mode="w+", dtype=result.dtype, shape=output_shape)
+                output[begin - start:begin - start + count] = result
+                output.flush()
+                if labels is not None:
+                    # Either the class index (e.g. after a TopK node) or one score per class
+                    predicted = result.reshape(count, -1)
+                    predicted = predicted[:, 0] if predicted.shape[1] == 1 else predicted.argmax(axis=1)
+                    expected = np.asarray(labels[begin:begin + count]).reshape(count, -1)
+                    expected = expected[:, 0] if expected.shape[1] == 1 else expected.argmax(axis=1)
+                    correct += int((predicted == expected).sum())
+                times["unpack"] += time.time() - t
+        except BaseException as e:
+            errors.append(e)
+            # Keeps the device loop from blocking on a full queue
+            while executed.get() is not None:
+                pass
+
+    wall_start = time.time()
+    threads = [threading.Thread(target=pack), threading.Thread(target=unpack)]
+    for thread in threads:
+        thread.start()
+    drained = False
+    try:
+        while (item := packed.get()) is not None:
+            begin, count, ibuf = item
+            t = time.time()
+            accel.copy_input_data_to_device(ibuf)
+            accel.execute_on_buffers()
+            obuf = np.empty_like(accel.obuf_packed_device[0])
+            accel.copy_output_data_from_device(obuf)
+            times["device"] += time.time() - t
+            executed.put((begin, count, obuf))
+        drained = True
+    finally:
+        # Also when the FPGA fails, so that both threads end instead of blocking on their queues forever
+        stop.set()
+        while not drained:
+            drained = packed.get() is None
+        executed.put(None)
+        for thread in threads:
+            thread.join()
+    wall = time.time() - wall_start
+    if len(errors) > 0:
+        raise errors[0]
+    if output is None:
+        np.save(os.path.join(work_dir, "output.npy"), np.zeros(output_shape, dtype=np.float32))
+
+    samples = end - start
+    metrics = {
+        "samples": samples, "batch_size": batch_size, "runtime[s]": wall, "throughput[images/s]": samples / wall if wall > 0 else 0.0,
+        "host_pack[s]": times["pack"], "device[s]": times["device"], "host_unpack[s]": times["unpack"],
+        "device_throughput[images/s]": samples / times["device"] if times["device"] > 0 else 0.0,
+        "labelled": samples if labels is not None else 0, "correct": correct,
+    }
+    with open(os.path.join(work_dir, "stream_metrics.json"), 'w+') as f:
+        json.dump(metrics, f, indent=2)
+    print(f"Streamed {samples} samples in batches of {batch_size}: {metrics['throughput[images/s]']:.1f} samples/s end to end, "
+          f"{metrics['device_throughput[images/s]']:.1f} samples/s on the FPGA")
+    print(f"Host packing {times['pack']:.2f}s, FPGA {times['device']:.2f}s, host unpacking {times['unpack']:.2f}s of {wall:.2f}s")
+    if labels is not None:
+        print(f"Accuracy: {correct / samples if samples > 0 else 0.0:.4f} ({correct} of {samples})")
+
+
+def split(input_file: str, shards: int, out_dir: str):
+    import numpy as np
+    data = np.load(input_file, mmap_mode="r")
+    os.makedirs(out_dir, exist_ok=True)
+    for index, shard in enumerate(np.array_split(np.arange(data.shape[0]), shards)):
+        np.save(os.path.join(out_dir, f"shard_{index}.npy"), data[shard[0]:shard[-1] + 1] if len(shard) > 0 else data[0:0])
+
+
+def merge(output_file: str, shard_outputs: list[str]):
+    import numpy as np
+    # Shard by shard through memory maps, so that the outputs do not have to fit into memory at once
+    shards = [np.load(f, mmap_mode="r") for f in shard_outputs]
+    output = np.lib.format.open_memmap(output_file, mode="w+", dtype=shards[0].dtype, shape=(sum(s.shape[0] for s in shards),) + shards[0].shape[1:])
+    offset = 0
+    for shard in shards:
+        output[offset:offset + shard.shape[0]] = shard
+        offset += shard.shape[0]
+    output.flush()
+
+
+def cppconfig(config_file: str, out_file: str, bdf: str):
+    index = xrt_index(bdf, xrt_devices())
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    found = False
+    for device in config if type(config) == list else [config]:
+        if "xrtDeviceIndex" in device.keys():
+            device["xrtDeviceIndex"] = index
+            found = True
+    if not found:
+        print(f"WARNING: {config_file} has no xrtDeviceIndex, the driver will use the default FPGA")
+    with open(out_file, 'w+') as f:
+        json.dump(config, f, indent=4)
+
+
+def throughput(path: str) -> float | None:
+    if os.path.isdir(path):
+        if os.path.isfile(os.path.join(path, "stream_metrics.json")):
+            with open(os.path.join(path, "stream_metrics.json"), 'r') as f:
+                return json.load(f)["throughput[images/s]"]
+        if os.path.isfile(os.path.join(path, "nw_metrics.txt")):
+            with open(os.path.join(path, "nw_metrics.txt"), 'r') as f:
+                return ast.literal_eval(f.read())["throughput[images/s]"]
+        if os.path.isfile(os.path.join(path, "run_metrics.txt")):
+            with open(os.path.join(path, "run_metrics.txt"), 'r') as f:
+                metrics = ast.literal_eval(f.read())
+            return metrics["samples"] / metrics["runtime[s]"]
+        return None
+    with open(path, 'r') as f:
+        for line in f:
+            if "throughput" in line.lower():
+                numbers = re.findall(r"[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?", line)
+                if len(numbers) > 0:
+                    return float(numbers[-1])
+    return None
+
+
+def summary(paths: list[str]):
+    total = 0.0
+    streamed = []
+    for index, path in enumerate(paths):
+        value = throughput(path)
+        print(f"FPGA {index}: " + (f"{value:.1f} samples/s" if value is not None else "no result") + f" ({path})")
+        total += value or 0.0
+        if os.path.isfile(os.path.join(path, "stream_metrics.json")):
+            with open(os.path.join(path, "stream_metrics.json"), 'r') as f:
+                streamed.append(json.load(f))
+    print(f"Aggregate: {total:.1f} samples/s over {len(paths)} FPGAs")
+    if len(streamed) > 0:
+        host = sum(m["host_pack[s]"] + m["host_unpack[s]"] for m in streamed)
+        device = sum(m["device[s]"] for m in streamed)
+        # Packing and unpacking run next to the FPGA, so the slowest of the three stages limits the throughput
+        slowest = max(["host_pack[s]", "device[s]", "host_unpack[s]"], key=lambda stage: sum(m[stage] for m in streamed))
+        print(f"Host {host:.2f}s, FPGA {device:.2f}s in total. " + ("The FPGA" if slowest == "device[s]" else "The host data path") + " is the bottleneck")
+        labelled = sum(m["labelled"] for m in streamed)
+        if labelled > 0:
+            print(f"Accuracy: {sum(m['correct'] for m in streamed) / labelled:.4f} over {labelled} samples")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == "run":
+        run(sys.argv[2], os.path.abspath(sys.argv[3]), os.path.abspath(sys.argv[4]), sys.argv[5:])
+    elif command == "stream":
+        shard, shards = sys.argv[7].split("/")
+        stream(sys.argv[2], os.path.abspath(sys.argv[3]), os.path.abspath(sys.argv[4]), os.path.abspath(sys.argv[5]), int(sys.argv[6]), int(shard), int(shards), sys.argv[8] if len(sys.argv) > 8 else None)
+    elif command == "split":
+        split(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    elif command == "merge":
+        merge(sys.argv[2], sys.argv[3:])
+    elif command == "cppconfig":
+        cppconfig(sys.argv[2], sys.argv[3], sys.argv[4])
+    elif command == "summary":
+        summary(sys.argv[2:])
+    else:
+        print(f"Unknown command {command}")
+        sys.exit(1)
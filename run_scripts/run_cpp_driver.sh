@@ -5,16 +5,32 @@
 #SBATCH -o cpp-finn_out_%j.out
 #SBATCH --constraint=xilinx_u280_xrt2.14
 
+# Usage: run_cpp_driver.sh <driver-dir>. Runs the driver on every allocated FPGA in parallel
+
 ml fpga &> /dev/null
 ml xilinx/xrt/2.14 &> /dev/null
 ml lang/Python/3.10.4-GCCcore-11.3.0-bare &> /dev/null
 ml devel/Boost/1.81.0-GCC-12.2.0
 ml compiler/GCC/12.2.0
 
-xbutil examine -d 0
-xbutil reset -d 0000:a1:00.1
-sleep 2s
+# SLURM runs a copy of this script, so find the helpers relative to the submit directory
+RUN_SCRIPTS_DIR=${SLURM_SUBMIT_DIR:+$SLURM_SUBMIT_DIR/run_scripts}
+RUN_SCRIPTS_DIR=${RUN_SCRIPTS_DIR:-$(dirname $(realpath $0))}
+source $RUN_SCRIPTS_DIR/fpga_devices.sh
+
+discover_devices
+reset_devices
 
 echo "STARTING DRIVER"
 cd "$1"
-./finn --mode test --input cppdconfig.json --configpath cppdconfig.json
+for i in "${!DEVICES[@]}"; do
+  python3 $RUN_SCRIPTS_DIR/fpga_driver.py cppconfig cppdconfig.json cppdconfig_card$i.json ${DEVICES[$i]}
+  ./finn --mode test --input cppdconfig_card$i.json --configpath cppdconfig_card$i.json > card_$i.log 2>&1 &
+done
+wait
+
+for i in "${!DEVICES[@]}"; do
+  echo "=== FPGA $i (${DEVICES[$i]}) ==="
+  cat card_$i.log
+done
+python3 $RUN_SCRIPTS_DIR/fpga_driver.py summary $(for i in "${!DEVICES[@]}"; do echo "card_$i.log"; done)
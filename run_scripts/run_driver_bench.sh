@@ -0,0 +1,71 @@
+#!/bin/bash
+#SBATCH -t 0:30:00
+#SBATCH -p fpga
+#SBATCH --gres=fpga:u280:3
+#SBATCH -o driver_bench_%j.out
+#SBATCH --constraint=xilinx_u280_xrt2.14
+
+# Usage: run_driver_bench.sh <python-driver-dir> <cpp-driver-dir or -> <result-dir> <batch sizes, comma separated> <repetitions>
+# The repetitions are spread over all allocated FPGAs, one repetition per FPGA at a time
+
+module reset
+ml fpga &> /dev/null
+ml xilinx/xrt/2.14 &> /dev/null
+ml devel/Boost/1.81.0-GCC-12.2.0
+ml compiler/GCC/12.2.0
+
+# SLURM runs a copy of this script, so find the helpers relative to the submit directory
+RUN_SCRIPTS_DIR=${SLURM_SUBMIT_DIR:+$SLURM_SUBMIT_DIR/run_scripts}
+RUN_SCRIPTS_DIR=${RUN_SCRIPTS_DIR:-$(dirname $(realpath $0))}
+source $RUN_SCRIPTS_DIR/fpga_devices.sh
+
+DRIVER_DIR=$(realpath "$1")
+CPP_DRIVER_DIR=$2
+RESULT_DIR=$(realpath -m "$3")
+BATCH_SIZES=$4
+REPETITIONS=$5
+BITFILE=$(realpath "$DRIVER_DIR/../bitfile/finn-accel.xclbin")
+
+discover_devices
+reset_devices
+
+mkdir -p "$RESULT_DIR"
+for i in "${!DEVICES[@]}"; do
+  echo "$i ${DEVICES[$i]}"
+done > "$RESULT_DIR/devices.txt"
+
+echo "STARTING PYTHON DRIVER BENCHMARK"
+for bs in ${BATCH_SIZES//,/ }; do
+  for rep in $(seq 1 $REPETITIONS); do
+    card=$(((rep - 1) % ${#DEVICES[@]}))
+    (
+      work_dir="$RESULT_DIR/work_card$card"
+      rm -f "$work_dir/nw_metrics.txt"
+      python3 $RUN_SCRIPTS_DIR/fpga_driver.py run ${DEVICES[$card]} "$DRIVER_DIR" "$work_dir" --exec_mode throughput_test --bitfile "$BITFILE" --batchsize $bs
+      cp "$work_dir/nw_metrics.txt" "$RESULT_DIR/python_bs${bs}_rep${rep}_card${card}.txt"
+    ) &
+    # Start the next round once every FPGA ran one repetition
+    if [ $card -eq $((${#DEVICES[@]} - 1)) ]; then
+      wait
+    fi
+  done
+  wait
+done
+rm -rf "$RESULT_DIR"/work_card*
+
+if [ "$CPP_DRIVER_DIR" != "-" ]; then
+  echo "STARTING C++ DRIVER BENCHMARK"
+  cd "$CPP_DRIVER_DIR"
+  for i in "${!DEVICES[@]}"; do
+    python3 $RUN_SCRIPTS_DIR/fpga_driver.py cppconfig cppdconfig.json cppdconfig_card$i.json ${DEVICES[$i]}
+  done
+  for rep in $(seq 1 $REPETITIONS); do
+    card=$(((rep - 1) % ${#DEVICES[@]}))
+    ./finn --mode test --input cppdconfig_card$card.json --configpath cppdconfig_card$card.json > "$RESULT_DIR/cpp_rep${rep}_card${card}.txt" 2>&1 &
+    if [ $card -eq $((${#DEVICES[@]} - 1)) ]; then
+      wait
+    fi
+  done
+  wait
+fi
+echo "DONE"
@@ -5,6 +5,10 @@
 #SBATCH -o python_driver_run%j.out
 #SBATCH --constraint=xilinx_u280_xrt2.14
 
+# Usage: run_python_driver.sh <driver-dir> [<input.npy> <output.npy> [<batch-size> [<labels.npy>]]]
+# Without a dataset, every allocated FPGA runs the throughput test. A dataset is split into one shard per FPGA.
+# With a batch size, every FPGA streams its shard from the memory mapped input in batches of this size instead
+
 module reset
 ml fpga &> /dev/null
 ml xilinx/xrt/2.14 &> /dev/null
@@ -12,11 +16,47 @@ ml xilinx/xrt/2.14 &> /dev/null
 ml devel/Boost/1.81.0-GCC-12.2.0
 ml compiler/GCC/12.2.0
 
-xbutil examine -d 0000:a1:00.1
-xbutil reset -d 0000:a1:00.1
-sleep 2s
+# SLURM runs a copy of this script, so find the helpers relative to the submit directory
+RUN_SCRIPTS_DIR=${SLURM_SUBMIT_DIR:+$SLURM_SUBMIT_DIR/run_scripts}
+RUN_SCRIPTS_DIR=${RUN_SCRIPTS_DIR:-$(dirname $(realpath $0))}
+source $RUN_SCRIPTS_DIR/fpga_devices.sh
+
+DRIVER_DIR=$(realpath "$1")
+BITFILE=$(realpath "$DRIVER_DIR/../bitfile/finn-accel.xclbin")
+RUN_DIR=$DRIVER_DIR/runs/${SLURM_JOB_ID:-$(date +%Y%m%d_%H%M%S)}
+
+discover_devices
+reset_devices
 
 echo "STARTING DRIVER"
-cd "$1"
-python3 driver.py --exec_mode throughput_test --bitfile ../bitfile/finn-accel.xclbin --batchsize 10000
-cat nw_metrics.txt
+if [ -n "$4" ]; then
+  mkdir -p "$RUN_DIR"
+  for i in "${!DEVICES[@]}"; do
+    python3 $RUN_SCRIPTS_DIR/fpga_driver.py stream ${DEVICES[$i]} "$DRIVER_DIR" "$RUN_DIR/card_$i" "$(realpath "$2")" $4 $i/${#DEVICES[@]} \
+      ${5:+"$(realpath "$5")"} > "$RUN_DIR/card_$i.log" 2>&1 &
+  done
+elif [ -n "$2" ]; then
+  python3 $RUN_SCRIPTS_DIR/fpga_driver.py split "$(realpath "$2")" ${#DEVICES[@]} "$RUN_DIR"
+  for i in "${!DEVICES[@]}"; do
+    python3 $RUN_SCRIPTS_DIR/fpga_driver.py run ${DEVICES[$i]} "$DRIVER_DIR" "$RUN_DIR/card_$i" --exec_mode execute --bitfile "$BITFILE" \
+      --inputfile "$RUN_DIR/shard_$i.npy" --outputfile "$RUN_DIR/card_$i/output.npy" > "$RUN_DIR/card_$i.log" 2>&1 &
+  done
+else
+  for i in "${!DEVICES[@]}"; do
+    mkdir -p "$RUN_DIR/card_$i"
+    python3 $RUN_SCRIPTS_DIR/fpga_driver.py run ${DEVICES[$i]} "$DRIVER_DIR" "$RUN_DIR/card_$i" --exec_mode throughput_test --bitfile "$BITFILE" \
+      --batchsize 10000 > "$RUN_DIR/card_$i.log" 2>&1 &
+  done
+fi
+wait
+
+for i in "${!DEVICES[@]}"; do
+  echo "=== FPGA $i (${DEVICES[$i]}) ==="
+  cat "$RUN_DIR/card_$i.log"
+  [ -f "$RUN_DIR/card_$i/nw_metrics.txt" ] && cat "$RUN_DIR/card_$i/nw_metrics.txt" && echo
+done
+if [ -n "$2" ]; then
+  python3 $RUN_SCRIPTS_DIR/fpga_driver.py merge "$3" $(for i in "${!DEVICES[@]}"; do echo "$RUN_DIR/card_$i/output.npy"; done) || exit 1
+  echo "Output written to $3"
+fi
+python3 $RUN_SCRIPTS_DIR/fpga_driver.py summary $(for i in "${!DEVICES[@]}"; do echo "$RUN_DIR/card_$i"; done)
@@ -0,0 +1,74 @@
+# End to end tests of the local stand-in for SLURM that doit uses in the normal environment
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from finn_on_n2 import common, config, jobs
+
+
+TIMEOUT = 30
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("BUILD_FLOW_STOP_STEP", raising=False)
+    monkeypatch.setattr(config, "_settings", SimpleNamespace(job_scheduler="local", job_exec_prefix="bash", worker_dir=str(tmp_path / ".workers")))
+    os.makedirs("net")
+    # Every job appends its name to order.txt, so that the tests can see what ran and in which order
+    for name, code in [("ok", 0), ("fail", 1)]:
+        with open(f"{name}.sh", 'w+') as f:
+            f.write(f"sleep 0.5\necho $1 >> {tmp_path / 'order.txt'}\nexit {code}\n")
+    return "net"
+
+
+def wait_until_done(scheduler, job_ids: list[str]) -> dict[str, str]:
+    start = time.time()
+    while time.time() - start < TIMEOUT:
+        states = asyncio.run(scheduler.poll(job_ids))
+        if all(s not in jobs.ACTIVE_STATES for s in states.values()):
+            return states
+        time.sleep(0.2)
+    pytest.fail(f"Local jobs did not finish within {TIMEOUT}s: {states}")
+
+
+def executed() -> list[str]:
+    return (common.read_from_file("order.txt") or "").split()
+
+
+def test_submit_records_and_completes(project):
+    job_id = jobs.submit_job(project, "build", ["ok.sh", "first"])
+    assert job_id == "local-1"
+    assert [j["id"] for j in jobs.read_jobs(project)] == [job_id]
+    assert wait_until_done(jobs.get_scheduler(), [job_id]) == {job_id: "COMPLETED"}
+    assert executed() == ["first"]
+    assert os.path.isfile(jobs.get_scheduler().log_file("ok.sh", job_id))
+
+
+def test_dependency_runs_after_its_job(project):
+    first = jobs.submit_job(project, "build", ["ok.sh", "first"])
+    second = jobs.submit_job(project, "benchmark", ["ok.sh", "second"], after=[first])
+    assert wait_until_done(jobs.get_scheduler(), [first, second]) == {first: "COMPLETED", second: "COMPLETED"}
+    assert executed() == ["first", "second"]
+
+
+def test_failure_cancels_dependent_jobs(project):
+    first = jobs.submit_job(project, "build", ["fail.sh", "first"])
+    second = jobs.submit_job(project, "benchmark", ["ok.sh", "second"], after=[first])
+    assert wait_until_done(jobs.get_scheduler(), [first, second]) == {first: "FAILED", second: "CANCELLED"}
+    assert executed() == ["first"]
+
+
+def test_env_only_for_the_job(project, tmp_path):
+    with open("env.sh", 'w+') as f:
+        f.write(f"echo ${{BUILD_FLOW_STOP_STEP:-unset}} >> {tmp_path / 'order.txt'}\n")
+    first = jobs.submit_job(project, "estimate", ["env.sh"], env={"BUILD_FLOW_STOP_STEP": "step_generate_estimate_reports"})
+    second = jobs.submit_job(project, "build", ["env.sh"])
+    assert wait_until_done(jobs.get_scheduler(), [first, second]) == {first: "COMPLETED", second: "COMPLETED"}
+    assert executed() == ["step_generate_estimate_reports", "unset"]
+    assert "BUILD_FLOW_STOP_STEP" not in os.environ